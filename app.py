@@ -24,6 +24,7 @@ from blueprints.paypal import paypal_bp
 from geoip_utils.geoip_bp import geoip_bp
 from blueprints.login import login_bp
 from blueprints.eth import eth_bp
+from blueprints.jobs import jobs_bp
 
 load_dotenv()
 
@@ -73,7 +74,8 @@ def create_app():
         socialauth_bp,
         paypal_bp,
         login_bp,
-        eth_bp
+        eth_bp,
+        jobs_bp
     ]
     for bp in blueprints:
         app.register_blueprint(bp)
@@ -0,0 +1 @@
+# 性能基准脚本：在项目根目录以 python -m benchmarks.<name> 运行
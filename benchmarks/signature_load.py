@@ -0,0 +1,84 @@
+"""
+/api/withdraw/signature 并发压测：多个线程同时为同一笔（或多笔）pending 提现请求签名，
+统计各状态码数量、吞吐与延迟分位数，并检查成功响应的一致性
+
+    python -m benchmarks.signature_load <服务地址> <钱包地址:提现id> [<钱包地址:提现id> ...]
+        [--concurrency 50] [--requests 1000]
+
+例：python -m benchmarks.signature_load http://127.0.0.1:5000 0xabc...:42
+需要运行中的服务与测试库中 pending 的提现记录（签名不扣积分，可重复压测）；
+同一钱包的并发请求争用 version 乐观锁，成功应为 200、竞争失败为 409，不应出现 5xx
+"""
+import argparse
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def percentile(durations, fraction):
+    return durations[min(len(durations) - 1, int(len(durations) * fraction))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base_url')
+    parser.add_argument('targets', nargs='+', help='钱包地址:提现id')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=1000)
+    args = parser.parse_args()
+
+    targets = []
+    for target in args.targets:
+        wallet_address, withdrawal_id = target.rsplit(':', 1)
+        targets.append({'walletAddress': wallet_address, 'withdrawalId': int(withdrawal_id)})
+    url = args.base_url.rstrip('/') + '/api/withdraw/signature'
+
+    session = requests.Session()
+    session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=args.concurrency))
+    session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=args.concurrency))
+
+    lock = threading.Lock()
+    durations = []
+    statuses = Counter()
+    # 钱包 -> 成功返回的 (nonce, chain_nonce)，压测期间没有链上提现，应只有一种
+    nonces = defaultdict(set)
+
+    def request(index):
+        payload = targets[index % len(targets)]
+        start = time.perf_counter()
+        try:
+            response = session.post(url, json=payload, timeout=30)
+            status = response.status_code
+            body = response.json() if response.headers.get('Content-Type', '').startswith('application/json') else {}
+        except requests.RequestException as e:
+            status, body = type(e).__name__, {}
+        elapsed = time.perf_counter() - start
+        with lock:
+            durations.append(elapsed)
+            statuses[status] += 1
+            if status == 200 and body.get('success'):
+                nonces[payload['walletAddress']].add((body.get('nonce'), body.get('chain_nonce')))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(request, range(args.requests)))
+    total = time.perf_counter() - start
+
+    durations.sort()
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {len(targets)} withdrawals")
+    print(f"throughput {args.requests / total:.1f} req/s   p50 {percentile(durations, 0.5):.1f} ms   "
+          f"p95 {percentile(durations, 0.95):.1f} ms   p99 {percentile(durations, 0.99):.1f} ms")
+    print("status:", ', '.join(f"{status}={count}" for status, count in sorted(statuses.items(), key=str)))
+    for wallet_address, seen in nonces.items():
+        if len(seen) > 1:
+            print(f"[WARN] {wallet_address} received different nonces: {sorted(seen, key=str)}")
+    errors = sum(count for status, count in statuses.items() if not isinstance(status, int) or status >= 500)
+    if errors:
+        print(f"[WARN] {errors} requests failed with server / connection errors")
+
+
+if __name__ == '__main__':
+    main()
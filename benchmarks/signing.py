@@ -0,0 +1,71 @@
+"""
+提现签名基准：对比逐次派生密钥 + 每次恢复校验（原实现）、LocalAccount.sign_message（每次重建 PrivateKey）
+与 WithdrawalSigner（缓存 PrivateKey，抽样校验）的单次签名耗时
+
+    python -m benchmarks.signing [次数]
+"""
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+from eth_account import Account
+
+# 未配置时用随机私钥（blockchain_sign 导入时要求该变量存在）
+os.environ.setdefault('COMMUNITY_PRIVATE_KEY', Account.create().key.hex())
+
+from utils.blockchain_sign import PRIVATE_KEY, WithdrawalSigner, build_withdrawal_message
+
+
+def legacy_sign(wallet_address, amount_points, nonce):
+    """原 sign_withdrawal：每次派生地址、签名并完整恢复校验"""
+    signer_address = Account.from_key(PRIVATE_KEY).address
+    message = build_withdrawal_message(wallet_address, amount_points, nonce)
+    signature = Account.sign_message(message, private_key=PRIVATE_KEY).signature
+    if Account.recover_message(message, signature=signature) != signer_address:
+        raise ValueError("signature mismatch")
+    return signature.hex()
+
+
+def local_account_sign(account):
+    def sign(wallet_address, amount_points, nonce):
+        return account.sign_message(build_withdrawal_message(wallet_address, amount_points, nonce)).signature.hex()
+    return sign
+
+
+def measure(name, sign, withdrawals):
+    durations = []
+    for wallet_address, amount, nonce in withdrawals:
+        start = time.perf_counter()
+        sign(wallet_address, amount, nonce)
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+    mean = sum(durations) / len(durations) * 1000
+    p99 = durations[int(len(durations) * 0.99) - 1] * 1000
+    print(f"{name:<36} mean {mean:6.2f} ms   p99 {p99:6.2f} ms")
+    return mean
+
+
+def main(count=500):
+    withdrawals = [
+        ('0x' + os.urandom(20).hex(), Decimal(random.randint(1, 10 ** 6)) / 100, nonce)
+        for nonce in range(count)
+    ]
+    signer = WithdrawalSigner(PRIVATE_KEY)
+    # 同一输入三种实现的签名必须一致（ECDSA 采用 RFC 6979 确定性随机数）
+    sample = withdrawals[0]
+    assert legacy_sign(*sample) == signer.sign(*sample) == local_account_sign(signer.account)(*sample)
+
+    print(f"{count} withdrawal signatures")
+    legacy = measure('per-call derive + recover (legacy)', legacy_sign, withdrawals)
+    measure('LocalAccount.sign_message', local_account_sign(signer.account), withdrawals)
+    cached = measure(f'WithdrawalSigner (verify {signer.verify_sample_rate:.0%})', signer.sign, withdrawals)
+    start = time.perf_counter()
+    signer.sign_many(withdrawals)
+    batch = (time.perf_counter() - start) / count * 1000
+    print(f"{'WithdrawalSigner.sign_many':<36} mean {batch:6.2f} ms")
+    print(f"speedup vs legacy: {legacy / cached:.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,130 @@
+"""
+提现任务数据库语句数基准：对比原实现（逐条取收款地址、成功后逐条置 completed）
+与联表领取 + 整批单条 UPDATE（process_withdrawals / on_withdraw_batch_receipt）在不同条数下的 SQL 条数与耗时
+
+    python -m benchmarks.withdraw_queries [条数 ...]
+
+默认使用内存 SQLite，BENCH_DATABASE_URI 可指向 MySQL 测试库（相关表会被清空重建）；
+链上广播替换为立即返回的交易（不访问节点），只统计数据库语句
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from eth_account import Account
+
+# blueprints.withdraw / extensions 导入时要求的配置（Redis 为惰性连接，本基准不访问）
+os.environ.setdefault('WEB3_PROVIDER', 'http://127.0.0.1:8545')
+os.environ.setdefault('WITHDRAW_CONTRACT_ADDRESS', '0x' + '11' * 20)
+os.environ.setdefault('REDIS_URL', 'redis://127.0.0.1:6379/0')
+os.environ.setdefault('COMMUNITY_PRIVATE_KEY', Account.create().key.hex())
+os.environ.setdefault('DEV_PRIVATE_KEY', Account.create().key.hex())
+
+from flask import Flask
+from sqlalchemy import event, insert
+from extensions import db
+from models import WalletUser, WithdrawalHistory, TrackedTransaction
+from utils.tx_executor import PendingTx
+import blueprints.withdraw as withdraw
+
+LEGACY_BATCH_SIZE = 20
+TX_RECIPIENTS = 200
+
+TABLES = [WalletUser.__table__, WithdrawalHistory.__table__, TrackedTransaction.__table__]
+
+
+def create_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('BENCH_DATABASE_URI', 'sqlite://')
+    db.init_app(app)
+    return app
+
+
+def seed(count):
+    db.metadata.drop_all(db.engine, tables=TABLES)
+    db.metadata.create_all(db.engine, tables=TABLES)
+    start = datetime.now(timezone.utc) - timedelta(days=1)
+    db.session.execute(insert(WalletUser), [
+        {'id': i, 'wallet_address': '0x' + os.urandom(20).hex()} for i in range(1, count + 1)
+    ])
+    db.session.execute(insert(WithdrawalHistory), [
+        {'wallet_user_id': i, 'amount': 100 + i, 'status': 'pending', 'requested_at': start + timedelta(seconds=i)}
+        for i in range(1, count + 1)
+    ])
+    db.session.commit()
+
+
+@contextmanager
+def count_statements():
+    counter = {'statements': 0}
+
+    def before_cursor_execute(*args):
+        counter['statements'] += 1
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    start = time.perf_counter()
+    try:
+        yield counter
+    finally:
+        counter['ms'] = (time.perf_counter() - start) * 1000
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def legacy_process():
+    """原 process_withdrawals：每批逐条 WalletUser.query.get，上链成功后逐条取记录置 completed"""
+    pending = WithdrawalHistory.query.filter_by(status='pending').order_by(
+        WithdrawalHistory.requested_at.asc()
+    ).limit(1000).all()
+    for i in range(0, len(pending), LEGACY_BATCH_SIZE):
+        batch = pending[i:i + LEGACY_BATCH_SIZE]
+        withdrawal_ids = [wd.id for wd in batch if WalletUser.query.get(wd.wallet_user_id)]
+        for withdrawal_id in withdrawal_ids:
+            WithdrawalHistory.query.get(withdrawal_id).status = 'completed'
+        db.session.commit()
+
+
+def fake_submit(recipients, amounts, executor=None):
+    """按 TX_RECIPIENTS 切分并立即返回已广播的交易"""
+    account = Account.create()
+    return [
+        (list(range(i, min(i + TX_RECIPIENTS, len(recipients)))),
+         PendingTx(account, {'nonce': nonce, 'maxFeePerGas': 1, 'maxPriorityFeePerGas': 1}, os.urandom(32)))
+        for nonce, i in enumerate(range(0, len(recipients), TX_RECIPIENTS))
+    ]
+
+
+def complete_tracked(tracked):
+    """回执追踪服务的处理：每笔交易一次处理函数调用（成功回执）"""
+    for entity_ids in tracked:
+        withdraw.on_withdraw_batch_receipt(entity_ids, {'status': 1, 'blockNumber': 1})
+        db.session.commit()
+
+
+def main(counts):
+    app = create_app()
+    withdraw.submit_batch_withdraw = fake_submit
+    print(f"{'withdrawals':>11}  {'legacy':>16}  {'claim + track':>16}  {'completion':>16}")
+    with app.app_context():
+        for count in counts:
+            seed(count)
+            with count_statements() as legacy:
+                legacy_process()
+
+            seed(count)
+            with count_statements() as claim:
+                withdraw.process_withdrawals()
+            # 待确认记录由追踪服务每轮查询一次，不计入单笔交易的完成开销
+            tracked = [t.entity_ids for t in TrackedTransaction.query.filter_by(kind='withdraw_batch').all()]
+            with count_statements() as completion:
+                complete_tracked(tracked)
+            completed = WithdrawalHistory.query.filter_by(status='completed').count()
+            assert completed == min(count, 1000), completed
+
+            print(f"{count:>11}  {legacy['statements']:>5} stmts {legacy['ms']:>5.0f}ms  "
+                  f"{claim['statements']:>5} stmts {claim['ms']:>5.0f}ms  "
+                  f"{completion['statements']:>5} stmts {completion['ms']:>5.0f}ms  ({len(tracked)} txs)")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [20, 200, 1000])
@@ -1,14 +1,46 @@
 from decimal import Decimal
-from flask import Blueprint, request, jsonify
-from models import AirdropAddress, AirdropConfig,UserPointsAccount,PointsHistory, WalletUser
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from models import AirdropAddress, AirdropConfig
 from extensions import db
 from datetime import datetime, timezone
-from utils.blockchain_batch_airdrop import blockchain_batch_airdrop
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
 from utils.auth_utils import jwt_required
+from utils.job_metrics import add_rows
+from utils.weight_dirty import mark_weight_dirty
+from utils.receipt_tracker import receipt_handler
+from utils.points_distribution import grant_airdrop_points
+from utils.airdrop_drain import claim_pending_addresses, submit_airdrop_rows, load_progress
+from utils.airdrop_membership import check_membership, add_submitted, add_distributed
+from utils.airdrop_import import import_addresses
+import csv
+import io
+import json
+import os
 import re
 
 airdrop_bp = Blueprint('airdrop', __name__, url_prefix='/api/airdrop')
 
+# 积分空投每个事务处理的地址数
+POINTS_DISTRIBUTION_CHUNK_SIZE = int(os.getenv('POINTS_DISTRIBUTION_CHUNK_SIZE', 1000))
+
+# 地址列表分页与流式导出
+ADDRESS_PAGE_SIZE = 100
+ADDRESS_PAGE_MAX = 1000
+ADDRESS_EXPORT_BATCH = int(os.getenv('ADDRESS_EXPORT_BATCH', 1000))
+ADDRESS_EXPORT_FIELDS = ['id', 'address', 'comment', 'submitted_at', 'is_distributed', 'distributed_at']
+ADDRESS_COLUMNS = [
+    AirdropAddress.id,
+    AirdropAddress.address,
+    AirdropAddress.comment,
+    AirdropAddress.submitted_at,
+    AirdropAddress.is_distributed,
+    AirdropAddress.distributed_at
+]
+
+# 批量导入：文件扩展名 -> 格式
+IMPORT_FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
 
 # 🟢 用户提交地址接口
 @airdrop_bp.route('/collect_address', methods=['POST'])
@@ -21,9 +53,11 @@ def collect_address():
     if not address or not re.match(r'^0x[a-fA-F0-9]{40}$', address):
         return jsonify({'success': False, 'message': 'Invalid wallet address'}), 400
 
-    # Check if the address already exists
-    existing = AirdropAddress.query.filter_by(address=address).first()
-    if existing:
+    # 成员缓存命中直接返回；缓存确认未提交时跳过查询，由唯一约束兜底并发重复提交
+    submitted, _ = check_membership(address)
+    if submitted is None:
+        submitted = AirdropAddress.query.filter_by(address=address).first() is not None
+    if submitted:
         return jsonify({'success': False, 'message': 'This address has already participated in the airdrop'}), 200
 
     try:
@@ -34,53 +68,45 @@ def collect_address():
         )
         db.session.add(new_entry)
         db.session.commit()
-        return jsonify({'success': True, 'message': 'Address submitted successfully'}), 200
+    except IntegrityError:
+        db.session.rollback()
+        add_submitted(address)
+        return jsonify({'success': False, 'message': 'This address has already participated in the airdrop'}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': f'Submission failed: {str(e)}'}), 500
 
+    add_submitted(address)
+    return jsonify({'success': True, 'message': 'Address submitted successfully'}), 200
+
 
-def distribute_points_to_users(addresses, base_reward):
+def distribute_points_to_users(addresses, base_reward, chunk_size=POINTS_DISTRIBUTION_CHUNK_SIZE):
+    """
+    批量发放空投积分：按块独立事务，块内积分入账、流水与空投地址标记全部成功或全部回滚
+    未注册钱包的地址同样标记为已发放（与逐条发放时一致）
+    领取锁在第一块提交后即释放，每块由 grant_airdrop_points 重新加锁并跳过已被其他任务发放的地址
+    :return: 已提交的地址列表，失败块留待下一轮重试
+    """
     from sqlalchemy.exc import SQLAlchemyError
     import logging
 
-    for addr in addresses:
+    distributed = []
+    for i in range(0, len(addresses), chunk_size):
+        chunk = addresses[i:i + chunk_size]
         try:
-            user = WalletUser.query.filter_by(wallet_address=addr).first()
-            if not user:
-                logging.warning(f"User not found for address: {addr}")
-                continue
-
-            points_account = (
-                UserPointsAccount.query
-                .filter_by(wallet_user_id=user.id)
-                .with_for_update()
-                .first()
-            )
-            if not points_account:
-                points_account = UserPointsAccount(wallet_user_id=user.id, total_points=Decimal('0'), consecutive_days=0)
-                db.session.add(points_account)
-                db.session.flush()
-
-            points_account.total_points = (points_account.total_points or Decimal('0')) + base_reward
-
-            points_history = PointsHistory(
-                wallet_user_id=user.id,
-                change_type="airdrop_points",
-                change_amount=base_reward,
-                created_at=datetime.now(timezone.utc),
-                description=f"Airdrop points granted: {base_reward}"
-            )
-            db.session.add(points_history)
-
+            credited_ids, granted = grant_airdrop_points(chunk, base_reward)
+            if len(credited_ids) < len(granted):
+                logging.warning(f"{len(granted) - len(credited_ids)} airdrop addresses have no wallet user")
+            db.session.commit()
         except SQLAlchemyError as e:
-            logging.error(f"Failed to distribute points to {addr}: {str(e)}")
-            db.session.rollback()  # 回滚当前事务，继续处理其他用户
-    try:
-        db.session.commit()
-    except SQLAlchemyError as e:
-        logging.error(f"Failed to commit points distribution transaction: {str(e)}")
-        db.session.rollback()
+            logging.error(f"Failed to distribute points to {len(chunk)} addresses: {str(e)}")
+            db.session.rollback()
+            continue
+
+        mark_weight_dirty(*credited_ids)
+        add_distributed(*granted)
+        distributed.extend(granted)
+    return distributed
 
 
 # Admin管理员手动发放接口
@@ -95,10 +121,12 @@ def manual_distribute():
         airdrop_amount = int(config.airdrop_amount) if config.airdrop_amount else 0
         distribution_type = config.distribution_type or "points"
 
-        # 查询待发放地址
-        pending_addresses = AirdropAddress.query.filter_by(is_distributed=False).limit(batch_size).all()
+        # 领取待发放地址（SKIP LOCKED，与 drain 任务 / 重复触发互不冲突）
+        pending_addresses = claim_pending_addresses(batch_size)
         if not pending_addresses:
+            db.session.commit()
             return jsonify({'success': False, 'message': 'No addresses to distribute.'}), 200
+        add_rows(len(pending_addresses))
 
         if distribution_type == "points":
             # 积分发放逻辑
@@ -106,27 +134,16 @@ def manual_distribute():
             # 这里假设airdrop_amount是字符串类型wei，转换成Decimal积分
             base_reward = Decimal(airdrop_amount) / Decimal(1e18)
 
-            distribute_points_to_users(addresses, base_reward)
-            for user in pending_addresses:
-                # 这里可以调用积分发放相关函数，比如发积分给 user.address
-                user.is_distributed = True
-                user.distributed_at = datetime.now(timezone.utc)
-            db.session.commit()
-            return jsonify({'success': True, 'message': f'{len(pending_addresses)} addresses distributed points successfully.'}), 200
+            distributed = distribute_points_to_users(addresses, base_reward)
+            if not distributed:
+                return jsonify({'success': False, 'message': 'Points distribution failed.'}), 500
+            return jsonify({'success': True, 'message': f'{len(distributed)}/{len(pending_addresses)} addresses distributed points successfully.'}), 200
 
         elif distribution_type == "contract":
-            # 合约发放逻辑
-            addresses = [user.address for user in pending_addresses]
-            amounts = [airdrop_amount for _ in pending_addresses]  # 统一数量
-
-            # 调用链上空投合约函数，示例调用
-            success = blockchain_batch_airdrop(addresses, amounts)
-            if success:
-                for user in pending_addresses:
-                    user.is_distributed = True
-                    user.distributed_at = datetime.now(timezone.utc)
-                db.session.commit()
-                return jsonify({'success': True, 'message': f'{len(pending_addresses)} addresses distributed tokens successfully.'}), 200
+            # 合约发放逻辑：batch_size 只限制单次处理的地址数，链上按 gas 预算自动切分交易；回执由回执追踪服务处理
+            tracked_ids = submit_airdrop_rows(pending_addresses)
+            if tracked_ids:
+                return jsonify({'success': True, 'message': f'{len(tracked_ids)}/{len(pending_addresses)} addresses submitted on chain, awaiting confirmation.'}), 200
             else:
                 return jsonify({'success': False, 'message': 'Blockchain transaction failed.'}), 500
 
@@ -137,24 +154,170 @@ def manual_distribute():
         return jsonify({'success': False, 'message': f'Distribution failed: {str(e)}'}), 500
 
 
+@receipt_handler('airdrop_batch')
+def on_airdrop_batch_receipt(address_ids, receipt):
+    """合约空投回执：成功补记发放时间；回滚或被替换的恢复为未发放，由下一轮重试"""
+    stmt = update(AirdropAddress).where(
+        AirdropAddress.id.in_(address_ids),
+        AirdropAddress.is_distributed.is_(True),
+        AirdropAddress.distributed_at.is_(None)
+    )
+    if receipt is not None and receipt['status'] == 1:
+        stmt = stmt.values(distributed_at=datetime.now(timezone.utc))
+        addresses = db.session.execute(
+            select(AirdropAddress.address).where(AirdropAddress.id.in_(address_ids))
+        ).scalars().all()
+        db.session.execute(stmt.execution_options(synchronize_session=False))
+        return lambda: add_distributed(*addresses)
+
+    db.session.execute(stmt.values(is_distributed=False).execution_options(synchronize_session=False))
+
+
+# 发放进度（管理端轮询）：待发放 / 等待上链确认 / 已发放地址数，以及 drain 任务运行状态
+@airdrop_bp.route('/progress', methods=['GET'])
+@jwt_required
+def distribution_progress():
+    try:
+        return jsonify({'success': True, 'data': load_progress()}), 200
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Failed to load progress: {str(e)}'}), 500
+
+
+# 批量导入地址（管理端）：multipart 上传 file=<csv / ndjson 文件>，格式取 format 参数或文件扩展名
+# 返回导入统计：总行数 / 新增 / 重复（文件内或表内已有）/ 无效及部分无效行样例
+@airdrop_bp.route('/import', methods=['POST'])
+@jwt_required
+def import_address_file():
+    file = request.files.get('file')
+    if file is None or not file.filename:
+        return jsonify({'success': False, 'message': 'No file uploaded'}), 400
+
+    fmt = request.form.get('format') or IMPORT_FORMATS.get(os.path.splitext(file.filename)[1].lower())
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'success': False, 'message': f'Unknown import format: {fmt or file.filename}'}), 400
+
+    try:
+        report = import_addresses(file.stream, fmt)
+        return jsonify({'success': True, 'data': report}), 200
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Import failed: {str(e)}'}), 500
+
 
 # 查询地址列表接口（含发放状态）
+# JSON 按 id 游标分页：?after_id=<上一页 next_cursor>&limit=100
+# 筛选：?is_distributed=true|false&submitted_from=<ISO 时间>&submitted_to=<ISO 时间>
+# 导出：?format=ndjson|csv，服务端游标流式输出全部匹配行
 @airdrop_bp.route('/addresses', methods=['GET'])
+@jwt_required
 def list_addresses():
+    fmt = request.args.get('format', 'json')
+    if fmt not in ('json', 'ndjson', 'csv'):
+        return jsonify({'success': False, 'message': f'Unknown format: {fmt}'}), 400
+
     try:
-        addresses = AirdropAddress.query.all()
-        result = [{
-            'address': addr.address,
-            'comment': addr.comment,
-            'submitted_at': addr.submitted_at.isoformat() if addr.submitted_at else None,
-            'is_distributed': addr.is_distributed,
-            'distributed_at': addr.distributed_at.isoformat() if addr.distributed_at else None
-        } for addr in addresses]
-        return jsonify({'success': True, 'data': result}), 200
+        conditions = address_filters(request.args)
+        after_id = request.args.get('after_id', default=0, type=int)
+        limit = max(1, min(request.args.get('limit', default=ADDRESS_PAGE_SIZE, type=int), ADDRESS_PAGE_MAX))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': f'Invalid filter: {str(e)}'}), 400
+
+    if fmt != 'json':
+        return export_addresses(conditions, fmt)
+
+    try:
+        rows = db.session.execute(
+            select(*ADDRESS_COLUMNS)
+            .where(AirdropAddress.id > after_id, *conditions)
+            .order_by(AirdropAddress.id)
+            .limit(limit + 1)
+        ).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return jsonify({
+            'success': True,
+            'data': [serialize_address(row) for row in rows],
+            'next_cursor': rows[-1].id if has_more else None
+        }), 200
     except Exception as e:
         return jsonify({'success': False, 'message': f'Query failed: {str(e)}'}), 500
 
 
+def address_filters(args):
+    """列表与导出共用的筛选条件，参数不合法时抛 ValueError"""
+    conditions = []
+    is_distributed = args.get('is_distributed')
+    if is_distributed is not None:
+        if is_distributed.lower() not in ('true', 'false', '1', '0'):
+            raise ValueError('is_distributed must be true or false')
+        conditions.append(AirdropAddress.is_distributed == (is_distributed.lower() in ('true', '1')))
+
+    submitted_from = args.get('submitted_from')
+    if submitted_from:
+        conditions.append(AirdropAddress.submitted_at >= parse_utc_datetime(submitted_from))
+    submitted_to = args.get('submitted_to')
+    if submitted_to:
+        conditions.append(AirdropAddress.submitted_at < parse_utc_datetime(submitted_to))
+    return conditions
+
+
+def parse_utc_datetime(value):
+    """ISO 8601 时间转为与库中一致的 naive UTC 时间（不带时区的按 UTC 处理）"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def serialize_address(row):
+    return {
+        'id': row.id,
+        'address': row.address,
+        'comment': row.comment,
+        'submitted_at': row.submitted_at.isoformat() if row.submitted_at else None,
+        'is_distributed': row.is_distributed,
+        'distributed_at': row.distributed_at.isoformat() if row.distributed_at else None
+    }
+
+
+def export_addresses(conditions, fmt):
+    """
+    流式导出：yield_per 使用服务端游标（PyMySQL SSCursor）按块读取，内存占用与总行数无关
+    CSV 先输出表头，首字节立即返回
+    """
+    stmt = (
+        select(*ADDRESS_COLUMNS)
+        .where(*conditions)
+        .order_by(AirdropAddress.id)
+        .execution_options(yield_per=ADDRESS_EXPORT_BATCH)
+    )
+
+    def generate():
+        if fmt == 'csv':
+            yield ','.join(ADDRESS_EXPORT_FIELDS) + '\n'
+        result = db.session.execute(stmt)
+        try:
+            for rows in result.partitions():
+                buffer = io.StringIO()
+                if fmt == 'csv':
+                    writer = csv.writer(buffer, lineterminator='\n')
+                    for row in rows:
+                        item = serialize_address(row)
+                        writer.writerow([item[field] for field in ADDRESS_EXPORT_FIELDS])
+                else:
+                    for row in rows:
+                        buffer.write(json.dumps(serialize_address(row)) + '\n')
+                yield buffer.getvalue()
+        finally:
+            result.close()
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=airdrop_addresses.{fmt}',
+        # 关闭 nginx 代理缓冲，边查边发
+        'X-Accel-Buffering': 'no'
+    })
+
+
 # Admin配置接口：控制定时任务开关和批量数量
 @airdrop_bp.route('/config', methods=['POST'])
 @jwt_required
@@ -225,6 +388,13 @@ def claim_status():
     if not address or not re.match(r'^0x[a-fA-F0-9]{40}$', address):
         return jsonify({'success': False, 'message': 'Invalid wallet address'}), 400
 
+    # 已确认发放 / 从未提交的地址由成员缓存直接回答，其余回退数据库
+    submitted, distributed = check_membership(address)
+    if distributed:
+        return jsonify({'success': True, 'data': {'is_distributed': True}}), 200
+    if submitted is False:
+        return jsonify({'success': True, 'data': {'is_distributed': False}}), 200
+
     entry = AirdropAddress.query.filter_by(address=address).first()
     if not entry:
         # 地址没提交过，默认未发放
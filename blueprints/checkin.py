@@ -1,8 +1,9 @@
 from flask import Blueprint, jsonify, request
 from datetime import datetime, timedelta, date
 from sqlalchemy.exc import SQLAlchemyError
-from models import WalletUser, CheckinHistory, UserPointsAccount,PointsHistory,MiningHistory
+from models import WalletUser, CheckinHistory, UserPointsAccount,PointsHistory,ActiveMiningSession
 from extensions import db  # 你的SQLAlchemy实例
+from utils.weight_dirty import mark_weight_dirty
 
 checkin_bp = Blueprint('checkin', __name__, url_prefix='/api/checkin')
 
@@ -29,11 +30,12 @@ def get_checkin_status():
         WalletUser.wallet_address == wallet_address
     ).first()
 
-    mining_record = MiningHistory.query.join(WalletUser).filter(
+    # 未结算的会话都在 active_mining_sessions 中（按主键关联）
+    is_mining = db.session.query(ActiveMiningSession.wallet_user_id).join(
+        WalletUser, WalletUser.id == ActiveMiningSession.wallet_user_id
+    ).filter(
         WalletUser.wallet_address == wallet_address
-    ).order_by(MiningHistory.id.desc()).first()
-
-    is_mining = mining_record.is_mining if mining_record else False
+    ).first() is not None
 
     return jsonify({
         'isSignedToday': is_signed_today,
@@ -148,7 +150,9 @@ def checkin():
                 created_at=datetime.utcnow()
             )
             db.session.add(points_history_record)
+            wallet_user_id = wallet_user.id
         db.session.commit()
+        mark_weight_dirty(wallet_user_id)
 
         return jsonify({
             'success': True,
@@ -3,6 +3,7 @@ from models import InviteRecord, WalletUser,UserPointsAccount,PointsHistory
 from extensions import db
 from datetime import datetime, timezone
 from decimal import Decimal
+from utils.weight_dirty import mark_weight_dirty
 
 invite_bp = Blueprint('invite', __name__,url_prefix='/api/referrals')
 
@@ -58,7 +59,9 @@ def bind_referral():
     db.session.add(points_history)
 
     # 提交事务
+    inviter_user_id = inviter_user.id
     db.session.commit()
+    mark_weight_dirty(inviter_user_id)
 
     return jsonify({"message": "Referral bound successfully"})
 
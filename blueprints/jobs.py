@@ -0,0 +1,36 @@
+from flask import Blueprint, request, jsonify, Response
+from utils.auth_utils import jwt_required
+from utils.job_metrics import job_names, load_runs, load_lag_totals, summarize, render_prometheus
+
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/api/admin/jobs')
+
+
+# 定时任务运行指标：默认 JSON，?format=prometheus 返回 Prometheus 文本格式
+@jobs_bp.route('/metrics', methods=['GET'])
+@jwt_required
+def job_metrics():
+    fmt = request.args.get('format', 'json')
+    try:
+        summaries = {}
+        for name in job_names():
+            summary = summarize(load_runs(name), load_lag_totals(name))
+            if summary:
+                summaries[name] = summary
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Failed to load job metrics: {str(e)}'}), 500
+
+    if fmt == 'prometheus':
+        return Response(render_prometheus(summaries), mimetype='text/plain; version=0.0.4')
+    return jsonify({'success': True, 'data': summaries}), 200
+
+
+# 单个任务最近若干次运行明细
+@jobs_bp.route('/<string:job_name>/runs', methods=['GET'])
+@jwt_required
+def job_runs(job_name):
+    limit = request.args.get('limit', default=20, type=int)
+    try:
+        runs = load_runs(job_name, max(1, min(limit, 100)))
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Failed to load job runs: {str(e)}'}), 500
+    return jsonify({'success': True, 'data': runs}), 200
@@ -2,6 +2,7 @@
 from flask import Blueprint, request, jsonify
 from models import User, UserAccount, WalletUser
 from extensions import db
+from utils.weight_dirty import mark_weight_dirty
 from datetime import datetime, timezone
 
 login_bp = Blueprint("login", __name__, url_prefix="/api/login")
@@ -151,6 +152,8 @@ def wallet_login():
 
         db.session.add(wallet_user)
         db.session.commit()
+        # 新钱包按默认权重入库，标记后由当晚增量任务计算
+        mark_weight_dirty(wallet_user.id)
         return jsonify({
             "msg": "wallet created and bound",
             "user": serialize_user(user)
@@ -2,9 +2,12 @@ from flask import Blueprint, request, jsonify
 from datetime import datetime
 from decimal import Decimal, getcontext
 from extensions import db
-from models import WalletUser, MiningHistory,UserPointsAccount,PointsHistory
+from models import WalletUser, MiningHistory,UserPointsAccount,PointsHistory,ActiveMiningSession
 from utils.mining_service import calculate_user_weight, calculate_reward
-from sqlalchemy.exc import SQLAlchemyError
+from utils.mining_expiry import schedule_expiry, cancel_expiry
+from utils.weight_dirty import mark_weight_dirty
+from utils.mining_status_cache import build_status_document, render_status, get_cached_status, cache_status, invalidate_status
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 
 mining_bp = Blueprint('mining', __name__,url_prefix='/api/mining')
 
@@ -19,10 +22,8 @@ def mining_start():
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    last = MiningHistory.query.filter_by(wallet_user_id=user.id, is_settled=False)\
-        .order_by(MiningHistory.mined_at.desc()).first()
-
-    if last and (not last.end_time or (datetime.utcnow() - last.mined_at).total_seconds() < 86400):
+    # 进行中的会话按主键查询（未结算前一直存在）
+    if db.session.get(ActiveMiningSession, user.id):
         return jsonify({"error": "Mining already in progress"}), 400
 
     # weight = user.daily_weight if hasattr(user, 'daily_weight') else calculate_user_weight(user)
@@ -47,8 +48,22 @@ def mining_start():
         mined_at=datetime.utcnow(),
         weight_snapshot=weight_value
     )
-    db.session.add(mining)
-    db.session.commit()
+    try:
+        db.session.add(mining)
+        db.session.flush()
+        db.session.add(ActiveMiningSession(
+            wallet_user_id=user.id,
+            mining_history_id=mining.id,
+            mined_at=mining.mined_at,
+            weight_snapshot=weight_value
+        ))
+        db.session.commit()
+    except IntegrityError:
+        # 并发 start：active_mining_sessions 主键冲突
+        db.session.rollback()
+        return jsonify({"error": "Mining already in progress"}), 400
+    schedule_expiry(mining.id, mining.mined_at)
+    invalidate_status(wallet_address)
 
     return jsonify({"message": "Mining started", "weight": weight})
 
@@ -63,12 +78,14 @@ def mining_stop():
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    last = MiningHistory.query.filter_by(wallet_user_id=user.id, is_settled=False)\
-        .order_by(MiningHistory.mined_at.desc()).with_for_update().first()
-
-    if not last:
+    active = ActiveMiningSession.query.filter_by(wallet_user_id=user.id).with_for_update().first()
+    if not active:
         return jsonify({"error": "No active mining session found"}), 400
 
+    mining_history_id = active.mining_history_id
+    wallet_user_id = user.id
+    last = MiningHistory.query.filter_by(id=mining_history_id).with_for_update().first()
+
     now = datetime.utcnow()
     if not last.end_time:
         last.end_time = now
@@ -87,6 +104,7 @@ def mining_stop():
             last.is_settled = True
             last.is_mining = False
             db.session.add(last)
+            db.session.delete(active)
 
             # 2. 更新 UserPointsAccount
             points_account = UserPointsAccount.query.filter_by(wallet_user_id=user.id).with_for_update().first()
@@ -114,6 +132,9 @@ def mining_stop():
             db.session.add(points_history_record)
 
         db.session.commit()
+        cancel_expiry(mining_history_id)
+        mark_weight_dirty(wallet_user_id)
+        invalidate_status(wallet_address)
 
         return jsonify({
             "message": "Mining stopped",
@@ -130,47 +151,27 @@ def mining_stop():
 @mining_bp.route('/status', methods=['GET'])
 def mining_status():
     wallet_address = request.args.get('wallet_address')
-    user = WalletUser.query.filter_by(wallet_address=wallet_address).first()
-    if not user:
+    if not wallet_address:
         return jsonify({"error": "User not found"}), 404
 
-    # 查询当前未结算的挖矿（进行中）
-    last_active = MiningHistory.query.filter_by(wallet_user_id=user.id, is_settled=False)\
-        .order_by(MiningHistory.mined_at.desc()).first()
-
-    # 查询最近一次已结算的挖矿（历史）
-    last_settled = MiningHistory.query.filter_by(wallet_user_id=user.id, is_settled=True)\
-        .order_by(MiningHistory.mined_at.desc()).first()
-
-    if last_active:
-        now = datetime.utcnow()
-        elapsed = (now - last_active.mined_at).total_seconds()
-        if elapsed >= 86400:
-            elapsed = 86400
-            isMining = False
-        else:
-            isMining = True
+    # 命中缓存：按闭式公式计算当前奖励，不访问数据库
+    doc, generation = get_cached_status(wallet_address)
+    if doc is not None:
+        return jsonify(render_status(doc))
 
-        reward = calculate_reward(last_active.mined_at, last_active.weight_snapshot, end_time=now)
+    user = WalletUser.query.filter_by(wallet_address=wallet_address).first()
+    if not user:
+        return jsonify({"error": "User not found"}), 404
 
-        return jsonify({
-            "isMining": isMining,
-            "start_time": last_active.mined_at.isoformat(),
-            "current_reward": str(reward),
-            "elapsed_seconds": int(elapsed),
-            "weight_snapshot": last_active.weight_snapshot,
-            "last_earned_points": None,
-            "last_earned_time": None
-        })
-    else:
-        # 没有活动挖矿了，返回最近一次结算奖励信息
-        if last_settled:
-            return jsonify({
-                "isMining": False,
-                "last_earned_points": last_settled.points_earned,
-                "last_earned_time": last_settled.end_time.isoformat() if last_settled.end_time else None
-            })
-        else:
-            return jsonify({"isMining": False, "last_earned_points": None, "last_earned_time": None})
+    # 当前未结算的挖矿（进行中）
+    last_active = db.session.get(ActiveMiningSession, user.id)
 
+    # 没有活动挖矿时，查询最近一次已结算的挖矿（历史）
+    last_settled = None
+    if not last_active:
+        last_settled = MiningHistory.query.filter_by(wallet_user_id=user.id, is_settled=True)\
+            .order_by(MiningHistory.mined_at.desc()).first()
 
+    doc = build_status_document(last_active, last_settled)
+    cache_status(wallet_address, doc, generation)
+    return jsonify(render_status(doc))
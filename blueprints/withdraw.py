@@ -1,40 +1,45 @@
 import os,json
+import asyncio
+from collections import Counter
 from web3 import Web3
 from flask import current_app
 from flask import Blueprint, request, jsonify
-from extensions import db
-from models import WalletUser, WithdrawalHistory,UserPointsAccount,PointsHistory
+from extensions import db, redis_conn
+from models import WalletUser, WithdrawalHistory,UserPointsAccount,PointsHistory,TrackedTransaction
 from datetime import datetime, timezone
 from decimal import Decimal
-from utils.blockchain_batch_transfer import blockchain_batch_withdraw
+from utils.blockchain_batch_transfer import DEV_PRIVATE_KEY, submit_batch_withdraw
 from utils.blockchain_sign import sign_withdrawal  # 你需要实现签名逻辑
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import and_
+from sqlalchemy import and_, case, update
+from utils.job_metrics import add_rows
+from utils.chain_client import RPC_ENDPOINTS, get_account, get_contract, get_w3
+from utils.chain_batch import batch_rpc, get_receipts, get_transaction_counts, multicall
+from utils.nonce_cache import get_cached_nonce, store_nonce, invalidate_nonce
+from utils.auth_utils import jwt_required
+from utils.weight_dirty import mark_weight_dirty
+from utils.receipt_tracker import ReceiptTracker, receipt_handler, track_pending
+from utils.leader_election import JobLock, job_lock_held, job_running
 
 withdraw_bp = Blueprint('withdraw', __name__, url_prefix='/api/withdraw')
 
 
 # 读取环境变量
-WEB3_PROVIDER = os.getenv('WEB3_PROVIDER')
 WITHDRAW_CONTRACT_ADDRESS = os.getenv('WITHDRAW_CONTRACT_ADDRESS')
-
-if not WEB3_PROVIDER:
+MEMAO_TOKEN_ADDRESS = os.getenv('MEMAO_TOKEN_ADDRESS')
+# 批量提现交易判定为 dropped 前回查 MEMAO 转账日志的区块数（受节点 eth_getLogs 区间上限约束）
+WITHDRAW_DROP_LOOKBACK_BLOCKS = int(os.getenv('WITHDRAW_DROP_LOOKBACK_BLOCKS', '5000'))
+TRANSFER_TOPIC = Web3.to_hex(Web3.keccak(text='Transfer(address,address,uint256)'))
+# 已登记交易超过该分钟数仍未确认的提现，由对账任务按回执追踪服务的规则处理
+WITHDRAW_RECONCILE_AFTER_MINUTES = int(os.getenv('WITHDRAW_RECONCILE_AFTER_MINUTES', '30'))
+# 批量提现任务锁（与定时任务同名）：手动触发与定时任务互斥，对账任务据此判断是否有批次正在领取 / 广播
+WITHDRAW_JOB_LOCK = 'scheduled_withdrawal_job'
+
+if not RPC_ENDPOINTS:
     raise RuntimeError("Missing WEB3_PROVIDER environment variable")
 if not WITHDRAW_CONTRACT_ADDRESS:
     raise RuntimeError("Missing WITHDRAW_CONTRACT_ADDRESS environment variable")
 
-w3 = Web3(Web3.HTTPProvider(WEB3_PROVIDER))
-
-# 当前文件目录
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-# abis目录（相对上级目录）
-ABIS_DIR = os.path.join(BASE_DIR, '..', 'abis')
-
-# 读取Withdraw合约ABI
-with open(os.path.join(ABIS_DIR, 'WithdrawWithSignature.json'), 'r') as f:
-    full_json = json.load(f)
-WithdrawContractABI = full_json['abi']
-
 
 #version：v1 platform pay gas
 @withdraw_bp.route('', methods=['POST'])
@@ -68,7 +73,9 @@ def withdraw_points():
 
     try:
         db.session.add(withdrawal)
+        user_id = user.id
         db.session.commit()
+        mark_weight_dirty(user_id)
 
         return jsonify({'success': True, 'message': 'Withdrawal request submitted'})
     except Exception as e:
@@ -128,61 +135,277 @@ def get_withdrawal_history():
 @withdraw_bp.route('/process', methods=['POST'])
 def manual_process_withdrawals():
     try:
-        process_withdrawals()
+        lock = JobLock(redis_conn, WITHDRAW_JOB_LOCK)
+        if not lock.acquire():
+            return jsonify({'success': False, 'message': 'Withdrawal processing is already running'}), 409
+        with lock:
+            process_withdrawals()
         return jsonify({'success': True, 'message': 'Withdrawals processed successfully'})
     except Exception as e:
         return jsonify({'success': False, 'message': f'Processing failed: {str(e)}'}), 500
 
 
-BATCH_SIZE = 20
 def process_withdrawals():
-    # 拉取所有 pending，没限制也行，或者加 limit 防止一次太多
-    pending_withdrawals = WithdrawalHistory.query.filter_by(status='pending').order_by(WithdrawalHistory.requested_at.asc()).limit(1000).all()
+    """
+    批量提现：领取 pending 记录置为 processing 后广播，不等待回执
+    回执由回执追踪服务处理（on_withdraw_batch_receipt），成功置 completed，失败退回 pending
+    """
+    if not job_lock_held():
+        print("Job lock lost, skipping withdrawal processing.")
+        return
+
+    # 一次联表查询取出 pending 记录及收款地址（避免逐条 WalletUser 查询），锁定后先置 processing 再广播
+    pending_withdrawals = db.session.query(
+        WithdrawalHistory.id,
+        WithdrawalHistory.amount,
+        WalletUser.wallet_address
+    ).join(
+        WalletUser, WalletUser.id == WithdrawalHistory.wallet_user_id
+    ).filter(
+        WithdrawalHistory.status == 'pending'
+    ).order_by(
+        WithdrawalHistory.requested_at.asc()
+    ).limit(1000).with_for_update(of=WithdrawalHistory, skip_locked=True).all()
 
     if not pending_withdrawals:
+        db.session.rollback()
         print("No pending withdrawals.")
         return
 
     total = len(pending_withdrawals)
+    add_rows(total)
     print(f"Total pending withdrawals fetched: {total}")
 
-    for i in range(0, total, BATCH_SIZE):
-        batch = pending_withdrawals[i:i+BATCH_SIZE]
+    withdrawal_ids = [wd.id for wd in pending_withdrawals]
+    try:
+        # 广播前提交 processing：即使之后登记失败，也不会被下一次任务重复发放
+        db.session.execute(
+            update(WithdrawalHistory)
+            .where(WithdrawalHistory.id.in_(withdrawal_ids))
+            .values(status='processing')
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    except Exception as db_error:
+        print(f"Database update error: {str(db_error)}")
+        db.session.rollback()
+        return
 
-        recipients = []
-        amounts_wei = []
-        withdrawal_ids = []
+    try:
+        # 由批次规划器按 gas 预算切分交易，全部连续广播
+        submitted = submit_batch_withdraw(
+            [wd.wallet_address for wd in pending_withdrawals],
+            [int(Decimal(str(wd.amount)) * Decimal(10 ** 18)) for wd in pending_withdrawals]
+        )
+    except Exception as e:
+        print(f"Blockchain transaction error: {str(e)}")
+        submitted = []
 
-        for wd in batch:
-            user = WalletUser.query.get(wd.wallet_user_id)
-            if user:
-                recipients.append(user.wallet_address)
-                amounts_wei.append(int(Decimal(str(wd.amount)) * Decimal(10 ** 18)))
-                withdrawal_ids.append(wd.id)
+    tracked_ids = []
+    try:
+        for indexes, tx in submitted:
+            ids = [withdrawal_ids[i] for i in indexes]
+            track_pending(tx, 'withdraw_batch', ids)
+            tracked_ids.extend(ids)
+
+        # 未广播的退回 pending，下一次任务重试
+        unsent_ids = sorted(set(withdrawal_ids) - set(tracked_ids))
+        if unsent_ids:
+            print(f"{len(unsent_ids)} withdrawals not broadcast, will retry later.")
+            db.session.execute(
+                update(WithdrawalHistory)
+                .where(WithdrawalHistory.id.in_(unsent_ids), WithdrawalHistory.status == 'processing')
+                .values(status='pending')
+                .execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+        print(f"{len(tracked_ids)} withdrawals broadcast in {len(submitted)} txs, awaiting receipts.")
+    except Exception as db_error:
+        db.session.rollback()
+        # 交易已广播但未登记，记录保持 processing，需按哈希人工核对
+        print(f"Database update error: {str(db_error)}")
+        for indexes, tx in submitted:
+            print(f"  untracked tx {Web3.to_hex(tx.tx_hashes[0])}: withdrawals {[withdrawal_ids[i] for i in indexes]}")
 
-        print(f"Processing batch {i//BATCH_SIZE + 1} with {len(recipients)} withdrawals: {list(zip(recipients, amounts_wei))}")
 
-        try:
-            success = blockchain_batch_withdraw(recipients, amounts_wei)  # 调用区块链批量提现接口
-
-            if success:
-                print(f"Batch {i//BATCH_SIZE + 1} processed successfully, updating DB...")
-                try:
-                    for withdrawal_id in withdrawal_ids:
-                        wd_record = WithdrawalHistory.query.get(withdrawal_id)
-                        if wd_record:
-                            wd_record.status = 'completed'
-                    db.session.commit()
-                except Exception as db_error:
-                    print(f"Database update error in batch {i//BATCH_SIZE + 1}: {str(db_error)}")
-                    db.session.rollback()
-            else:
-                print(f"Blockchain transfer failed in batch {i//BATCH_SIZE + 1}, will retry later.")
-                # 失败不更新，下一次任务重试
+def find_memao_transfers(addresses, sender):
+    """
+    近 WITHDRAW_DROP_LOOKBACK_BLOCKS 个区块内由 sender 签名的交易向这些地址转出的 MEMAO：
+    [(tx_hash, nonce, 收款地址, 金额 wei)]；查询出错时抛出异常
+    """
+    w3 = get_w3()
+    latest = w3.eth.block_number
+    logs = w3.eth.get_logs({
+        'address': Web3.to_checksum_address(MEMAO_TOKEN_ADDRESS),
+        'fromBlock': max(latest - WITHDRAW_DROP_LOOKBACK_BLOCKS, 0),
+        'toBlock': latest,
+        'topics': [TRANSFER_TOPIC, None, ['0x' + address[2:].lower().rjust(64, '0') for address in addresses]]
+    })
+    tx_hashes = sorted({w3.to_hex(log['transactionHash']) for log in logs})
+
+    errors = set()
+    txs = batch_rpc([('eth_getTransactionByHash', [tx_hash]) for tx_hash in tx_hashes], errors)
+    if errors:
+        raise ValueError(f"Failed to load {len(errors)} MEMAO transfer transactions")
+    nonces = {
+        tx_hash: int(tx['nonce'], 16)
+        for tx_hash, tx in zip(tx_hashes, txs)
+        if tx is not None and Web3.to_checksum_address(tx['from']) == sender
+    }
+    transfers = []
+    for log in logs:
+        tx_hash = w3.to_hex(log['transactionHash'])
+        if tx_hash in nonces:
+            transfers.append((
+                tx_hash,
+                nonces[tx_hash],
+                Web3.to_checksum_address(log['topics'][2][-20:]),
+                int.from_bytes(log['data'], 'big')
+            ))
+    return transfers
+
+
+def find_withdraw_replacement(tracked):
+    """
+    批量提现判定为 dropped 前回查链上，避免未登记的替换交易已转账、记录却退回 pending 被重复发放：
+    同签名地址、同 nonce 向这些收款地址转出 MEMAO 的交易即为替换交易，返回其回执；
+    查询出错时抛出异常，由追踪服务保持 pending
+    """
+    addresses = [address for (address,) in db.session.query(
+        WalletUser.wallet_address
+    ).join(
+        WithdrawalHistory, WithdrawalHistory.wallet_user_id == WalletUser.id
+    ).filter(
+        WithdrawalHistory.id.in_(tracked.entity_ids)
+    ).distinct()]
+    if not addresses:
+        return None
+
+    for tx_hash, nonce, _, _ in find_memao_transfers(addresses, tracked.sender):
+        if nonce != tracked.nonce:
+            continue
+        (receipt,) = get_receipts([tx_hash])
+        if receipt is None:
+            raise ValueError(f"Receipt of replacement {tx_hash} unavailable")
+        return receipt
+    return None
+
+
+@receipt_handler('withdraw_batch', verify_dropped=find_withdraw_replacement)
+def on_withdraw_batch_receipt(withdrawal_ids, receipt):
+    """批量提现回执：成功置 completed；回滚或被替换（链上回查未转账）的退回 pending，由下一次任务重试"""
+    if receipt is not None and receipt['status'] == 1:
+        values = {'status': 'completed', 'processed_at': datetime.now(timezone.utc)}
+    else:
+        values = {'status': 'pending'}
+    db.session.execute(
+        update(WithdrawalHistory)
+        .where(WithdrawalHistory.id.in_(withdrawal_ids), WithdrawalHistory.status == 'processing')
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
 
-        except Exception as e:
-            print(f"Blockchain transaction error in batch {i//BATCH_SIZE + 1}: {str(e)}")
-            db.session.rollback()
+
+# 对账任务复用的追踪器（跨次运行保留 dropped 嫌疑，连续两次对账仍无回执才按 dropped 处理）
+_stale_tracker = None
+
+
+def reconcile_stale_withdrawals(app):
+    """
+    提现对账（回执追踪服务停机时的兜底）：
+    1. 登记超过 WITHDRAW_RECONCILE_AFTER_MINUTES 分钟仍未确认的提现交易，按追踪服务的规则处理
+       （有回执按回执；nonce 已越过且连续两次对账仍无回执的，经链上回查后按 dropped 处理）
+    2. processing 却没有待确认交易的提现（广播后登记失败 / 进程中断），没有批次正在执行、
+       且开发账户没有待上链交易时回查链上：有对应 MEMAO 转账的置 completed，其余退回 pending
+    """
+    global _stale_tracker
+    if _stale_tracker is None:
+        _stale_tracker = ReceiptTracker(
+            app, kinds=['withdraw_batch'], min_age=WITHDRAW_RECONCILE_AFTER_MINUTES * 60
+        )
+    resolved = asyncio.run(_stale_tracker.check())
+    if resolved:
+        print(f"Reconciled {resolved} stale withdrawal transactions.")
+
+    processing_ids = [wd_id for (wd_id,) in db.session.query(
+        WithdrawalHistory.id
+    ).filter(
+        WithdrawalHistory.status == 'processing'
+    ).order_by(
+        WithdrawalHistory.id
+    ).limit(1000)]
+    if not processing_ids:
+        return
+    # 先取 processing 再检查任务锁：锁空闲说明取到的记录所属批次都已结束（登记完成或已中断），
+    # 之后开始的批次只会领取 pending 记录
+    if job_running(redis_conn, WITHDRAW_JOB_LOCK):
+        print("Withdrawal batch in progress, reconciling processing withdrawals later.")
+        return
+    # 结束只读事务，之后的查询读取已结束批次最新提交的登记记录
+    db.session.rollback()
+
+    tracked_ids = set()
+    for (entity_ids,) in db.session.query(TrackedTransaction.entity_ids).filter(
+        TrackedTransaction.kind == 'withdraw_batch',
+        TrackedTransaction.status == 'pending'
+    ):
+        tracked_ids.update(entity_ids)
+    orphan_ids = [wd_id for wd_id in processing_ids if wd_id not in tracked_ids]
+    if not orphan_ids:
+        return
+
+    # 先读 latest 再读 pending：两者相等说明此刻没有待上链的交易，之后不会再有新的转账出现
+    dev_address = get_account(DEV_PRIVATE_KEY).address
+    mined_nonce = get_transaction_counts([dev_address], 'latest').get(dev_address)
+    pending_nonce = get_transaction_counts([dev_address], 'pending').get(dev_address)
+    if mined_nonce is None or mined_nonce != pending_nonce:
+        print(f"{len(orphan_ids)} untracked processing withdrawals, dev account has transactions in flight, "
+              f"reconciling later.")
+        return
+
+    orphans = db.session.query(
+        WithdrawalHistory.id,
+        WithdrawalHistory.amount,
+        WalletUser.wallet_address
+    ).join(
+        WalletUser, WalletUser.id == WithdrawalHistory.wallet_user_id
+    ).filter(
+        WithdrawalHistory.id.in_(orphan_ids)
+    ).all()
+    transfers = find_memao_transfers(sorted({wd.wallet_address for wd in orphans}), dev_address)
+
+    # 每笔链上转账只匹配一条提现（同地址同金额的多笔提现各需一笔转账）；
+    # 回查区间内同地址同金额的历史转账也会被匹配，宁可少发不重复发放
+    available = Counter((to, amount) for _, _, to, amount in transfers)
+    paid_ids, unpaid_ids = [], []
+    for wd in orphans:
+        key = (Web3.to_checksum_address(wd.wallet_address), int(Decimal(str(wd.amount)) * Decimal(10 ** 18)))
+        if available[key] > 0:
+            available[key] -= 1
+            paid_ids.append(wd.id)
+        else:
+            unpaid_ids.append(wd.id)
+
+    try:
+        if paid_ids:
+            db.session.execute(
+                update(WithdrawalHistory)
+                .where(WithdrawalHistory.id.in_(paid_ids), WithdrawalHistory.status == 'processing')
+                .values(status='completed', processed_at=datetime.now(timezone.utc))
+                .execution_options(synchronize_session=False)
+            )
+        if unpaid_ids:
+            db.session.execute(
+                update(WithdrawalHistory)
+                .where(WithdrawalHistory.id.in_(unpaid_ids), WithdrawalHistory.status == 'processing')
+                .values(status='pending')
+                .execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    print(f"Reconciled untracked processing withdrawals: completed {paid_ids}, back to pending {unpaid_ids}")
 
 
 #version：v2 user pay gas
@@ -236,6 +459,10 @@ def apply_withdraw():
 
 
 # /withdraw/signature — 生成链上签名
+# 三阶段：无锁读取 -> 锁外读链上 nonce 并签名 -> 版本号守卫的短事务提交（冲突时重读重试）
+SIGNATURE_MAX_ATTEMPTS = 3
+
+
 @withdraw_bp.route('/signature', methods=['POST'])
 def get_withdraw_signature():
     data = request.get_json()
@@ -246,64 +473,60 @@ def get_withdraw_signature():
         return jsonify({'success': False, 'message': 'Missing wallet address or withdrawalId'}), 400
 
     try:
-        with db.session.begin_nested():
-            user = (
-                WalletUser.query
-                .filter_by(wallet_address=wallet_address)
-                .with_for_update()
-                .first()
-            )
-            if not user:
-                return jsonify({'success': False, 'message': 'Wallet address not found'}), 404
+        for attempt in range(1, SIGNATURE_MAX_ATTEMPTS + 1):
+            # ========================
+            # 1. 无锁读取（一条联表查询）
+            # ========================
+            row = db.session.query(
+                WalletUser.id.label('user_id'),
+                UserPointsAccount.total_points,
+                UserPointsAccount.withdraw_nonce,
+                UserPointsAccount.version,
+                WithdrawalHistory.amount
+            ).select_from(WalletUser).outerjoin(
+                UserPointsAccount, UserPointsAccount.wallet_user_id == WalletUser.id
+            ).outerjoin(
+                WithdrawalHistory, and_(
+                    WithdrawalHistory.wallet_user_id == WalletUser.id,
+                    WithdrawalHistory.id == withdrawal_id,
+                    WithdrawalHistory.status == 'pending'
+                )
+            ).filter(
+                WalletUser.wallet_address == wallet_address
+            ).first()
+            db.session.commit()
 
-            user_account = (
-                UserPointsAccount.query
-                .filter_by(wallet_user_id=user.id)
-                .with_for_update()
-                .first()
-            )
-            if not user_account:
+            if not row:
+                return jsonify({'success': False, 'message': 'Wallet address not found'}), 404
+            if row.withdraw_nonce is None:
                 return jsonify({'success': False, 'message': 'User points account not found'}), 404
-
-            withdraw_record = (
-                WithdrawalHistory.query
-                .filter_by(id=withdrawal_id, wallet_user_id=user.id, status='pending')
-                .with_for_update()
-                .first()
-            )
-            if not withdraw_record:
+            if row.amount is None:
                 return jsonify({'success': False, 'message': 'No pending withdrawal found'}), 404
 
-            amount = withdraw_record.amount
-
-            if user_account.total_points < amount:
+            amount = row.amount
+            if row.total_points < amount:
                 return jsonify({'success': False, 'message': 'Insufficient points'}), 400
 
-            # 获取链上 nonce 和数据库 nonce
-            chain_nonce = sync_nonce_from_chain(wallet_address)
-            db_nonce = user_account.withdraw_nonce
-
             # ========================
-            # 自动同步逻辑
+            # 2. 锁外：链上 nonce（缓存与数据库一致时直接使用，否则严格回源）与签名
             # ========================
+            db_nonce = row.withdraw_nonce
+            chain_nonce = get_cached_nonce(wallet_address)
+            if chain_nonce is None or chain_nonce != db_nonce:
+                chain_nonce = read_chain_nonce(wallet_address)
+
             if chain_nonce == 0 and db_nonce > 0:
                 # 合约升级，重置本地 nonce
                 current_app.logger.warning(
                     f"Contract reset detected for {wallet_address}, resetting db_nonce from {db_nonce} to 0"
                 )
-                user_account.withdraw_nonce = 0
-                db.session.commit()
-                db_nonce = 0
-
+                nonce = 0
             elif db_nonce < chain_nonce:
                 # 本地落后，强制追赶链上
                 current_app.logger.warning(
                     f"Nonce mismatch: db={db_nonce}, chain={chain_nonce}, syncing to chain"
                 )
-                user_account.withdraw_nonce = chain_nonce
-                db.session.commit()
-                db_nonce = chain_nonce
-
+                nonce = chain_nonce
             elif db_nonce > chain_nonce:
                 # 数据库超前，不允许签名，报警
                 current_app.logger.error(
@@ -316,23 +539,55 @@ def get_withdraw_signature():
                     'chain_nonce': chain_nonce,
                     'is_nonce_synced': False
                 }), 400
-
-            print("chain_nonce,db_nonce", chain_nonce, db_nonce)
+            else:
+                nonce = db_nonce
 
             # 生成签名（不扣积分）
-            signature = sign_withdrawal(wallet_address, amount, db_nonce)
+            signature = sign_withdrawal(wallet_address, amount, nonce)
+
+            # ========================
+            # 3. 乐观提交：读取后 nonce 未被其他请求改动、提现仍为 pending 才返回签名
+            #    每次签名都递增 version：同一读取版本只有一个请求能提交，并发请求重试或返回 409
+            # ========================
+            values = {'version': UserPointsAccount.version + 1}
+            if nonce != db_nonce:
+                values['withdraw_nonce'] = nonce
+            matched = db.session.execute(
+                update(UserPointsAccount)
+                .where(
+                    UserPointsAccount.wallet_user_id == row.user_id,
+                    UserPointsAccount.version == row.version
+                )
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+
+            if matched:
+                still_pending = db.session.query(WithdrawalHistory.id).filter_by(
+                    id=withdrawal_id, wallet_user_id=row.user_id, status='pending'
+                ).first()
+                if not still_pending:
+                    db.session.rollback()
+                    return jsonify({'success': False, 'message': 'No pending withdrawal found'}), 404
 
+                db.session.commit()
+                current_app.logger.info(
+                    f"Signature generated - Address: {wallet_address}, Amount: {amount}, Nonce: {nonce}"
+                )
+                return jsonify({
+                    'success': True,
+                    'signature': signature,
+                    'nonce': nonce,
+                    'chain_nonce': chain_nonce,
+                    'is_nonce_synced': nonce == chain_nonce
+                })
+
+            db.session.rollback()
             current_app.logger.info(
-                f"Signature generated - Address: {wallet_address}, Amount: {amount}, Nonce: {db_nonce}"
+                f"Nonce version conflict for {wallet_address} (attempt {attempt}/{SIGNATURE_MAX_ATTEMPTS}), retrying"
             )
 
-            return jsonify({
-                'success': True,
-                'signature': signature,
-                'nonce': db_nonce,
-                'chain_nonce': chain_nonce,
-                'is_nonce_synced': db_nonce == chain_nonce
-            })
+        return jsonify({'success': False, 'message': 'Concurrent withdrawal update, please retry'}), 409
 
     except Exception as e:
         db.session.rollback()
@@ -416,6 +671,7 @@ def report_withdraw_result():
             db.session.add(points_history)
 
             user_account.withdraw_nonce = onchain_nonce + 1
+            user_account.version += 1
 
             withdraw_record.status = 'completed'
             withdraw_record.tx_hash = tx_hash
@@ -426,6 +682,7 @@ def report_withdraw_result():
         elif result == 'failure':
             # 失败：不返还积分，只更新状态和 nonce
             user_account.withdraw_nonce = onchain_nonce
+            user_account.version += 1
             withdraw_record.status = 'failed'
             withdraw_record.processed_at = datetime.now(timezone.utc)
             if remarks:
@@ -433,7 +690,12 @@ def report_withdraw_result():
         else:
             return jsonify({'success': False, 'message': 'Invalid result value'}), 400
 
+        user_id = user.id
         db.session.commit()
+        # 上报的链上 nonce 不可信，丢弃缓存，下次签名严格回源
+        invalidate_nonce(wallet_address)
+        if result == 'success':
+            mark_weight_dirty(user_id)
         return jsonify({'success': True, 'message': 'Report recorded', 'latest_nonce': user_account.withdraw_nonce})
 
     except SQLAlchemyError as e:
@@ -442,6 +704,17 @@ def report_withdraw_result():
         return jsonify({'success': False, 'message': 'Database error'}), 500
 
 
+def read_chain_nonce(wallet_address: str) -> int:
+    """
+    只读链上 nonces()（不碰数据库，可在事务/行锁之外调用），并写入 nonce 缓存
+    """
+    contract = get_contract(WITHDRAW_CONTRACT_ADDRESS, 'WithdrawWithSignature.json')
+    #数据库中存的非校验地址需要转成校验地址
+    onchain_nonce = contract.functions.nonces(Web3.to_checksum_address(wallet_address)).call()
+    store_nonce(wallet_address, onchain_nonce)
+    return onchain_nonce
+
+
 def sync_nonce_from_chain(wallet_address: str) -> int:
     """
     增强版nonce同步方法
@@ -450,14 +723,8 @@ def sync_nonce_from_chain(wallet_address: str) -> int:
     """
     try:
         # 获取链上nonce
-        contract = w3.eth.contract(
-            address=Web3.to_checksum_address(WITHDRAW_CONTRACT_ADDRESS),
-            abi=WithdrawContractABI
-        )
-        #数据库中存的非校验地址需要转成校验地址
+        onchain_nonce = read_chain_nonce(wallet_address)
         wallet_address = Web3.to_checksum_address(wallet_address)
-        onchain_nonce = contract.functions.nonces(wallet_address).call()
-
 
         # 获取并更新数据库记录（已在外部事务中锁定）
         user = WalletUser.query.filter_by(wallet_address=wallet_address).first()
@@ -467,6 +734,7 @@ def sync_nonce_from_chain(wallet_address: str) -> int:
         # 保证数据库nonce >= 链上nonce
         if user.points_account.withdraw_nonce < onchain_nonce:
             user.points_account.withdraw_nonce = onchain_nonce
+            user.points_account.version += 1
             db.session.flush()  # 立即生效但不提交（由外部事务控制）
 
         current_app.logger.debug(
@@ -481,3 +749,76 @@ def sync_nonce_from_chain(wallet_address: str) -> int:
             f"Nonce sync error for {wallet_address}: {str(e)}"
         )
         raise  # 抛出给上层处理
+
+
+# 管理员 nonce 对账：有 pending 提现的用户，链上 nonces() 经 Multicall3 聚合批量读取
+# GET 只报告差异；POST 额外把落后于链上的数据库 nonce 批量追平（与 sync_nonce_from_chain 规则一致）
+@withdraw_bp.route('/admin/nonce-reconciliation', methods=['GET', 'POST'])
+@jwt_required
+def reconcile_nonces():
+    try:
+        rows = db.session.query(
+            WalletUser.id,
+            WalletUser.wallet_address,
+            UserPointsAccount.withdraw_nonce
+        ).join(
+            UserPointsAccount, UserPointsAccount.wallet_user_id == WalletUser.id
+        ).filter(
+            WalletUser.id.in_(
+                db.session.query(WithdrawalHistory.wallet_user_id)
+                .filter(WithdrawalHistory.status == 'pending')
+            )
+        ).all()
+
+        contract = get_contract(WITHDRAW_CONTRACT_ADDRESS, 'WithdrawWithSignature.json')
+        chain_nonces = multicall(
+            contract.functions.nonces(Web3.to_checksum_address(row.wallet_address)) for row in rows
+        )
+
+        mismatches = []
+        behind = {}
+        for row, chain_nonce in zip(rows, chain_nonces):
+            if chain_nonce is None:
+                state = 'unknown'
+            elif chain_nonce == row.withdraw_nonce:
+                continue
+            elif chain_nonce == 0 and row.withdraw_nonce > 0:
+                state = 'chain_reset'
+            elif row.withdraw_nonce < chain_nonce:
+                state = 'behind'
+                behind[row.id] = chain_nonce
+            else:
+                state = 'ahead'
+            mismatches.append({
+                'wallet_address': row.wallet_address,
+                'db_nonce': row.withdraw_nonce,
+                'chain_nonce': chain_nonce,
+                'state': state
+            })
+
+        synced = 0
+        if request.method == 'POST' and behind:
+            target = case(behind, value=UserPointsAccount.wallet_user_id)
+            synced = db.session.execute(
+                update(UserPointsAccount)
+                .where(
+                    UserPointsAccount.wallet_user_id.in_(list(behind)),
+                    UserPointsAccount.withdraw_nonce < target
+                )
+                .values(withdraw_nonce=target, version=UserPointsAccount.version + 1)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.commit()
+
+        return jsonify({
+            'success': True,
+            'checked': len(rows),
+            'mismatches': mismatches,
+            'synced': synced
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Nonce reconciliation failed: {e}")
+        return jsonify({'success': False, 'message': f'Nonce reconciliation failed: {str(e)}'}), 500
+
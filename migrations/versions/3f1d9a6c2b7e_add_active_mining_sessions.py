@@ -0,0 +1,53 @@
+"""add active_mining_sessions and mining_history composite index
+
+Revision ID: 3f1d9a6c2b7e
+Revises: 4ece1b7ad193
+Create Date: 2026-10-18 10:12:37.418254
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1d9a6c2b7e'
+down_revision = '4ece1b7ad193'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('active_mining_sessions',
+    sa.Column('wallet_user_id', sa.Integer(), nullable=False),
+    sa.Column('mining_history_id', sa.Integer(), nullable=False),
+    sa.Column('mined_at', sa.DateTime(), nullable=False),
+    sa.Column('weight_snapshot', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['mining_history_id'], ['mining_history.id'], ),
+    sa.ForeignKeyConstraint(['wallet_user_id'], ['wallet_users.id'], ),
+    sa.PrimaryKeyConstraint('wallet_user_id'),
+    sa.UniqueConstraint('mining_history_id')
+    )
+    with op.batch_alter_table('active_mining_sessions', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_active_mining_sessions_mined_at'), ['mined_at'], unique=False)
+
+    with op.batch_alter_table('mining_history', schema=None) as batch_op:
+        batch_op.create_index('ix_mining_history_user_settled_mined', ['wallet_user_id', 'is_settled', 'mined_at'], unique=False)
+
+    # 回填：每个用户最新一条未结算记录
+    op.execute(
+        "INSERT INTO active_mining_sessions (wallet_user_id, mining_history_id, mined_at, weight_snapshot) "
+        "SELECT mh.wallet_user_id, mh.id, mh.mined_at, mh.weight_snapshot "
+        "FROM mining_history mh "
+        "JOIN (SELECT wallet_user_id, MAX(id) AS id FROM mining_history "
+        "      WHERE is_settled = 0 GROUP BY wallet_user_id) latest ON latest.id = mh.id"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('mining_history', schema=None) as batch_op:
+        batch_op.drop_index('ix_mining_history_user_settled_mined')
+
+    with op.batch_alter_table('active_mining_sessions', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_active_mining_sessions_mined_at'))
+
+    op.drop_table('active_mining_sessions')
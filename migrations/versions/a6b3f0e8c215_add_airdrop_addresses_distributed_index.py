@@ -0,0 +1,26 @@
+"""add airdrop_addresses (is_distributed, id) index
+
+Revision ID: a6b3f0e8c215
+Revises: 5c7e2a9d4f13
+Create Date: 2026-10-18 17:20:44.092861
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6b3f0e8c215'
+down_revision = '5c7e2a9d4f13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('airdrop_addresses', schema=None) as batch_op:
+        batch_op.create_index('ix_airdrop_addresses_distributed_id', ['is_distributed', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('airdrop_addresses', schema=None) as batch_op:
+        batch_op.drop_index('ix_airdrop_addresses_distributed_id')
@@ -0,0 +1,35 @@
+"""add replacement fields to tracked_transactions
+
+Revision ID: e71c4d09b2a8
+Revises: a6b3f0e8c215
+Create Date: 2026-10-18 19:05:31.604218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e71c4d09b2a8'
+down_revision = 'a6b3f0e8c215'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('tracked_transactions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('tx_hashes', sa.JSON(), nullable=True))
+        batch_op.add_column(sa.Column('tx', sa.JSON(), nullable=True))
+        batch_op.add_column(sa.Column('bumps', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('last_sent_at', sa.DateTime(), nullable=True))
+
+    # 已登记的交易：候选哈希即原哈希（没有交易参数，不参与加价替换）
+    op.execute("UPDATE tracked_transactions SET tx_hashes = JSON_ARRAY(tx_hash), last_sent_at = created_at")
+
+
+def downgrade():
+    with op.batch_alter_table('tracked_transactions', schema=None) as batch_op:
+        batch_op.drop_column('last_sent_at')
+        batch_op.drop_column('bumps')
+        batch_op.drop_column('tx')
+        batch_op.drop_column('tx_hashes')
@@ -5,13 +5,13 @@ from .adminuser_models import AdminUser
 from .user_models import User,UserAccount
 from .wallet_models import WalletUser, CheckinHistory, UserPointsAccount, WithdrawalHistory, PointsHistory
 from .airdrop_models import AirdropAddress, AirdropConfig, TokenTransfer
-from .mining_models import MiningHistory
+from .mining_models import MiningHistory, ActiveMiningSession
 from .message_models import Message
 from .vip_subscriptions import VIPSubscription
 from .invite_models import InviteRecord
 from .socialaccount_models import SocialAccount
 from .paypal import PayPalOrder,PaymentStatusEnum,DeployStatusEnum
-from .transaction_jobs import TransactionJob,JobStatusEnum
+from .transaction_jobs import TransactionJob,JobStatusEnum,TrackedTransaction
 from .eth import EthOrder
 
 # 2. 定义__all__（控制from models import *的行为）
@@ -28,6 +28,7 @@ __all__ = [
     'AirdropConfig',
     'TokenTransfer',
     'MiningHistory',
+    'ActiveMiningSession',
     'Message',
     'VIPSubscription',
     'InviteRecord',
@@ -37,6 +38,7 @@ __all__ = [
     'DeployStatusEnum',
     'TransactionJob',
     'JobStatusEnum',
+    'TrackedTransaction',
     'EthOrder'
 ]
 
@@ -11,6 +11,11 @@ class AirdropAddress(db.Model):
     is_distributed = db.Column(db.Boolean, default=False)
     distributed_at = db.Column(db.DateTime, nullable=True)
 
+    __table_args__ = (
+        # 按发放状态筛选 + id 游标分页 / 领取待发放地址
+        db.Index('ix_airdrop_addresses_distributed_id', 'is_distributed', 'id'),
+    )
+
 class AirdropConfig(db.Model):
     __tablename__ = 'airdrop_config'
 
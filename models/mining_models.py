@@ -14,3 +14,17 @@ class MiningHistory(db.Model):
     is_mining = db.Column(db.Boolean, default=True)
 
     wallet_user = db.relationship('WalletUser', backref='mining_history')
+
+    __table_args__ = (
+        db.Index('ix_mining_history_user_settled_mined', 'wallet_user_id', 'is_settled', 'mined_at'),
+    )
+
+
+class ActiveMiningSession(db.Model):
+    """进行中的挖矿会话（每个用户至多一行），由 start / stop / 结算维护，热点接口按主键 O(1) 查询"""
+    __tablename__ = 'active_mining_sessions'
+
+    wallet_user_id = db.Column(db.Integer, db.ForeignKey('wallet_users.id'), primary_key=True)
+    mining_history_id = db.Column(db.Integer, db.ForeignKey('mining_history.id'), nullable=False, unique=True)
+    mined_at = db.Column(db.DateTime, nullable=False, index=True)
+    weight_snapshot = db.Column(db.Float, nullable=False)
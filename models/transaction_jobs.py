@@ -22,3 +22,27 @@ class TransactionJob(db.Model):
 
     # 反向引用：job.order 就能访问对应订单
     order = db.relationship("PayPalOrder", backref="jobs")
+
+
+class TrackedTransaction(db.Model):
+    """已广播、等待回执的链上交易，由回执追踪服务按区块轮询并回调对应业务处理"""
+    __tablename__ = "tracked_transactions"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    tx_hash = db.Column(db.String(66), nullable=False, unique=True)   # 首次广播的哈希
+    tx_hashes = db.Column(db.JSON, nullable=True)             # 含加价替换在内的全部哈希，任一上链即完成
+    tx = db.Column(db.JSON, nullable=True)                    # 最近一次签名的交易参数，用于同 nonce 加价替换
+    bumps = db.Column(db.Integer, default=0, nullable=False)  # 已加价替换次数
+    last_sent_at = db.Column(db.DateTime, nullable=True)      # 最近一次广播时间
+    kind = db.Column(db.String(32), nullable=False)           # 业务类型，对应回执处理函数
+    entity_ids = db.Column(db.JSON, nullable=False)           # 业务记录 id 列表
+    sender = db.Column(db.String(42), nullable=False)         # 签名地址
+    nonce = db.Column(db.Integer, nullable=False)             # 用于判断交易是否已被同 nonce 交易替换
+    status = db.Column(db.String(16), default='pending', nullable=False)  # pending / confirmed / reverted / dropped
+    block_number = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    resolved_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_tracked_transactions_status_id', 'status', 'id'),
+    )
@@ -47,6 +47,7 @@ class UserPointsAccount(db.Model):
     last_checkin_date = db.Column(db.Date)
     milestone_reached = db.Column(db.Integer, default=0, nullable=False)
     withdraw_nonce = db.Column(db.Integer, default=0, nullable=False)  # 新增提现nonce字段
+    version = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # 乐观锁版本号：withdraw_nonce 变更时递增
     wallet_user = relationship("WalletUser", back_populates="points_account")
 
 class WithdrawalHistory(db.Model):
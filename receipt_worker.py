@@ -0,0 +1,19 @@
+import asyncio
+import signal
+from app import create_app
+from utils.receipt_tracker import ReceiptTracker
+
+
+async def main():
+    # create_app 导入全部蓝图（含 paypal -> utils.tx_jobs），回执处理函数随之注册
+    app = create_app()
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, stop_event.set)
+    loop.add_signal_handler(signal.SIGINT, stop_event.set)
+    await ReceiptTracker(app).run(stop_event)
+
+
+if __name__ == '__main__':
+    # 独立容器运行：python -m receipt_worker（只需一个实例，多实例时由条件更新去重）
+    asyncio.run(main())
@@ -1,17 +1,27 @@
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.events import EVENT_JOB_SUBMITTED
 from flask import current_app
-from decimal import Decimal
-from datetime import datetime, timezone,timedelta
-from models import AirdropAddress, AirdropConfig,WalletUser,MiningHistory,PointsHistory,UserPointsAccount,InviteRecord
-from extensions import db
-from utils.mining_service import calculate_user_weight,calculate_reward
-from sqlalchemy.orm import joinedload
-from sqlalchemy import func
+from datetime import datetime, timezone
+from models import WalletUser,UserPointsAccount,InviteRecord
+from extensions import db, redis_conn
+from utils.mining_service import calculate_user_weights_batch,update_daily_weight_sql,check_weight_engine_parity
+from utils.mining_settlement import settle_expired_in_chunks
+from utils.mining_expiry import settle_due_sessions, rebuild_expiry_index
+from utils.weight_dirty import pop_dirty_users, restore_dirty_users
+from utils.nonce_cache import poll_withdraw_events
+from utils.airdrop_drain import AIRDROP_MODE, drain_airdrop
+from utils.airdrop_membership import ensure_membership
+from sqlalchemy import func, select, update
+from functools import wraps
+from utils.leader_election import LeaderElector, JobLock, job_lock_held
+from utils.job_metrics import track_job, add_rows, mark_failed, set_scheduled_time
 import traceback
+import os
 
 scheduler = BackgroundScheduler()
 
 
+@track_job('scheduled_withdrawal_job')
 def scheduled_withdrawal_job(app):
     with app.app_context():
         try:
@@ -19,11 +29,29 @@ def scheduled_withdrawal_job(app):
             from blueprints.withdraw import process_withdrawals
             process_withdrawals()
             print(f"[{datetime.now()}] Withdrawal task completed.")
-        except Exception:
+        except Exception as e:
+            mark_failed(e)
             print(f"[{datetime.now()}] Withdrawal task failed:")
             traceback.print_exc()
 
 
+# 提现对账间隔（分钟）：回执追踪服务停机时兜底处理长时间未确认 / 未登记的 processing 提现
+WITHDRAW_RECONCILE_MINUTES = int(os.getenv('WITHDRAW_RECONCILE_MINUTES', 10))
+
+
+@track_job('reconcile_withdrawals_job')
+def reconcile_withdrawals_job(app):
+    with app.app_context():
+        try:
+            from blueprints.withdraw import reconcile_stale_withdrawals
+            reconcile_stale_withdrawals(app)
+        except Exception as e:
+            mark_failed(e)
+            print(f"[{datetime.now()}] Withdrawal reconciliation failed:")
+            traceback.print_exc()
+
+
+@track_job('distribute_airdrop_job')
 def distribute_airdrop_job(app):
     with app.app_context():
         try:
@@ -34,49 +62,88 @@ def distribute_airdrop_job(app):
                 print(f"[{datetime.now()}] 定时任务已关闭，跳过执行。")
                 return
 
+            if AIRDROP_MODE == 'drain':
+                print(f"[{datetime.now()}] Running airdrop drain task...")
+                processed = drain_airdrop(config)
+                add_rows(processed)
+                print(f"[{datetime.now()}] Airdrop drain completed: {processed} addresses.")
+                return
+
             print(f"[{datetime.now()}] Running scheduled airdrop task...")
             from blueprints.airdrop import manual_distribute
             manual_distribute()
             print(f"[{datetime.now()}] Airdrop task completed.")
-        except Exception:
+        except Exception as e:
+            mark_failed(e)
             print(f"[{datetime.now()}] Airdrop task failed:")
             traceback.print_exc()
 
 
-# 更新用户权重
-def update_all_users_daily_weight(app):
+# 空投地址成员缓存巡检：被 LRU 淘汰后重新预热
+AIRDROP_MEMBERSHIP_CHECK_MINUTES = int(os.getenv('AIRDROP_MEMBERSHIP_CHECK_MINUTES', 10))
+
+
+# 提现合约事件监听：刷新 nonce 缓存
+NONCE_WATCHER_SECONDS = int(os.getenv('NONCE_WATCHER_SECONDS', 5))
+
+
+@track_job('watch_withdraw_nonces_job')
+def watch_withdraw_nonces_job(app):
     with app.app_context():
         try:
-            start_time = datetime.now(timezone.utc)
-            print(f"[{start_time}] Starting daily weight update task...")
+            add_rows(poll_withdraw_events())
+        except Exception as e:
+            mark_failed(e)
+            print(f"[{datetime.now()}] Withdraw nonce watcher failed:")
+            traceback.print_exc()
+
 
-            # 1. 批量查询用户及关联数据（关键优化）
-            users = WalletUser.query.options(
-                joinedload(WalletUser.points_account),  # 预加载积分账户
-                joinedload(WalletUser.checkin_history)  # 按需加载其他关联
-            ).all()
+# 更新用户权重
+WEIGHT_CHUNK_SIZE = int(os.getenv('WEIGHT_CHUNK_SIZE', 1000))
+# python: 流式分块计算；sql: 在 MySQL 内整批计算
+WEIGHT_ENGINE = os.getenv('WEIGHT_ENGINE', 'python')
+WEIGHT_SQL_CHUNK_SIZE = int(os.getenv('WEIGHT_SQL_CHUNK_SIZE', 50000))
+WEIGHT_PARITY_SAMPLE_SIZE = int(os.getenv('WEIGHT_PARITY_SAMPLE_SIZE', 200))
+# incremental: 每晚只重算脏用户，全量重算按 WEIGHT_RECONCILE_DAY_OF_WEEK 定期对账；full: 每晚全量
+WEIGHT_UPDATE_MODE = os.getenv('WEIGHT_UPDATE_MODE', 'incremental')
+WEIGHT_RECONCILE_DAY_OF_WEEK = os.getenv('WEIGHT_RECONCILE_DAY_OF_WEEK', 'sun')
 
-            # 2. 预查询所有邀请数据（避免N+1）
-            invite_counts = get_invite_counts([u.wallet_address for u in users])
 
-            # 3. 分批更新权重（每1000用户提交一次）
-            batch_size = 1000
-            for i in range(0, len(users), batch_size):
-                batch = users[i:i + batch_size]
-                for user in batch:
-                    weight, _ = calculate_user_weight(user, invite_counts)
-                    user.daily_weight = weight
-                    user.last_weight_update = datetime.now(timezone.utc)
+@track_job('update_all_users_daily_weight')
+def update_all_users_daily_weight(app, chunk_size=WEIGHT_CHUNK_SIZE, engine=None):
+    """
+    更新全部用户权重
+    python 引擎：按 wallet_users.id 游标分块扫描，每块只取权重需要的列，内存占用与用户总数无关
+    sql 引擎：整批在数据库内计算，完成后抽样与 Python 参考实现比对
+    """
+    engine = engine or WEIGHT_ENGINE
+    if engine == 'sql':
+        return update_all_users_daily_weight_sql(app)
 
+    with app.app_context():
+        try:
+            start_time = datetime.now(timezone.utc)
+            print(f"[{start_time}] Starting daily weight update task...")
+
+            processed = 0
+            for rows in iter_weight_source_chunks(chunk_size):
+                if not job_lock_held():
+                    print("Job lock lost, stopping weight update.")
+                    break
+                apply_weights(rows)
                 db.session.commit()
-                print(f"Processed {min(i + batch_size, len(users))}/{len(users)} users")
 
-            # 4. 记录任务完成
+                processed += len(rows)
+                add_rows(len(rows))
+                print(f"Processed {processed} users")
+
+            # 3. 记录任务完成
             duration = (datetime.now(timezone.utc) - start_time).total_seconds()
-            print(f"[{datetime.now(timezone.utc)}] Task completed in {duration:.2f}s")
+            print(f"[{datetime.now(timezone.utc)}] Task completed in {duration:.2f}s, {processed} users updated")
 
         except Exception as e:
             db.session.rollback()
+            mark_failed(e)
             error_time = datetime.now(timezone.utc)
             print(f"[{error_time}] Task failed: {str(e)}")
             traceback.print_exc()
@@ -84,84 +151,310 @@ def update_all_users_daily_weight(app):
             # send_alert(f"权重更新失败: {str(e)}")
 
 
+@track_job('update_dirty_users_daily_weight')
+def update_dirty_users_daily_weight(app, chunk_size=WEIGHT_CHUNK_SIZE):
+    """
+    增量更新：只重算脏集合中的用户（积分、连续签到或邀请数发生过变化），
+    全量任务退化为定期对账
+    """
+    with app.app_context():
+        ids = []
+        try:
+            start_time = datetime.now(timezone.utc)
+            # 从未计算过权重的用户（新注册且脏标记丢失）一并纳入
+            restore_dirty_users(db.session.execute(
+                select(WalletUser.id).where(WalletUser.last_weight_update.is_(None))
+            ).scalars().all())
+            processed = 0
+            while job_lock_held():
+                ids = pop_dirty_users(chunk_size)
+                if not ids:
+                    break
+                apply_weights(weight_source_query().filter(WalletUser.id.in_(ids)).all())
+                db.session.commit()
+                processed += len(ids)
+                add_rows(len(ids))
+                ids = []
+
+            duration = (datetime.now(timezone.utc) - start_time).total_seconds()
+            print(f"[{datetime.now(timezone.utc)}] Dirty weight update completed in {duration:.2f}s, {processed} users updated")
+
+        except Exception as e:
+            db.session.rollback()
+            restore_dirty_users(ids)
+            mark_failed(e)
+            print(f"[{datetime.now(timezone.utc)}] Dirty weight update failed: {str(e)}")
+            traceback.print_exc()
+
+
+def apply_weights(rows):
+    """
+    按一块权重源数据计算并批量 UPDATE（不提交）
+    每块单独查询邀请数量（避免超大 IN 列表），整块向量化计算权重
+    """
+    if not rows:
+        return
+    invite_counts = get_invite_counts([row.wallet_address for row in rows])
+    weights = calculate_user_weights_batch(
+        [row.consecutive_days for row in rows],
+        [row.total_points for row in rows],
+        [invite_counts.get(row.wallet_address.lower(), 0) for row in rows]
+    )
+    now = datetime.now(timezone.utc)
+    db.session.execute(update(WalletUser), [
+        {'id': row.id, 'daily_weight': float(weight), 'last_weight_update': now}
+        for row, weight in zip(rows, weights)
+    ])
+
+
+def weight_source_query():
+    """权重所需字段：(id, wallet_address, consecutive_days, total_points)，不加载 checkin_history"""
+    return db.session.query(
+        WalletUser.id,
+        WalletUser.wallet_address,
+        UserPointsAccount.consecutive_days,
+        UserPointsAccount.total_points
+    ).outerjoin(
+        UserPointsAccount, UserPointsAccount.wallet_user_id == WalletUser.id
+    )
+
+
+def iter_weight_source_chunks(chunk_size=WEIGHT_CHUNK_SIZE):
+    """
+    按 id 游标（keyset）分块遍历用户权重所需字段，不加载 checkin_history
+    每块: [(id, wallet_address, consecutive_days, total_points), ...]
+    """
+    last_id = 0
+    while True:
+        rows = weight_source_query().filter(
+            WalletUser.id > last_id
+        ).order_by(
+            WalletUser.id
+        ).limit(chunk_size).all()
+
+        if not rows:
+            return
+
+        yield rows
+        last_id = rows[-1].id
+
+
+def update_all_users_daily_weight_sql(app):
+    with app.app_context():
+        try:
+            start_time = datetime.now(timezone.utc)
+            print(f"[{start_time}] Starting daily weight update task (sql engine)...")
+
+            updated = update_daily_weight_sql(WEIGHT_SQL_CHUNK_SIZE)
+            add_rows(updated)
+
+            duration = (datetime.now(timezone.utc) - start_time).total_seconds()
+            print(f"[{datetime.now(timezone.utc)}] Task completed in {duration:.2f}s, {updated} users updated")
+
+            parity = check_weight_engine_parity(WEIGHT_PARITY_SAMPLE_SIZE)
+            if parity['mismatches']:
+                print(f"Weight engine parity check failed: {len(parity['mismatches'])}/{parity['checked']} mismatches")
+                for mismatch in parity['mismatches'][:20]:
+                    print(f"  {mismatch}")
+            else:
+                print(f"Weight engine parity check passed on {parity['checked']} users")
+
+        except Exception as e:
+            db.session.rollback()
+            mark_failed(e)
+            print(f"[{datetime.now(timezone.utc)}] Task failed: {str(e)}")
+            traceback.print_exc()
+
+
 def get_invite_counts(addresses):
-    """批量获取邀请数量 {address: count}"""
+    """批量获取邀请数量 {address(小写): count}"""
     if not addresses:
         return {}
 
+    # invite_records 中的地址在绑定时已统一转小写
     return dict(db.session.query(
         InviteRecord.inviter_address,
         func.count(InviteRecord.id)
     ).filter(
-        InviteRecord.inviter_address.in_(addresses)
+        InviteRecord.inviter_address.in_([addr.lower() for addr in addresses])
     ).group_by(
         InviteRecord.inviter_address
     ).all())
 
 
 # 计算并终止已挖矿24小时的钱包地址
-def settle_expired_sessions(app):
+SETTLE_CHUNK_SIZE = int(os.getenv('SETTLE_CHUNK_SIZE', 500))
+# 到期索引轮询间隔（秒）；全量对账间隔（分钟），兜底 Redis 索引丢失
+SETTLE_POLL_SECONDS = int(os.getenv('SETTLE_POLL_SECONDS', 10))
+SETTLE_SWEEP_MINUTES = int(os.getenv('SETTLE_SWEEP_MINUTES', 30))
+
+
+@track_job('settle_due_sessions_job')
+def settle_due_sessions_job(app, limit=SETTLE_CHUNK_SIZE):
     with app.app_context():
         try:
-            now = datetime.utcnow()
-            sessions = MiningHistory.query.filter_by(is_settled=False).all()
-
-            for session in sessions:
-                elapsed = (now - session.mined_at).total_seconds()
-                if elapsed >= 86400:
-                    session.end_time = session.mined_at + timedelta(seconds=86400)
-                    session.points_earned = calculate_reward(
-                        session.mined_at,
-                        session.weight_snapshot,
-                        session.end_time
-                    )
-                    session.is_settled = True
-                    session.is_mining = False
-
-                    # 获取用户
-                    user = session.wallet_user
-
-                    # 查询或创建积分账户（加锁防并发）
-                    points_account = UserPointsAccount.query.filter_by(wallet_user_id=user.id).with_for_update().first()
-                    if not points_account:
-                        points_account = UserPointsAccount(
-                            wallet_user_id=user.id,
-                            total_points=0,
-                            consecutive_days=0,
-                            milestone_reached=0
-                        )
-                        db.session.add(points_account)
-
-                    # 更新积分账户
-                    points_account.total_points += Decimal(session.points_earned)
-
-                    # 添加积分记录
-                    points_history = PointsHistory(
-                        wallet_user_id=user.id,
-                        change_type="mining_reward",
-                        change_amount=Decimal(session.points_earned),
-                        description="Mining session reward settled",
-                        created_at=datetime.utcnow()
-                    )
-                    db.session.add(points_history)
-
-            db.session.commit()
-            print(f"[{datetime.utcnow()}] Expired mining sessions settled.")
+            settled = settle_due_sessions(limit)
+            add_rows(settled)
+            if settled:
+                print(f"[{datetime.utcnow()}] Due mining sessions settled: {settled} sessions.")
 
-        except Exception:
+        except Exception as e:
             db.session.rollback()
+            mark_failed(e)
+            print(f"[{datetime.utcnow()}] Settling due sessions failed:")
+            traceback.print_exc()
+
+
+@track_job('settle_expired_sessions')
+def settle_expired_sessions(app, chunk_size=SETTLE_CHUNK_SIZE):
+    with app.app_context():
+        try:
+            settled, users = settle_expired_in_chunks(chunk_size)
+            add_rows(settled)
+            print(f"[{datetime.utcnow()}] Expired mining sessions settled: {settled} sessions, {users} user accounts.")
+
+        except Exception as e:
+            db.session.rollback()
+            mark_failed(e)
             print(f"[{datetime.utcnow()}] Settling expired sessions failed:")
             traceback.print_exc()
 
 
-def start_scheduler(app):
-    scheduler.add_job(lambda: scheduled_withdrawal_job(app), 'interval', hours=24)
-    scheduler.add_job(lambda: distribute_airdrop_job(app), 'interval', minutes=5)
+def rebuild_mining_expiry_index(app):
+    with app.app_context():
+        try:
+            total = rebuild_expiry_index()
+            print(f"[{datetime.utcnow()}] Mining expiry index rebuilt: {total} active sessions.")
+        except Exception:
+            print(f"[{datetime.utcnow()}] Rebuilding mining expiry index failed:")
+            traceback.print_exc()
+
+
+SCHEDULER_LEADER_TTL = int(os.getenv('SCHEDULER_LEADER_TTL', 30))
+SCHEDULER_HEARTBEAT_SECONDS = int(os.getenv('SCHEDULER_HEARTBEAT_SECONDS', 10))
+
+elector = None
+
+
+# 单个任务锁的过期时间（秒），执行期间每 1/3 ttl 续期一次
+SCHEDULER_JOB_LOCK_TTL = int(os.getenv('SCHEDULER_JOB_LOCK_TTL', 60))
+
+
+def leader_only(func, name):
+    """
+    多 worker / 多副本时只有 leader 执行任务（失去领导权到暂停调度之间的兜底），
+    且执行期间持有同名任务锁：领导权切换后旧 leader 上尚未结束的任务不会与新 leader 的同名任务并发
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if elector is not None and not elector.is_leader:
+            return None
+        lock = JobLock(redis_conn, name, ttl=SCHEDULER_JOB_LOCK_TTL, heartbeat=max(1, SCHEDULER_JOB_LOCK_TTL // 3))
+        try:
+            acquired = lock.acquire()
+        except Exception:
+            print(f"[{datetime.now()}] Acquiring job lock for {name} failed, skipped:")
+            traceback.print_exc()
+            return None
+        if not acquired:
+            print(f"[{datetime.now()}] {name} is still running on another instance, skipped")
+            return None
+        with lock:
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _on_job_submitted(event):
+    if event.scheduled_run_times:
+        set_scheduled_time(event.job_id, event.scheduled_run_times[0])
+
+
+def start_scheduler(app, leader_election=True):
+    """
+    注册并启动定时任务
+    leader_election=True 时调度器以暂停状态启动，经 Redis 选主成为 leader 后才恢复执行
+    """
+    global elector
+
+    # 任务 id 与埋点名称一致，用于记录调度延迟
+    scheduler.add_listener(_on_job_submitted, EVENT_JOB_SUBMITTED)
+
+    scheduler.add_job(leader_only(lambda: scheduled_withdrawal_job(app), 'scheduled_withdrawal_job'),
+                      'interval', hours=24, id='scheduled_withdrawal_job')
+    scheduler.add_job(leader_only(lambda: reconcile_withdrawals_job(app), 'reconcile_withdrawals_job'),
+                      'interval', minutes=WITHDRAW_RECONCILE_MINUTES, id='reconcile_withdrawals_job')
+    # drain 模式单次运行直到队列清空（或达到时长上限），每分钟检查一次新提交的地址；运行中的实例不会重叠
+    scheduler.add_job(leader_only(lambda: distribute_airdrop_job(app), 'distribute_airdrop_job'),
+                      'interval', minutes=1 if AIRDROP_MODE == 'drain' else 5, id='distribute_airdrop_job')
     # 每天凌晨0点执行一次挖矿权重更新任务
-    scheduler.add_job(lambda: update_all_users_daily_weight(app), 'cron', hour=0, minute=0)
-    #每5min执行一次
-    scheduler.add_job(lambda: settle_expired_sessions(app), 'interval', minutes=5)
+    if WEIGHT_UPDATE_MODE == 'incremental':
+        scheduler.add_job(leader_only(lambda: update_dirty_users_daily_weight(app), 'update_dirty_users_daily_weight'),
+                          'cron', hour=0, minute=0, id='update_dirty_users_daily_weight')
+        # 全量对账：兜底脏标记丢失（Redis 淘汰 / 写入失败）
+        scheduler.add_job(leader_only(lambda: update_all_users_daily_weight(app), 'update_all_users_daily_weight'),
+                          'cron', day_of_week=WEIGHT_RECONCILE_DAY_OF_WEEK, hour=0, minute=30,
+                          id='update_all_users_daily_weight')
+    else:
+        scheduler.add_job(leader_only(lambda: update_all_users_daily_weight(app), 'update_all_users_daily_weight'),
+                          'cron', hour=0, minute=0, id='update_all_users_daily_weight')
+    if os.getenv('WITHDRAW_CONTRACT_ADDRESS'):
+        scheduler.add_job(leader_only(lambda: watch_withdraw_nonces_job(app), 'watch_withdraw_nonces_job'),
+                          'interval', seconds=NONCE_WATCHER_SECONDS, id='watch_withdraw_nonces_job')
+    scheduler.add_job(leader_only(lambda: ensure_membership(app), 'ensure_airdrop_membership'),
+                      'interval', minutes=AIRDROP_MEMBERSHIP_CHECK_MINUTES, id='ensure_airdrop_membership')
+    # 到期索引轮询：只结算已到期的会话
+    scheduler.add_job(leader_only(lambda: settle_due_sessions_job(app), 'settle_due_sessions_job'),
+                      'interval', seconds=SETTLE_POLL_SECONDS, id='settle_due_sessions_job')
+    # 全量对账：兜底索引丢失的会话
+    scheduler.add_job(leader_only(lambda: settle_expired_sessions(app), 'settle_expired_sessions'),
+                      'interval', minutes=SETTLE_SWEEP_MINUTES, id='settle_expired_sessions')
+
+    if not leader_election:
+        rebuild_mining_expiry_index(app)
+        scheduler.start()
+        print("Scheduler started: withdrawal every 24h, airdrop every 5min")
+        return
+
+    def on_elected():
+        # 新 leader 接管前先重建到期索引
+        rebuild_mining_expiry_index(app)
+        scheduler.resume()
+
+    def on_revoked():
+        scheduler.pause()
+
+    scheduler.start(paused=True)
+    elector = LeaderElector(
+        redis_conn,
+        ttl=SCHEDULER_LEADER_TTL,
+        heartbeat=SCHEDULER_HEARTBEAT_SECONDS,
+        on_elected=on_elected,
+        on_revoked=on_revoked
+    )
+    elector.start()
+    print(f"Scheduler started in standby as {elector.token}, waiting for leader election")
+
+
+def stop_scheduler():
+    if elector is not None:
+        elector.stop()
+    if scheduler.running:
+        scheduler.shutdown(wait=True)
+
+
+if __name__ == '__main__':
+    # 独立容器运行：python -m scheduler
+    import signal
+    import threading
+    from app import create_app
+
+    app = create_app()
+    start_scheduler(app)
 
+    shutdown_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: shutdown_event.set())
+    signal.signal(signal.SIGINT, lambda *_: shutdown_event.set())
+    shutdown_event.wait()
 
-    scheduler.start()
-    print("Scheduler started: withdrawal every 24h, airdrop every 5min")
+    print("Scheduler shutting down...")
+    stop_scheduler()
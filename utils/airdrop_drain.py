@@ -0,0 +1,223 @@
+import os
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from dotenv import load_dotenv
+from sqlalchemy import case, func, select, update
+from extensions import db, redis_conn
+from models import AirdropAddress, TrackedTransaction
+from utils.airdrop_membership import add_distributed
+from utils.leader_election import job_lock_held
+from utils.blockchain_batch_airdrop import submit_batch_airdrop, w3
+from utils.points_distribution import grant_airdrop_points
+from utils.receipt_tracker import track_pending
+from utils.tx_executor import PipelinedTxExecutor
+from utils.weight_dirty import mark_weight_dirty
+
+load_dotenv()
+
+# batch：每次调度只发放 AirdropConfig.batch_size 个地址；drain：持续领取直到待发放队列清空
+AIRDROP_MODE = os.getenv('AIRDROP_MODE', 'batch')
+# drain 模式每批领取的地址数（合约模式下再由批次规划器按 gas 切分为多笔交易）
+AIRDROP_DRAIN_BATCH_SIZE = int(os.getenv('AIRDROP_DRAIN_BATCH_SIZE', '500'))
+# 合约模式同时等待确认的空投交易上限
+AIRDROP_MAX_INFLIGHT_TXS = int(os.getenv('AIRDROP_MAX_INFLIGHT_TXS', '8'))
+# 最早一笔未确认空投交易超过该秒数时暂停领取（确认滞后的背压）
+AIRDROP_MAX_CONFIRM_LAG = int(os.getenv('AIRDROP_MAX_CONFIRM_LAG', '180'))
+AIRDROP_BACKPRESSURE_WAIT = float(os.getenv('AIRDROP_BACKPRESSURE_WAIT', '5'))
+# 单次 drain 运行时长上限，到时退出由下一次调度接续
+AIRDROP_DRAIN_MAX_SECONDS = int(os.getenv('AIRDROP_DRAIN_MAX_SECONDS', '600'))
+
+AIRDROP_PROGRESS_KEY = 'airdrop:drain:progress'
+AIRDROP_PROGRESS_TTL = 86400
+
+
+def claim_pending_addresses(limit):
+    """
+    领取一批待发放地址（FOR UPDATE SKIP LOCKED，并发的发放任务互不阻塞、不会重复领取）
+    锁持有到调用方提交
+    :return: [(id, address), ...]
+    """
+    return db.session.execute(
+        select(AirdropAddress.id, AirdropAddress.address)
+        .where(AirdropAddress.is_distributed == False)
+        .order_by(AirdropAddress.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    ).all()
+
+
+def submit_airdrop_rows(rows, executor=None):
+    """
+    合约空投一批已领取的地址：
+    1. 先置已发放（distributed_at 为空表示等待上链确认）并提交，广播后即使登记失败也不会被重复发放
+    2. 广播并登记到回执追踪服务（回执处理见 blueprints.airdrop.on_airdrop_batch_receipt）
+    3. 未广播的恢复为未发放
+    :return: 已广播的地址 id 列表
+    """
+    address_ids = [row.id for row in rows]
+    db.session.execute(
+        update(AirdropAddress)
+        .where(AirdropAddress.id.in_(address_ids))
+        .values(is_distributed=True, distributed_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+    # 链上按 gas 预算自动切分交易
+    try:
+        submitted = submit_batch_airdrop([row.address for row in rows], executor)
+    except Exception as e:
+        print(f"Airdrop broadcast failed: {str(e)}")
+        submitted = []
+
+    tracked_ids = []
+    for indexes, tx in submitted:
+        ids = [address_ids[i] for i in indexes]
+        track_pending(tx, 'airdrop_batch', ids)
+        tracked_ids.extend(ids)
+
+    unsent_ids = sorted(set(address_ids) - set(tracked_ids))
+    if unsent_ids:
+        db.session.execute(
+            update(AirdropAddress)
+            .where(AirdropAddress.id.in_(unsent_ids))
+            .values(is_distributed=False)
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+    return tracked_ids
+
+
+def inflight_airdrop_txs():
+    """等待确认的空投交易：(笔数, 最早登记时间)"""
+    return db.session.query(
+        func.count(TrackedTransaction.id),
+        func.min(TrackedTransaction.created_at)
+    ).filter(
+        TrackedTransaction.status == 'pending',
+        TrackedTransaction.kind == 'airdrop_batch'
+    ).one()
+
+
+def wait_for_confirmations(deadline, max_inflight=AIRDROP_MAX_INFLIGHT_TXS, max_lag=AIRDROP_MAX_CONFIRM_LAG):
+    """
+    背压：在途交易达到上限或最早一笔确认滞后时等待回执追踪服务追上
+    :return: False 表示等到截止时间仍未恢复
+    """
+    while True:
+        inflight, oldest = inflight_airdrop_txs()
+        # 读完立即结束事务，等待期间不持有快照
+        db.session.commit()
+        lag = (datetime.utcnow() - oldest).total_seconds() if oldest else 0
+        if inflight < max_inflight and lag <= max_lag:
+            return True
+        update_progress(state='backpressure', inflight=inflight, confirm_lag=int(lag))
+        if time.monotonic() + AIRDROP_BACKPRESSURE_WAIT > deadline:
+            return False
+        time.sleep(AIRDROP_BACKPRESSURE_WAIT)
+
+
+def drain_airdrop(config, batch_size=AIRDROP_DRAIN_BATCH_SIZE, max_seconds=AIRDROP_DRAIN_MAX_SECONDS):
+    """
+    持续领取并发放待发放地址，直到队列清空或达到单次运行时长
+    - points：每批一个事务，入账与地址标记全部成功或全部回滚
+    - contract：同一执行器本地连续分配 nonce，多批交易在链上并行等待确认；
+      在途交易数 / 确认滞后超过阈值时暂停领取
+    :return: 本次发放（或已广播）的地址数
+    """
+    distribution_type = config.distribution_type or 'points'
+    airdrop_amount = int(config.airdrop_amount) if config.airdrop_amount else 0
+    deadline = time.monotonic() + max_seconds
+    executor = PipelinedTxExecutor(w3) if distribution_type == 'contract' else None
+
+    processed = 0
+    update_progress(state='running', mode=distribution_type, run_started_at=datetime.now(timezone.utc).isoformat(),
+                    run_processed=0)
+    try:
+        while time.monotonic() < deadline:
+            if not job_lock_held():
+                print("Airdrop drain stopped: job lock lost.")
+                break
+            if executor is not None and not wait_for_confirmations(deadline):
+                break
+
+            rows = claim_pending_addresses(batch_size)
+            if not rows:
+                db.session.commit()
+                break
+
+            if distribution_type == 'points':
+                # 这里假设airdrop_amount是字符串类型wei，转换成Decimal积分
+                try:
+                    credited_ids, granted = grant_airdrop_points([row.address for row in rows],
+                                                                 Decimal(airdrop_amount) / Decimal(1e18))
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+                mark_weight_dirty(*credited_ids)
+                add_distributed(*granted)
+                done = len(granted)
+            else:
+                done = len(submit_airdrop_rows(rows, executor))
+                if not done:
+                    # 整批广播失败（授权 / RPC 异常），退出等待下次调度，避免空转
+                    print("Airdrop drain stopped: batch broadcast failed.")
+                    break
+
+            processed += done
+            update_progress(state='running', run_processed=processed)
+            print(f"Airdrop drain: {done}/{len(rows)} addresses in batch, {processed} this run")
+    finally:
+        update_progress(state='idle', run_processed=processed, run_finished_at=datetime.now(timezone.utc).isoformat())
+    return processed
+
+
+def update_progress(**fields):
+    """运行状态写入 Redis（管理端轮询），写入失败不影响发放"""
+    fields['updated_at'] = datetime.now(timezone.utc).isoformat()
+    try:
+        pipe = redis_conn.pipeline()
+        pipe.hset(AIRDROP_PROGRESS_KEY, mapping={k: str(v) for k, v in fields.items()})
+        pipe.expire(AIRDROP_PROGRESS_KEY, AIRDROP_PROGRESS_TTL)
+        pipe.execute()
+    except Exception as e:
+        print(f"Failed to update airdrop progress: {e}")
+
+
+def load_progress():
+    """
+    发放进度：地址计数以数据库为准，运行状态来自 Redis（可能已被淘汰）
+    in_flight 为合约模式已广播、等待上链确认的地址
+    """
+    pending, in_flight, distributed = db.session.query(
+        func.coalesce(func.sum(case((AirdropAddress.is_distributed == False, 1), else_=0)), 0),
+        func.coalesce(func.sum(case(
+            ((AirdropAddress.is_distributed == True) & AirdropAddress.distributed_at.is_(None), 1),
+            else_=0
+        )), 0),
+        func.coalesce(func.sum(case(
+            ((AirdropAddress.is_distributed == True) & AirdropAddress.distributed_at.isnot(None), 1),
+            else_=0
+        )), 0)
+    ).one()
+    inflight_txs, oldest = inflight_airdrop_txs()
+
+    try:
+        run = redis_conn.hgetall(AIRDROP_PROGRESS_KEY) or {}
+        run = {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+               for k, v in run.items()}
+    except Exception as e:
+        print(f"Failed to load airdrop progress: {e}")
+        run = {}
+
+    return {
+        'mode': AIRDROP_MODE,
+        'pending': int(pending),
+        'in_flight': int(in_flight),
+        'distributed': int(distributed),
+        'inflight_txs': inflight_txs,
+        'oldest_inflight_at': oldest.isoformat() if oldest else None,
+        'run': run
+    }
@@ -0,0 +1,180 @@
+import csv
+import json
+import os
+from datetime import datetime, timezone
+import numpy as np
+from eth_hash.auto import keccak
+from sqlalchemy import insert
+from extensions import db
+from models import AirdropAddress
+from utils.airdrop_membership import add_submitted
+
+# 每次校验 / 提交的行数（一个事务）
+AIRDROP_IMPORT_CHUNK_SIZE = int(os.getenv('AIRDROP_IMPORT_CHUNK_SIZE', '5000'))
+# 每条多行 INSERT IGNORE 的行数
+AIRDROP_IMPORT_INSERT_SIZE = int(os.getenv('AIRDROP_IMPORT_INSERT_SIZE', '1000'))
+# 报告中保留的无效行样例数
+INVALID_SAMPLE_SIZE = 20
+
+COMMENT_MAX_LENGTH = 100  # 与 airdrop_addresses.comment 列宽一致
+
+# 十六进制字符查表：HEX_TABLE[byte] 为 True 表示 0-9a-fA-F
+HEX_TABLE = np.zeros(256, dtype=bool)
+HEX_TABLE[np.frombuffer(b'0123456789abcdefABCDEF', dtype=np.uint8)] = True
+
+
+def validate_addresses(addresses):
+    """
+    向量化校验地址格式（0x + 40 位十六进制），等价于逐条 ^0x[a-fA-F0-9]{40}$
+    :return: bool 数组
+    """
+    if not addresses:
+        return np.zeros(0, dtype=bool)
+    raw = np.array(addresses, dtype=object)
+    lengths = np.fromiter((len(a) for a in addresses), dtype=np.int64, count=len(addresses))
+    ascii_ok = np.fromiter((a.isascii() for a in addresses), dtype=bool, count=len(addresses))
+    valid = (lengths == 42) & ascii_ok
+
+    candidates = raw[valid].astype('S42')
+    chars = candidates.view(np.uint8).reshape(-1, 42)
+    prefix_ok = (chars[:, 0] == ord('0')) & (chars[:, 1] == ord('x'))
+    hex_ok = HEX_TABLE[chars[:, 2:]].all(axis=1)
+    valid[valid] = prefix_ok & hex_ok
+    return valid
+
+
+def checksum_addresses(addresses):
+    """
+    批量转换为 EIP-55 校验和格式（每个地址一次 keccak，大小写映射向量化）
+    大小写混合的输入必须与校验和一致，否则对应位置为 None
+    :param addresses: 已通过 validate_addresses 的地址列表
+    """
+    if not addresses:
+        return []
+    original = np.array([address[2:] for address in addresses], dtype='S40').view(np.uint8).reshape(-1, 40)
+    lower = np.where((original >= ord('A')) & (original <= ord('F')), original + 32, original).astype(np.uint8)
+
+    digests = np.frombuffer(
+        b''.join(keccak(row.tobytes()) for row in lower), dtype=np.uint8
+    ).reshape(-1, 32)[:, :20]
+    nibbles = np.empty((len(addresses), 40), dtype=np.uint8)
+    nibbles[:, 0::2] = digests >> 4
+    nibbles[:, 1::2] = digests & 0x0F
+
+    # 哈希对应半字节 >= 8 的字母位大写
+    checksummed = np.where((nibbles >= 8) & (lower >= ord('a')), lower - 32, lower).astype(np.uint8)
+
+    has_lower = ((original >= ord('a')) & (original <= ord('f'))).any(axis=1)
+    has_upper = ((original >= ord('A')) & (original <= ord('F'))).any(axis=1)
+    bad_checksum = has_lower & has_upper & (original != checksummed).any(axis=1)
+
+    bodies = checksummed.view('S40').ravel()
+    return [None if bad else '0x' + body.decode() for body, bad in zip(bodies, bad_checksum)]
+
+
+def iter_rows(stream, fmt):
+    """
+    逐行解析上传文件，产出 (address, comment)；无法解析的行产出 (None, None)
+    csv：有表头时按 address / comment 列取值，否则取前两列
+    ndjson：每行一个 {"address": ..., "comment": ...} 对象或地址字符串
+    """
+    # 逐行解码（Python 3.10 的 SpooledTemporaryFile 不支持 TextIOWrapper 包装），utf-8-sig 去掉 BOM
+    text = (line.decode('utf-8-sig', errors='replace') for line in stream)
+    if fmt == 'ndjson':
+        for line in text:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                yield None, None
+                continue
+            if isinstance(item, str):
+                yield item.strip(), ''
+            elif isinstance(item, dict) and isinstance(item.get('address'), str):
+                yield item['address'].strip(), str(item.get('comment') or '').strip()
+            else:
+                yield None, None
+        return
+
+    reader = csv.reader(text)
+    address_col, comment_col = 0, 1
+    for number, row in enumerate(reader):
+        if not row:
+            continue
+        if number == 0 and not row[0].strip().lower().startswith('0x'):
+            header = [cell.strip().lower() for cell in row]
+            address_col = header.index('address') if 'address' in header else 0
+            comment_col = header.index('comment') if 'comment' in header else None
+            continue
+        address = row[address_col].strip() if len(row) > address_col else ''
+        comment = row[comment_col].strip() if comment_col is not None and len(row) > comment_col else ''
+        yield address, comment
+
+
+def import_addresses(stream, fmt):
+    """
+    流式导入空投地址：按块向量化校验 → 校验和规范化 → 文件内去重 → 分块 INSERT IGNORE（与表内已有地址去重）
+    每块一个事务；内存占用为一块数据加文件内已出现地址集合
+    :return: 统计 {'total', 'inserted', 'duplicates', 'invalid', 'invalid_samples'}
+    """
+    report = {'total': 0, 'inserted': 0, 'duplicates': 0, 'invalid': 0, 'invalid_samples': []}
+    seen = set()
+    chunk = []
+    for line_number, (address, comment) in enumerate(iter_rows(stream, fmt), start=1):
+        chunk.append((line_number, address, comment))
+        if len(chunk) >= AIRDROP_IMPORT_CHUNK_SIZE:
+            _import_chunk(chunk, seen, report)
+            chunk = []
+    if chunk:
+        _import_chunk(chunk, seen, report)
+    return report
+
+
+def _import_chunk(chunk, seen, report):
+    report['total'] += len(chunk)
+    valid = validate_addresses([address or '' for _, address, _ in chunk])
+
+    checksummed_valid = iter(checksum_addresses([address for (_, address, _), ok in zip(chunk, valid) if ok]))
+
+    now = datetime.now(timezone.utc)
+    rows = []
+    for (line_number, address, comment), ok in zip(chunk, valid):
+        checksummed = next(checksummed_valid) if ok else None
+        if checksummed is None:
+            report['invalid'] += 1
+            if len(report['invalid_samples']) < INVALID_SAMPLE_SIZE:
+                report['invalid_samples'].append({'line': line_number, 'address': address})
+            continue
+        key = checksummed.lower()
+        if key in seen:
+            report['duplicates'] += 1
+            continue
+        seen.add(key)
+        rows.append({
+            'address': checksummed,
+            'comment': comment[:COMMENT_MAX_LENGTH],
+            'submitted_at': now,
+            'is_distributed': False
+        })
+
+    if not rows:
+        return
+
+    inserted = 0
+    try:
+        for i in range(0, len(rows), AIRDROP_IMPORT_INSERT_SIZE):
+            # 唯一约束冲突（表内已有地址）的行被忽略，受影响行数即实际插入数
+            inserted += db.session.execute(
+                insert(AirdropAddress).prefix_with('IGNORE').values(rows[i:i + AIRDROP_IMPORT_INSERT_SIZE])
+            ).rowcount
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    report['inserted'] += inserted
+    report['duplicates'] += len(rows) - inserted
+    # 无论新插入还是已存在，这些地址此时都在表中
+    add_submitted(*[row['address'] for row in rows])
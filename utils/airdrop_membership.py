@@ -0,0 +1,169 @@
+import os
+from flask import current_app
+from extensions import db, redis_conn
+from models import AirdropAddress
+
+# 空投地址成员缓存（小写地址）：已提交 / 已确认发放
+# 地址表只增不删、确认发放不可逆，集合中存在即可信；已提交集合中不存在只有在集合完整时才可信
+AIRDROP_SUBMITTED_KEY = 'airdrop:submitted'
+AIRDROP_DISTRIBUTED_KEY = 'airdrop:distributed'
+# 完整标记作为集合成员保存：集合被 LRU 淘汰或增量写入失败时标记随之消失，自动回退数据库
+READY_MEMBER = '__ready__'
+WARM_LOCK_KEY = 'airdrop:membership:warming'
+AIRDROP_MEMBERSHIP_WARM_CHUNK = int(os.getenv('AIRDROP_MEMBERSHIP_WARM_CHUNK', '5000'))
+WARM_LOCK_TTL = 600
+# 单次增量写入的地址数（Lua unpack 参数个数有上限）
+MEMBERSHIP_ADD_CHUNK = 1000
+
+# 写入正式集合；预热进行中（临时 key 存在）时同时写入临时 key，RENAME 替换后不丢失
+_ADD_SCRIPT = """
+redis.call('sadd', KEYS[1], unpack(ARGV))
+if redis.call('exists', KEYS[2]) == 1 then
+    redis.call('sadd', KEYS[2], unpack(ARGV))
+end
+return 1
+"""
+_add_script = redis_conn.register_script(_ADD_SCRIPT)
+
+
+def _warming_key(key):
+    return f"{key}:warming"
+
+
+def check_membership(address):
+    """
+    一次往返查询地址的提交 / 发放状态
+    :return: (submitted, distributed)
+      submitted: True / False；集合不完整（未预热 / 写入失败）且地址不在集合中、或 Redis 不可用时为 None
+      distributed: True 表示已确认发放（单独可信，不依赖已提交集合）；未发放、等待上链确认或未知时为 None
+    """
+    member = address.lower()
+    try:
+        pipe = redis_conn.pipeline(transaction=False)
+        pipe.sismember(AIRDROP_SUBMITTED_KEY, READY_MEMBER)
+        pipe.sismember(AIRDROP_SUBMITTED_KEY, member)
+        pipe.sismember(AIRDROP_DISTRIBUTED_KEY, member)
+        submitted_ready, submitted, distributed = pipe.execute()
+    except Exception as e:
+        current_app.logger.warning(f"Airdrop membership lookup failed for {address}: {e}")
+        return None, None
+
+    if distributed:
+        return True, True
+    if submitted:
+        return True, None
+    return (False if submitted_ready else None), None
+
+
+def add_submitted(*addresses):
+    """地址写入数据库并提交后调用；写入失败时移除完整标记（集合不再可信），查询回退数据库直到重新预热"""
+    if not _add(AIRDROP_SUBMITTED_KEY, addresses):
+        try:
+            redis_conn.srem(AIRDROP_SUBMITTED_KEY, READY_MEMBER)
+        except Exception as e:
+            current_app.logger.warning(f"Airdrop membership ready marker removal failed: {e}")
+
+
+def add_distributed(*addresses):
+    """发放确认（积分入账提交 / 合约回执成功）后调用"""
+    _add(AIRDROP_DISTRIBUTED_KEY, addresses)
+
+
+def _add(key, addresses):
+    """:return: False 表示写入失败"""
+    members = [address.lower() for address in addresses]
+    try:
+        for i in range(0, len(members), MEMBERSHIP_ADD_CHUNK):
+            _add_script(keys=[key, _warming_key(key)], args=members[i:i + MEMBERSHIP_ADD_CHUNK])
+    except Exception as e:
+        current_app.logger.warning(f"Airdrop membership update failed for {len(addresses)} addresses: {e}")
+        return False
+    return True
+
+
+def warm_membership(chunk_size=AIRDROP_MEMBERSHIP_WARM_CHUNK):
+    """
+    从 airdrop_addresses 重建两个集合：按 id 游标分块写入临时 key，RENAME 原子替换后补写预热期间新增的行
+    临时 key 在扫描前创建，预热期间的增量写入同时进入临时 key（见 _add），替换后不丢失
+    临时 key 带过期时间，预热中断时自动清理
+    :return: 地址总数
+    """
+    warming_submitted = _warming_key(AIRDROP_SUBMITTED_KEY)
+    warming_distributed = _warming_key(AIRDROP_DISTRIBUTED_KEY)
+    pipe = redis_conn.pipeline()
+    pipe.delete(warming_submitted, warming_distributed)
+    # 两个临时 key 都写入标记（同时保证扫描前 key 已存在、RENAME 时 key 一定存在）
+    pipe.sadd(warming_submitted, READY_MEMBER)
+    pipe.sadd(warming_distributed, READY_MEMBER)
+    pipe.expire(warming_submitted, WARM_LOCK_TTL)
+    pipe.expire(warming_distributed, WARM_LOCK_TTL)
+    pipe.execute()
+
+    last_id = 0
+    total = 0
+    while True:
+        rows = _address_chunk(last_id, chunk_size)
+        if not rows:
+            break
+        _sadd_rows(warming_submitted, warming_distributed, rows)
+        last_id = rows[-1].id
+        total += len(rows)
+
+    # RENAME 会带上临时 key 的过期时间，替换后移除
+    pipe = redis_conn.pipeline()
+    pipe.rename(warming_submitted, AIRDROP_SUBMITTED_KEY)
+    pipe.rename(warming_distributed, AIRDROP_DISTRIBUTED_KEY)
+    pipe.persist(AIRDROP_SUBMITTED_KEY)
+    pipe.persist(AIRDROP_DISTRIBUTED_KEY)
+    pipe.execute()
+
+    # 补写扫描结束到替换之间新增的行
+    while True:
+        rows = _address_chunk(last_id, chunk_size)
+        if not rows:
+            break
+        _sadd_rows(AIRDROP_SUBMITTED_KEY, AIRDROP_DISTRIBUTED_KEY, rows)
+        last_id = rows[-1].id
+        total += len(rows)
+    db.session.commit()
+    return total
+
+
+def _address_chunk(last_id, chunk_size):
+    return db.session.query(
+        AirdropAddress.id,
+        AirdropAddress.address,
+        AirdropAddress.distributed_at
+    ).filter(
+        AirdropAddress.id > last_id
+    ).order_by(
+        AirdropAddress.id
+    ).limit(chunk_size).all()
+
+
+def _sadd_rows(submitted_key, distributed_key, rows):
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.sadd(submitted_key, *[row.address.lower() for row in rows])
+    # distributed_at 非空即已确认发放（合约发放等待确认期间为空）
+    distributed = [row.address.lower() for row in rows if row.distributed_at is not None]
+    if distributed:
+        pipe.sadd(distributed_key, *distributed)
+    pipe.execute()
+
+
+def ensure_membership(app):
+    """集合缺失（首次启动 / 被淘汰）时预热；多进程经 Redis 锁只预热一次"""
+    with app.app_context():
+        try:
+            if redis_conn.sismember(AIRDROP_SUBMITTED_KEY, READY_MEMBER):
+                return
+            if not redis_conn.set(WARM_LOCK_KEY, 1, nx=True, ex=WARM_LOCK_TTL):
+                return
+            try:
+                total = warm_membership()
+                print(f"Airdrop membership cache warmed: {total} addresses")
+            finally:
+                redis_conn.delete(WARM_LOCK_KEY)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Airdrop membership warm-up failed: {e}")
@@ -0,0 +1,91 @@
+import os
+import threading
+from dotenv import load_dotenv
+from utils.chain_batch import get_transaction_counts
+
+load_dotenv()
+
+# 授权不足时按本次需求的倍数一次性补足，后续批次无需再 approve（1 表示只授权本次所需）
+ALLOWANCE_TOPUP_MULTIPLIER = int(os.getenv('ALLOWANCE_TOPUP_MULTIPLIER', '10'))
+
+
+class AllowanceManager:
+    """
+    累计授权管理（owner -> spender）
+    - 本地记录剩余授权，每次广播消费后扣减，足够时不发 approve
+    - 不足时先读链上 allowance() 校准，仍不足才 approve(need * 倍数)
+      链上读数不含已广播未上链的消费，校准时扣除本进程在途交易的金额（按发送方 nonce 判断是否已上链）
+    - 消费交易失败/回滚时 invalidate()，下次从链上重新读取
+    """
+
+    def __init__(self, w3, token_contract, owner_account, spender, topup_multiplier=ALLOWANCE_TOPUP_MULTIPLIER):
+        self.w3 = w3
+        self.token = token_contract
+        self.owner = owner_account
+        self.spender = spender
+        self.topup_multiplier = max(1, topup_multiplier)
+        self._remaining = None
+        # 在途消费：(发送方, nonce) -> 金额
+        self._in_flight = {}
+        self._lock = threading.RLock()
+
+    def remaining(self, refresh=False):
+        with self._lock:
+            if self._remaining is None or refresh:
+                # 先读 nonce 再读授权：两次读取之间上链的交易只会被多扣一次（偏保守，最多多一次 approve）
+                in_flight = self._in_flight_amount()
+                self._remaining = self.token.functions.allowance(self.owner.address, self.spender).call() - in_flight
+            return self._remaining
+
+    def _in_flight_amount(self):
+        """清理已上链（发送方 nonce 已越过）的在途消费，返回剩余在途总额"""
+        if not self._in_flight:
+            return 0
+        mined_nonces = get_transaction_counts(sorted({sender for sender, _ in self._in_flight}), 'latest')
+        self._in_flight = {
+            (sender, nonce): amount
+            for (sender, nonce), amount in self._in_flight.items()
+            if nonce >= mined_nonces.get(sender, -1)
+        }
+        return sum(self._in_flight.values())
+
+    def ensure(self, executor, need):
+        """
+        保证剩余授权 >= need，必要时通过 executor 发送 approve 并等待确认
+        :return: True 表示授权已足够
+        """
+        with self._lock:
+            if self.remaining() >= need:
+                return True
+            if self.remaining(refresh=True) >= need:
+                return True
+
+            # approve 是覆盖写：在途消费上链后仍会从新授权中扣减，一并计入
+            target = need * self.topup_multiplier + sum(self._in_flight.values())
+            print(f"Allowance {self._remaining} below need {need}, approving {target} for {self.spender}")
+            approve = executor.send(
+                self.owner,
+                self.token.functions.approve(self.spender, target),
+                label='approve'
+            )
+            executor.wait_all([approve])
+            if not approve.succeeded:
+                self._remaining = None
+                print("Approve transaction not confirmed.")
+                return False
+            # approve 覆盖写为 target，之后上链的在途消费仍会从中扣减
+            self._remaining = target - self._in_flight_amount()
+            print("Approve transaction confirmed.")
+            return True
+
+    def consume(self, amount, tx=None):
+        """消费交易广播后调用；tx 为对应的 PendingTx，上链前其金额在链上校准时扣除"""
+        with self._lock:
+            if self._remaining is not None:
+                self._remaining -= amount
+            if tx is not None:
+                self._in_flight[(tx.account.address, tx.nonce)] = amount
+
+    def invalidate(self):
+        with self._lock:
+            self._remaining = None
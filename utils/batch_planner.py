@@ -0,0 +1,119 @@
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 单笔批量交易最多占用区块 gasLimit 的比例
+BATCH_GAS_FRACTION = float(os.getenv('BATCH_GAS_FRACTION', '0.25'))
+# 单笔交易收款人数上限（合约循环/日志体积的保守上界）
+BATCH_MAX_RECIPIENTS = int(os.getenv('BATCH_MAX_RECIPIENTS', '500'))
+# 标定边际 gas 时的探测批次大小
+BATCH_PROBE_SIZE = int(os.getenv('BATCH_PROBE_SIZE', '10'))
+
+
+class BatchPlanner:
+    """
+    按 gas 估算动态切分批量交易
+    - 首次用 1 人 / BATCH_PROBE_SIZE 人两次 estimate_gas 标定固定开销与每人边际 gas
+    - 按 gasLimit * BATCH_GAS_FRACTION 计算每笔容量并逐笔校验估算
+    - 估算回滚或超出预算时二分，单人仍回滚则剔除（留待下次重试）
+    - 每次成功估算都修正边际 gas（进程内跨任务复用）
+    """
+
+    def __init__(self, w3, gas_fraction=BATCH_GAS_FRACTION, max_size=BATCH_MAX_RECIPIENTS,
+                 probe_size=BATCH_PROBE_SIZE):
+        self.w3 = w3
+        self.gas_fraction = gas_fraction
+        self.max_size = max_size
+        self.probe_size = max(2, probe_size)
+        self.base_gas = None
+        self.marginal_gas = None
+        self._lock = threading.Lock()
+
+    def gas_budget(self):
+        return int(self.w3.eth.get_block('latest')['gasLimit'] * self.gas_fraction)
+
+    def capacity(self, budget):
+        if not self.marginal_gas:
+            return min(self.probe_size, self.max_size)
+        size = int((budget - self.base_gas) / self.marginal_gas)
+        return max(1, min(size, self.max_size))
+
+    def plan(self, sender, build_call, items):
+        """
+        :param sender: 发送地址（估算 gas 用）
+        :param build_call: chunk -> 合约函数调用对象
+        :param items: 待发放条目列表
+        :return: ([(chunk, gas_estimate), ...] 按原顺序, [被剔除条目])
+        """
+        if not items:
+            return [], []
+
+        with self._lock:
+            budget = self.gas_budget()
+            if self.marginal_gas is None:
+                self._calibrate(sender, build_call, items)
+
+            size = self.capacity(budget)
+            stack = [items[i:i + size] for i in range(0, len(items), size)][::-1]
+            planned = []
+            rejected = []
+
+            while stack:
+                chunk = stack.pop()
+                try:
+                    gas = build_call(chunk).estimate_gas({'from': sender})
+                except Exception as e:
+                    if len(chunk) == 1:
+                        print(f"Batch planner rejected item after estimate revert: {e}")
+                        rejected.extend(chunk)
+                        continue
+                    self._split(stack, chunk)
+                    continue
+
+                if gas > budget and len(chunk) > 1:
+                    self._split(stack, chunk)
+                    continue
+
+                self._observe(len(chunk), gas)
+                planned.append((chunk, gas))
+
+            print(f"Batch planner: {len(items)} items -> {len(planned)} txs "
+                  f"(budget={budget}, base={self.base_gas}, marginal={self.marginal_gas}), {len(rejected)} rejected")
+            return planned, rejected
+
+    @staticmethod
+    def _split(stack, chunk):
+        mid = len(chunk) // 2
+        # 后半段先入栈，保证按原顺序出栈
+        stack.append(chunk[mid:])
+        stack.append(chunk[:mid])
+
+    def _calibrate(self, sender, build_call, items):
+        probe = min(self.probe_size, len(items))
+        try:
+            gas_one = build_call(items[:1]).estimate_gas({'from': sender})
+            if probe < 2:
+                self.base_gas = gas_one
+                return
+            gas_probe = build_call(items[:probe]).estimate_gas({'from': sender})
+        except Exception as e:
+            # 标定失败时先按探测批次大小切分，由后续成功估算学习
+            print(f"Batch planner calibration failed: {e}")
+            return
+        self.marginal_gas = max(1, (gas_probe - gas_one) / (probe - 1))
+        self.base_gas = max(0, gas_one - self.marginal_gas)
+
+    def _observe(self, size, gas):
+        if self.base_gas is None:
+            self.base_gas = gas if size == 1 else None
+            return
+        if size < 2:
+            return
+        per_item = max(1, (gas - self.base_gas) / size)
+        if self.marginal_gas is None:
+            self.marginal_gas = per_item
+        else:
+            # 取偏保守的滑动平均：边际上升立即跟随，下降缓慢回落
+            self.marginal_gas = max(per_item, 0.8 * self.marginal_gas + 0.2 * per_item)
@@ -1,100 +1,138 @@
-from web3 import Web3
-import json
 import os
 import traceback
 from web3.exceptions import ContractLogicError
 from dotenv import load_dotenv
 from models import AirdropConfig
+from utils.chain_client import get_w3, get_contract, get_account
+from utils.tx_executor import PipelinedTxExecutor
+from utils.allowance_manager import AllowanceManager
+from utils.batch_planner import BatchPlanner
 
 # 加载 .envlocal 配置
 load_dotenv()
 
 # 环境变量
-WEB3_PROVIDER = os.getenv('WEB3_PROVIDER')
 DEV_PRIVATE_KEY = os.getenv('DEV_PRIVATE_KEY')
 AIRDROP_CONTRACT_ADDRESS = os.getenv('AIRDROP_CONTRACT_ADDRESS')
 COMMUNITY_PRIVATE_KEY = os.getenv('COMMUNITY_PRIVATE_KEY')
 MEMAO_TOKEN_ADDRESS = os.getenv('MEMAO_TOKEN_ADDRESS')
 
-# 连接区块链
-w3 = Web3(Web3.HTTPProvider(WEB3_PROVIDER))
+# 共享连接池的 Web3 实例
+w3 = get_w3()
 
-# ABI 路径
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-ABIS_DIR = os.path.join(BASE_DIR, '..', 'abis')
 
-# 加载 Airdrop 合约 ABI
-with open(os.path.join(ABIS_DIR, 'Airdrop_ABI.json'), 'r') as f:
-    AIRDROP_ABI = json.load(f)
-
-with open(os.path.join(ABIS_DIR, 'MEMAO_ABI.json'), 'r') as f:
-    ERC20_ABI = json.load(f)
 def get_airdrop_amount_from_config():
     config = AirdropConfig.query.first()
     if config and config.airdrop_amount:
         return int(config.airdrop_amount)
     return 0  # 默认 0 wei
+
+
+_airdrop_allowance = None
+
+# 按 gas 估算切分 airdrop（进程内复用已学习的边际 gas）
+airdrop_planner = BatchPlanner(w3)
+
+
+def get_airdrop_allowance():
+    """社区账户对 Airdrop 合约的累计授权（进程内复用，跨次任务本地记账）"""
+    global _airdrop_allowance
+    if _airdrop_allowance is None:
+        _airdrop_allowance = AllowanceManager(
+            w3,
+            get_contract(MEMAO_TOKEN_ADDRESS, 'MEMAO_ABI.json'),
+            get_account(COMMUNITY_PRIVATE_KEY),
+            AIRDROP_CONTRACT_ADDRESS
+        )
+    return _airdrop_allowance
+
+
+def invalidate_airdrop_allowance():
+    if _airdrop_allowance is not None:
+        _airdrop_allowance.invalidate()
+
+
+def submit_batch_airdrop(recipients, executor=None):
+    """
+    合约空投（只广播，不等待回执）：累计授权不足时 approve 一次，按 gas 估算切分为尽量满的交易后连续广播
+    返回: [(地址下标列表, PendingTx), ...]，未出现在其中的地址本次未广播
+    """
+    if not recipients:
+        return []
+
+    airdrop_allowance = get_airdrop_allowance()
+    dev_account = get_account(DEV_PRIVATE_KEY)
+    airdrop_contract = get_contract(AIRDROP_CONTRACT_ADDRESS, 'Airdrop_ABI.json')
+    executor = executor or PipelinedTxExecutor(w3)
+    executor.nonces.prime([airdrop_allowance.owner.address, dev_account.address])
+
+    # 读取数据库空投数量（int）
+    airdrop_amount = get_airdrop_amount_from_config()
+    items = [(index, w3.to_checksum_address(addr)) for index, addr in enumerate(recipients)]
+
+    total_amount = airdrop_amount * len(items)
+
+    # Step 1: 剩余累计授权不足时才 approve
+    if not airdrop_allowance.ensure(executor, total_amount):
+        return []
+
+    # Step 2: 按 gas 预算切分
+    def build_call(chunk):
+        return airdrop_contract.functions.airdrop(
+            [addr for _, addr in chunk], [airdrop_amount for _ in chunk]
+        )
+
+    planned, rejected = airdrop_planner.plan(dev_account.address, build_call, items)
+    if rejected:
+        print(f"{len(rejected)} airdrop addresses rejected by gas estimation.")
+        # 估算回滚可能是本地记账的授权已不准（回执在其他进程处理），下次从链上校准
+        invalidate_airdrop_allowance()
+
+    # Step 3: 执行空投，连续广播
+    submitted = []
+    for number, (chunk, gas_estimate) in enumerate(planned, start=1):
+        try:
+            tx = executor.send(dev_account, build_call(chunk), label=f'airdrop {number}', gas_estimate=gas_estimate)
+            airdrop_allowance.consume(airdrop_amount * len(chunk), tx)
+            submitted.append(([index for index, _ in chunk], tx))
+        except Exception as e:
+            print(f"Airdrop batch {number} broadcast failed: {str(e)}")
+            traceback.print_exc()
+
+    print(f"Airdrop submitted: {sum(len(indexes) for indexes, _ in submitted)}/{len(recipients)} "
+          f"addresses in {len(submitted)} txs.")
+    return submitted
+
+
 def blockchain_batch_airdrop(recipients,amount):
+    """
+    合约空投并在当前线程等待全部回执
+    定时任务改为 submit_batch_airdrop + 回执追踪服务，此函数保留给需要同步结果的调用方
+    返回: 与 recipients 顺序一致的 bool 列表，True 表示该地址已上链成功
+    """
+    results = [False] * len(recipients)
     try:
-        recipients = [w3.to_checksum_address(addr) for addr in recipients]
-
-        community_account = w3.eth.account.from_key(COMMUNITY_PRIVATE_KEY)
-        dev_account = w3.eth.account.from_key(DEV_PRIVATE_KEY)
-
-        # 加载代币合约
-        token_contract = w3.eth.contract(address=MEMAO_TOKEN_ADDRESS, abi=ERC20_ABI)
-        airdrop_contract = w3.eth.contract(address=AIRDROP_CONTRACT_ADDRESS, abi=AIRDROP_ABI)
-
-        # 读取数据库空投数量（int）
-        airdrop_amount = get_airdrop_amount_from_config()
-        amounts = [airdrop_amount for _ in recipients]
-
-        total_amount = airdrop_amount * len(recipients)
-
-        # Step 1: Approve 授权空投合约从 community_account 扣代币
-        print(f"Starting approve for total amount: {total_amount}")
-        nonce = w3.eth.get_transaction_count(community_account.address)
-        approve_tx = token_contract.functions.approve(AIRDROP_CONTRACT_ADDRESS, total_amount)
-        gas_estimate = approve_tx.estimate_gas({'from': community_account.address})
-        approve_tx_build = approve_tx.build_transaction({
-            'from': community_account.address,
-            'nonce': nonce,
-            'gas': gas_estimate + 10000,
-            'maxFeePerGas': w3.to_wei('10', 'gwei'),
-            'maxPriorityFeePerGas': w3.to_wei('2', 'gwei'),
-        })
-        signed_approve_tx = w3.eth.account.sign_transaction(approve_tx_build, private_key=COMMUNITY_PRIVATE_KEY)
-        approve_tx_hash = w3.eth.send_raw_transaction(signed_approve_tx.raw_transaction)
-        print(f"Approve transaction sent: {w3.to_hex(approve_tx_hash)}")
-        w3.eth.wait_for_transaction_receipt(approve_tx_hash)
-        print("Approve transaction confirmed.")
-
-        # Step 2: 执行空投
-        nonce = w3.eth.get_transaction_count(dev_account.address)
-        batch_airdrop_tx = airdrop_contract.functions.airdrop(recipients, amounts)
-        gas_estimate = batch_airdrop_tx.estimate_gas({'from': dev_account.address})
-        batch_airdrop_tx_build = batch_airdrop_tx.build_transaction({
-            'from': dev_account.address,
-            'nonce': nonce,
-            'gas': gas_estimate + 10000,
-            'maxFeePerGas': w3.to_wei('10', 'gwei'),
-            'maxPriorityFeePerGas': w3.to_wei('2', 'gwei'),
-        })
-        signed_airdrop_tx = w3.eth.account.sign_transaction(batch_airdrop_tx_build, private_key=DEV_PRIVATE_KEY)
-        airdrop_tx_hash = w3.eth.send_raw_transaction(signed_airdrop_tx.raw_transaction)
-        print(f"Airdrop transaction sent: {w3.to_hex(airdrop_tx_hash)}")
-        w3.eth.wait_for_transaction_receipt(airdrop_tx_hash)
-        print("Airdrop transaction confirmed.")
-
-        return True
+        executor = PipelinedTxExecutor(w3)
+        submitted = submit_batch_airdrop(recipients, executor)
+
+        # 并发确认
+        executor.wait_all([tx for _, tx in submitted])
+        for indexes, tx in submitted:
+            for index in indexes:
+                results[index] = tx.succeeded
+        if not all(results):
+            invalidate_airdrop_allowance()
+        print(f"Airdrop finished: {sum(results)}/{len(recipients)} addresses in {len(submitted)} txs confirmed.")
+
+        return results
 
     except ContractLogicError as logic_error:
         print(f"Contract logic error: {logic_error}")
         traceback.print_exc()
-        return False
+        invalidate_airdrop_allowance()
+        return results
     except Exception as e:
         print(f"Airdrop transaction failed: {str(e)}")
         traceback.print_exc()
-        return False
-
-
+        invalidate_airdrop_allowance()
+        return results
@@ -1,104 +1,141 @@
-from web3 import Web3
-import json
 import os
 import traceback
-from web3.exceptions import ContractLogicError
 from dotenv import load_dotenv
+from utils.chain_client import get_w3, get_contract, get_account
+from utils.tx_executor import PipelinedTxExecutor
+from utils.allowance_manager import AllowanceManager
+from utils.batch_planner import BatchPlanner
 
 # 加载 .envlocal 配置
 load_dotenv()
 
 # 读取环境变量
-WEB3_PROVIDER = os.getenv('WEB3_PROVIDER')
 COMMUNITY_PRIVATE_KEY = os.getenv('COMMUNITY_PRIVATE_KEY')
 DEV_PRIVATE_KEY = os.getenv('DEV_PRIVATE_KEY')
 BATCH_WITHDRAW_CONTRACT_ADDRESS = os.getenv('BATCH_WITHDRAW_CONTRACT_ADDRESS')
 MEMAO_TOKEN_ADDRESS = os.getenv('MEMAO_TOKEN_ADDRESS')
 
-# 连接区块链
-w3 = Web3(Web3.HTTPProvider(WEB3_PROVIDER))
+# 共享连接池的 Web3 实例
+w3 = get_w3()
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # 当前文件目录
-ABIS_DIR = os.path.join(BASE_DIR, '..', 'abis')       # abis 目录
+_withdraw_allowance = None
 
-with open(os.path.join(ABIS_DIR, 'Withdraw_ABI.json'), 'r') as f:
-    BATCH_WITHDRAW_ABI = json.load(f)
+# 按 gas 估算切分 batchWithdraw（进程内复用已学习的边际 gas）
+withdraw_planner = BatchPlanner(w3)
 
-with open(os.path.join(ABIS_DIR, 'MEMAO.json'), 'r') as f:
-    full_json = json.load(f)
-    ERC20_ABI = full_json['abi']
 
+def get_withdraw_allowance():
+    """社区账户对 BatchWithdraw 合约的累计授权（进程内复用，跨次任务本地记账）"""
+    global _withdraw_allowance
+    if _withdraw_allowance is None:
+        _withdraw_allowance = AllowanceManager(
+            w3,
+            get_contract(MEMAO_TOKEN_ADDRESS, 'MEMAO.json'),
+            get_account(COMMUNITY_PRIVATE_KEY),
+            BATCH_WITHDRAW_CONTRACT_ADDRESS
+        )
+    return _withdraw_allowance
 
-def blockchain_batch_withdraw(recipients, amounts):
+
+def submit_batch_withdraw(recipients, amounts, executor=None):
     """
-    批量提现函数，调用链上 BatchWithdraw 合约进行转账操作。
+    流水线批量提现（只广播，不等待回执）：
+    1. 累计授权不足总额时，社区账户 approve 一次并等待确认（approve 为覆盖写，不能按批次并发）
+    2. 按 gas 估算把全部收款人切分为尽量满的交易（估算回滚时二分剔除问题地址）
+    3. 开发账户按本地 nonce 连续签名广播全部 batchWithdraw
     recipients: list of str (钱包地址)
     amounts: list of int or str (对应的转账金额，单位根据合约)
-    返回: True 表示成功或已知交易，False 表示失败
+    返回: [(收款人下标列表, PendingTx), ...]，未出现在其中的收款人本次未广播
     """
+    if not recipients:
+        return []
+
+    dev_account = get_account(DEV_PRIVATE_KEY)
+    batch_withdraw_contract = get_contract(BATCH_WITHDRAW_CONTRACT_ADDRESS, 'Withdraw_ABI.json')
+    executor = executor or PipelinedTxExecutor(w3)
+    withdraw_allowance = get_withdraw_allowance()
+    # 两个签名账户的 nonce 一次批量读取
+    executor.nonces.prime([withdraw_allowance.owner.address, dev_account.address])
+
+    # (原始下标, 收款地址, 金额)
+    items = [
+        (index, w3.to_checksum_address(addr), int(amount))
+        for index, (addr, amount) in enumerate(zip(recipients, amounts))
+    ]
+    total_amount = sum(amount for _, _, amount in items)
+
+    # Step 1: 剩余累计授权不足时才 approve
     try:
-        recipients = [w3.to_checksum_address(addr) for addr in recipients]
-        community_account = w3.eth.account.from_key(COMMUNITY_PRIVATE_KEY)
-        dev_account = w3.eth.account.from_key(DEV_PRIVATE_KEY)
-        memao_token = w3.eth.contract(address=MEMAO_TOKEN_ADDRESS, abi=ERC20_ABI)
-        batch_withdraw_contract = w3.eth.contract(address=BATCH_WITHDRAW_CONTRACT_ADDRESS, abi=BATCH_WITHDRAW_ABI)
-        total_amount = sum(int(amount) for amount in amounts)
-
-        # Step 1: Approve
-        try:
-            print(f"Starting approve step for total amount: {total_amount}")
-            nonce = w3.eth.get_transaction_count(community_account.address)
-            approve_tx = memao_token.functions.approve(BATCH_WITHDRAW_CONTRACT_ADDRESS, total_amount)
-            gas_estimate = approve_tx.estimate_gas({'from': community_account.address})
-            approve_tx_build = approve_tx.build_transaction({
-                'from': community_account.address,
-                'nonce': nonce,
-                'gas': gas_estimate + 10000,
-                'maxFeePerGas': w3.to_wei('10', 'gwei'),
-                'maxPriorityFeePerGas': w3.to_wei('2', 'gwei'),
-            })
-            signed_approve_tx = w3.eth.account.sign_transaction(approve_tx_build, private_key=COMMUNITY_PRIVATE_KEY)
-            approve_tx_hash = w3.eth.send_raw_transaction(signed_approve_tx.raw_transaction)
-            print(f"Approve transaction sent: {w3.to_hex(approve_tx_hash)}")
-            w3.eth.wait_for_transaction_receipt(approve_tx_hash)
-            print("Approve transaction confirmed.")
-        except Exception as approve_error:
-            print("Approve step failed!")
-            print(f"Error: {str(approve_error)}")
-            traceback.print_exc()
-            return False
+        if not withdraw_allowance.ensure(executor, total_amount):
+            return []
+    except Exception as approve_error:
+        print("Approve step failed!")
+        print(f"Error: {str(approve_error)}")
+        traceback.print_exc()
+        return []
+
+    # Step 2: 按 gas 预算切分
+    def build_call(chunk):
+        return batch_withdraw_contract.functions.batchWithdraw(
+            [addr for _, addr, _ in chunk], [amount for _, _, amount in chunk]
+        )
+
+    planned, rejected = withdraw_planner.plan(dev_account.address, build_call, items)
+    if rejected:
+        print(f"{len(rejected)} withdrawals rejected by gas estimation, will retry later.")
+        # 估算回滚可能是本地记账的授权已不准（回执在其他进程处理），下次从链上校准
+        withdraw_allowance.invalidate()
 
-        # Step 2: Batch Withdraw
+    # Step 3: Batch Withdraw，连续广播
+    submitted = []
+    for number, (chunk, gas_estimate) in enumerate(planned, start=1):
         try:
-            print(f"Starting batch withdraw step for recipients: {recipients} with amounts: {amounts}")
-            nonce = w3.eth.get_transaction_count(dev_account.address)
-            batch_withdraw_tx = batch_withdraw_contract.functions.batchWithdraw(recipients, [int(amount) for amount in amounts])
-            gas_estimate = batch_withdraw_tx.estimate_gas({'from': dev_account.address})
-            batch_withdraw_tx_build = batch_withdraw_tx.build_transaction({
-                'from': dev_account.address,
-                'nonce': nonce,
-                'gas': gas_estimate + 10000,
-                'maxFeePerGas': w3.to_wei('10', 'gwei'),
-                'maxPriorityFeePerGas': w3.to_wei('2', 'gwei'),
-            })
-            signed_withdraw_tx = w3.eth.account.sign_transaction(batch_withdraw_tx_build, private_key=DEV_PRIVATE_KEY)
-            withdraw_tx_hash = w3.eth.send_raw_transaction(signed_withdraw_tx.raw_transaction)
-            print(f"Batch withdraw transaction sent: {w3.to_hex(withdraw_tx_hash)}")
-            w3.eth.wait_for_transaction_receipt(withdraw_tx_hash)
-            print("Batch withdraw completed successfully.")
-            return True
+            tx = executor.send(dev_account, build_call(chunk), label=f'batch {number}', gas_estimate=gas_estimate)
+            withdraw_allowance.consume(sum(amount for _, _, amount in chunk), tx)
+            submitted.append(([index for index, _, _ in chunk], tx))
         except Exception as withdraw_error:
-            print("Batch withdraw step failed!")
+            print(f"Batch {number} withdraw broadcast failed!")
             print(f"Error: {str(withdraw_error)}")
             traceback.print_exc()
-            return False
+
+    print(f"Batch withdraw submitted: {sum(len(indexes) for indexes, _ in submitted)}/{len(recipients)} "
+          f"withdrawals in {len(submitted)} txs.")
+    return submitted
+
+
+def blockchain_batch_withdraw_pipelined(recipients, amounts):
+    """
+    流水线批量提现并在当前线程等待全部回执（卡住的 nonce 加价替换）
+    定时任务改为 submit_batch_withdraw + 回执追踪服务，此函数保留给需要同步结果的调用方
+    返回: 与 recipients 顺序一致的 bool 列表，True 表示该笔已上链成功
+    """
+    results = [False] * len(recipients)
+    try:
+        executor = PipelinedTxExecutor(w3)
+        submitted = submit_batch_withdraw(recipients, amounts, executor)
+
+        # 并发确认
+        executor.wait_all([tx for _, tx in submitted])
+        for indexes, tx in submitted:
+            for index in indexes:
+                results[index] = tx.succeeded
+        if not all(results):
+            # 失败批次未实际消耗授权，下次从链上校准
+            get_withdraw_allowance().invalidate()
+        print(f"Batch withdraw finished: {sum(results)}/{len(recipients)} withdrawals in {len(submitted)} txs succeeded.")
+        return results
 
     except Exception as e:
-        error_message = str(e)
-        if 'already known' in error_message:
-            print("Transaction already known, likely pending in mempool. Treating as success.")
-            return True
-        else:
-            print(f"Blockchain transaction failed: {error_message}")
-            traceback.print_exc()
-            return False
+        print(f"Blockchain transaction failed: {str(e)}")
+        traceback.print_exc()
+        return results
+
+
+def blockchain_batch_withdraw(recipients, amounts):
+    """
+    批量提现函数，调用链上 BatchWithdraw 合约进行转账操作。
+    recipients: list of str (钱包地址)
+    amounts: list of int or str (对应的转账金额，单位根据合约)
+    返回: True 表示全部成功，False 表示存在失败
+    """
+    return all(blockchain_batch_withdraw_pipelined(recipients, amounts))
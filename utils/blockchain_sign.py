@@ -1,6 +1,8 @@
 import os
+import random
 from web3 import Web3
 from eth_account import Account
+from eth_keys import keys
 from decimal import Decimal
 from eth_account.messages import encode_defunct
 from flask import current_app
@@ -14,38 +16,66 @@ PRIVATE_KEY = os.getenv('COMMUNITY_PRIVATE_KEY')
 if not PRIVATE_KEY:
     raise ValueError("COMMUNITY_PRIVATE_KEY not found in environment variables")
 
+# 签名后做 ECDSA 恢复自检的抽样比例（启动时必定自检一次）
+SIGNATURE_VERIFY_SAMPLE_RATE = float(os.getenv('SIGNATURE_VERIFY_SAMPLE_RATE', '0.01'))
 
-def sign_withdrawal(wallet_address: str, amount_points: Decimal, nonce: int) -> str:
-    try:
-        # 计算签名数据，与前端/合约保持一致
-        amount_wei = int(amount_points * Decimal(10 ** 18))  # 转换成wei单位
-        addr = wallet_address.lower()
-        if addr.startswith("0x"):
-            addr = addr[2:]
-        message = f"{addr}:{amount_wei}:{nonce}"
 
-        current_app.logger.info(f"Raw message to sign: '{message}'")
+def build_withdrawal_message(wallet_address: str, amount_points: Decimal, nonce: int):
+    """计算签名数据，与前端/合约保持一致"""
+    amount_wei = int(amount_points * Decimal(10 ** 18))  # 转换成wei单位
+    addr = wallet_address.lower()
+    if addr.startswith("0x"):
+        addr = addr[2:]
+    message = f"{addr}:{amount_wei}:{nonce}"
+    return encode_defunct(primitive=Web3.keccak(message.encode('utf-8')))
+
+
+class WithdrawalSigner:
+    """
+    提现签名器：私钥对象与地址只在初始化时派生一次，并做一次签名-恢复自检
+    之后每次签名直接使用缓存的密钥，恢复校验按 verify_sample_rate 抽样
+    """
+
+    def __init__(self, private_key, verify_sample_rate=SIGNATURE_VERIFY_SAMPLE_RATE):
+        self.account = Account.from_key(private_key)
+        self.address = self.account.address
+        # LocalAccount.sign_message 每次都由私钥字节重建 PrivateKey，这里只构造一次
+        self._key = keys.PrivateKey(self.account.key)
+        self.verify_sample_rate = verify_sample_rate
+        # 启动自检
+        probe = build_withdrawal_message(self.address, Decimal(0), 0)
+        self._verify(probe, self._sign(probe))
 
-        message_bytes = message.encode('utf-8')
-        message_hash = Web3.keccak(message_bytes)
-        current_app.logger.info(f"Message hash: {message_hash.hex()}")
+    def sign(self, wallet_address: str, amount_points: Decimal, nonce: int) -> str:
+        signable_message = build_withdrawal_message(wallet_address, amount_points, nonce)
+        signature = self._sign(signable_message)
+        if self.verify_sample_rate and random.random() < self.verify_sample_rate:
+            self._verify(signable_message, signature)
+        return signature.hex()
 
-        signable_message = encode_defunct(primitive=message_hash)
-        current_app.logger.info(f"Signable message hash: {Web3.keccak(signable_message.body).hex()}")
+    def sign_many(self, withdrawals):
+        """
+        批量签名
+        :param withdrawals: [(wallet_address, amount_points, nonce), ...]
+        :return: 与输入顺序一致的签名列表
+        """
+        return [self.sign(wallet_address, amount, nonce) for wallet_address, amount, nonce in withdrawals]
 
-        signed_message = Account.sign_message(signable_message, private_key=PRIVATE_KEY)
+    def _sign(self, signable_message):
+        return Account.sign_message(signable_message, private_key=self._key).signature
 
-        recovered_address = Account.recover_message(signable_message, signature=signed_message.signature)
-        expected_address = Account.from_key(PRIVATE_KEY).address
-        current_app.logger.info(f"Recovered address: {recovered_address}")
-        current_app.logger.info(f"Expected signer: {expected_address}")
+    def _verify(self, signable_message, signature):
+        recovered_address = Account.recover_message(signable_message, signature=signature)
+        if recovered_address.lower() != self.address.lower():
+            raise ValueError(f"Recovered address {recovered_address} does not match signer {self.address}")
 
-        if recovered_address.lower() != expected_address.lower():
-            raise ValueError("Recovered address does not match signer")
 
-        return signed_message.signature.hex()
+signer = WithdrawalSigner(PRIVATE_KEY)
 
+
+def sign_withdrawal(wallet_address: str, amount_points: Decimal, nonce: int) -> str:
+    try:
+        return signer.sign(wallet_address, amount_points, nonce)
     except Exception as e:
         current_app.logger.error(f"Signature generation failed: {e}")
         raise RuntimeError(f"Signature generation failed: {e}")
-
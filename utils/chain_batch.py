@@ -0,0 +1,126 @@
+import os
+from dotenv import load_dotenv
+from eth_utils.abi import get_abi_output_types
+from web3 import Web3
+from web3._utils.method_formatters import receipt_formatter
+from utils.chain_client import get_w3
+
+load_dotenv()
+
+# Multicall3 在主流 EVM 链上的统一部署地址
+MULTICALL3_ADDRESS = Web3.to_checksum_address(
+    os.getenv('MULTICALL3_ADDRESS', '0xcA11bde05977b3631167028862bE2a173976CA11')
+)
+# 每个 aggregate3 打包的子调用数（受节点 eth_call gas 上限约束）
+MULTICALL_CHUNK_SIZE = int(os.getenv('MULTICALL_CHUNK_SIZE', '500'))
+# 单个 JSON-RPC 批量请求最多携带的请求数（多数节点服务商限制在 100~1000）
+RPC_BATCH_LIMIT = int(os.getenv('RPC_BATCH_LIMIT', '100'))
+
+MULTICALL3_ABI = [{
+    'name': 'aggregate3',
+    'type': 'function',
+    'stateMutability': 'payable',
+    'inputs': [{
+        'name': 'calls',
+        'type': 'tuple[]',
+        'components': [
+            {'name': 'target', 'type': 'address'},
+            {'name': 'allowFailure', 'type': 'bool'},
+            {'name': 'callData', 'type': 'bytes'}
+        ]
+    }],
+    'outputs': [{
+        'name': 'returnData',
+        'type': 'tuple[]',
+        'components': [
+            {'name': 'success', 'type': 'bool'},
+            {'name': 'returnData', 'type': 'bytes'}
+        ]
+    }]
+}]
+
+
+def batch_rpc(requests, errors=None):
+    """
+    多条 JSON-RPC 请求合并为尽量少的 HTTP 往返（按 RPC_BATCH_LIMIT 分包）
+    :param requests: [(method, params), ...]
+    :param errors: 传入集合时，出错请求的下标加入其中（用于区分“出错”与“结果为 null”）
+    :return: 与 requests 顺序一致的原始 result 列表，单项出错时为 None
+    """
+    requests = list(requests)
+    if not requests:
+        return []
+
+    w3 = get_w3()
+    request_func = w3.provider.batch_request_func(w3, w3.middleware_onion)
+    results = []
+    for i in range(0, len(requests), RPC_BATCH_LIMIT):
+        responses = request_func(requests[i:i + RPC_BATCH_LIMIT])
+        if not isinstance(responses, list):
+            # 整个批量请求被拒绝时节点只返回一个错误对象
+            raise ValueError(f"Batch RPC request failed: {responses.get('error')}")
+        for r in responses:
+            if 'error' in r and errors is not None:
+                errors.add(len(results))
+            results.append(None if 'error' in r else r.get('result'))
+    return results
+
+
+def get_transaction_counts(addresses, block='pending'):
+    """批量读取账户 nonce：{address: nonce}"""
+    results = batch_rpc(('eth_getTransactionCount', [address, block]) for address in addresses)
+    return {address: int(count, 16) for address, count in zip(addresses, results) if count is not None}
+
+
+def get_balances(addresses, block='latest'):
+    """批量读取原生币余额：{address: wei}"""
+    results = batch_rpc(('eth_getBalance', [address, block]) for address in addresses)
+    return {address: int(balance, 16) for address, balance in zip(addresses, results) if balance is not None}
+
+
+def get_receipts(tx_hashes, errors=None):
+    """
+    批量查询交易回执，未上链的为 None（不会像单笔查询那样抛 TransactionNotFound）
+    :param errors: 传入集合时收集查询出错的下标，这些哈希的 None 不代表未上链
+    """
+    w3 = get_w3()
+    results = batch_rpc([('eth_getTransactionReceipt', [w3.to_hex(h)]) for h in tx_hashes], errors)
+    return [receipt_formatter(r) if r else None for r in results]
+
+
+def multicall(calls, allow_failure=True):
+    """
+    通过 Multicall3.aggregate3 聚合合约只读调用，多个 aggregate3 再合并为 JSON-RPC 批量请求
+    :param calls: 已绑定参数的合约函数列表，如 [contract.functions.nonces(addr), ...]
+    :return: 与 calls 顺序一致的解码结果（单返回值自动解包），失败项为 None
+    """
+    calls = list(calls)
+    if not calls:
+        return []
+
+    w3 = get_w3()
+    multicall3 = w3.eth.contract(address=MULTICALL3_ADDRESS, abi=MULTICALL3_ABI)
+    chunks = [calls[i:i + MULTICALL_CHUNK_SIZE] for i in range(0, len(calls), MULTICALL_CHUNK_SIZE)]
+
+    requests = []
+    for chunk in chunks:
+        data = multicall3.functions.aggregate3([
+            (fn.address, allow_failure, fn._encode_transaction_data()) for fn in chunk
+        ])._encode_transaction_data()
+        requests.append(('eth_call', [{'to': MULTICALL3_ADDRESS, 'data': data}, 'latest']))
+
+    values = []
+    for chunk, raw in zip(chunks, batch_rpc(requests)):
+        if raw is None:
+            if not allow_failure:
+                raise ValueError("Multicall aggregate3 call failed")
+            values.extend([None] * len(chunk))
+            continue
+        (results,) = w3.codec.decode(['(bool,bytes)[]'], bytes.fromhex(raw[2:]))
+        for fn, (success, return_data) in zip(chunk, results):
+            if not success:
+                values.append(None)
+                continue
+            decoded = w3.codec.decode(get_abi_output_types(fn.abi), return_data)
+            values.append(decoded[0] if len(decoded) == 1 else decoded)
+    return values
@@ -0,0 +1,170 @@
+import json
+import os
+import threading
+import time
+from functools import lru_cache
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from eth_account import Account
+from web3 import Web3
+from web3._utils.batching import sort_batch_response_by_response_ids
+from web3.providers.base import JSONBaseProvider
+from utils.job_metrics import RpcMetricsMiddleware
+
+load_dotenv()
+
+# 多个 RPC 端点用逗号分隔（WEB3_PROVIDERS），未配置时沿用单个 WEB3_PROVIDER
+RPC_ENDPOINTS = [
+    uri.strip()
+    for uri in (os.getenv('WEB3_PROVIDERS') or os.getenv('WEB3_PROVIDER') or '').split(',')
+    if uri.strip()
+]
+RPC_TIMEOUT = float(os.getenv('RPC_TIMEOUT', '10'))
+RPC_POOL_SIZE = int(os.getenv('RPC_POOL_SIZE', '32'))
+# 端点请求失败后的冷却时间（秒），冷却期内只在其余端点都不可用时才尝试
+RPC_FAILURE_COOLDOWN = float(os.getenv('RPC_FAILURE_COOLDOWN', '30'))
+# 端点超过该时间未被选中时重新探测一次，避免延迟数据过期
+RPC_PROBE_INTERVAL = float(os.getenv('RPC_PROBE_INTERVAL', '60'))
+
+ABIS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'abis')
+
+_HEADERS = {'Content-Type': 'application/json'}
+
+
+class RpcEndpoint:
+    def __init__(self, uri):
+        self.uri = uri
+        self.latency = None  # 延迟滑动平均（秒）
+        self.last_used = 0.0
+        self.failed_until = 0.0
+
+    def score(self, now):
+        if self.latency is None or now - self.last_used >= RPC_PROBE_INTERVAL:
+            return 0.0
+        return self.latency
+
+    def observe(self, duration):
+        self.latency = duration if self.latency is None else 0.8 * self.latency + 0.2 * duration
+        self.last_used = time.monotonic()
+        self.failed_until = 0.0
+
+    def mark_failed(self, cooldown):
+        self.last_used = time.monotonic()
+        self.failed_until = self.last_used + cooldown
+
+
+class FailoverHTTPProvider(JSONBaseProvider):
+    """
+    多端点 HTTP Provider：
+    - 全部线程共用一个带连接池的 requests.Session（keep-alive）
+    - 按延迟滑动平均选择最快的健康端点，连接错误/超时/HTTP 错误时切换下一个端点
+    - JSON-RPC 层面的错误（revert 等）原样返回，不切换端点
+    """
+
+    def __init__(self, endpoints, timeout=RPC_TIMEOUT, pool_size=RPC_POOL_SIZE,
+                 cooldown=RPC_FAILURE_COOLDOWN):
+        super().__init__()
+        self.endpoints = [RpcEndpoint(uri) for uri in endpoints]
+        self.timeout = timeout
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.endpoints), pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def __str__(self):
+        return f"FailoverHTTPProvider({', '.join(e.uri for e in self.endpoints)})"
+
+    def make_request(self, method, params):
+        return self.decode_rpc_response(self._post(self.encode_rpc_request(method, params)))
+
+    def make_batch_request(self, batch_requests):
+        response = self.decode_rpc_response(self._post(self.encode_batch_rpc_request(batch_requests)))
+        if not isinstance(response, list):
+            # RPC 错误时只返回一个错误对象
+            return response
+        return sort_batch_response_by_response_ids(response)
+
+    def _candidates(self):
+        now = time.monotonic()
+        with self._lock:
+            healthy = sorted((e for e in self.endpoints if e.failed_until <= now), key=lambda e: e.score(now))
+            cooling = sorted((e for e in self.endpoints if e.failed_until > now), key=lambda e: e.failed_until)
+        # 全部端点都在冷却中时，按最早恢复的顺序继续尝试
+        return healthy + cooling
+
+    def _post(self, request_data):
+        last_error = None
+        for endpoint in self._candidates():
+            start = time.perf_counter()
+            try:
+                response = self.session.post(endpoint.uri, data=request_data, headers=_HEADERS, timeout=self.timeout)
+                response.raise_for_status()
+            except requests.RequestException as e:
+                with self._lock:
+                    endpoint.mark_failed(self.cooldown)
+                print(f"RPC endpoint {endpoint.uri} failed, failing over: {e}")
+                last_error = e
+                continue
+            with self._lock:
+                endpoint.observe(time.perf_counter() - start)
+            return response.content
+        raise last_error
+
+    def endpoint_stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    'uri': e.uri,
+                    'latency': e.latency,
+                    'healthy': e.failed_until <= now
+                }
+                for e in self.endpoints
+            ]
+
+
+_w3 = None
+_w3_lock = threading.Lock()
+_contracts = {}
+
+
+def get_w3():
+    """进程内共享的 Web3 实例（多端点故障切换 + RPC 埋点）"""
+    global _w3
+    if _w3 is None:
+        with _w3_lock:
+            if _w3 is None:
+                endpoints = RPC_ENDPOINTS or [os.getenv('WEB3_HTTP_PROVIDER_URI', 'http://localhost:8545')]
+                w3 = Web3(FailoverHTTPProvider(endpoints))
+                w3.middleware_onion.add(RpcMetricsMiddleware)
+                _w3 = w3
+    return _w3
+
+
+@lru_cache(maxsize=None)
+def load_abi(filename):
+    """读取 abis 目录下的 ABI（兼容 Hardhat 产物 {'abi': [...]} 与纯 ABI 列表）"""
+    with open(os.path.join(ABIS_DIR, filename), 'r') as f:
+        data = json.load(f)
+    return data['abi'] if isinstance(data, dict) else data
+
+
+def get_contract(address, abi_file):
+    """按 (地址, ABI 文件) 缓存合约实例"""
+    address = Web3.to_checksum_address(address)
+    key = (address, abi_file)
+    contract = _contracts.get(key)
+    if contract is None:
+        contract = get_w3().eth.contract(address=address, abi=load_abi(abi_file))
+        _contracts[key] = contract
+    return contract
+
+
+@lru_cache(maxsize=None)
+def get_account(private_key):
+    """缓存私钥派生的账户对象，避免每次调用重复推导地址"""
+    return Account.from_key(private_key)
@@ -0,0 +1,265 @@
+import json
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+from functools import wraps
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from web3.middleware import Web3Middleware
+from extensions import redis_conn
+
+# 每个任务在 Redis 中保留最近 N 次运行记录（调度器与 Web 可能不在同一进程/容器）
+METRICS_KEY_PREFIX = 'scheduler:metrics:'
+METRICS_JOBS_KEY = 'scheduler:metrics:jobs'
+METRICS_HISTORY_SIZE = 100
+# 调度延迟直方图累计计数（Prometheus counter 语义，只增不减）
+METRICS_LAG_KEY_PREFIX = 'scheduler:metrics:lag:'
+
+# 调度延迟直方图分桶（秒）
+LAG_BUCKETS = [0.1, 0.5, 1, 5, 15, 60, 300, float('inf')]
+
+_local = threading.local()
+_scheduled_times = {}
+# 带埋点的任务名：只为这些任务记录调度时间（其余任务没有消费方，记录会一直留在字典里）
+_tracked_jobs = set()
+
+
+class JobRun:
+    def __init__(self, name):
+        self.name = name
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self.duration = None
+        self.status = 'success'
+        self.error = None
+        self.rows = 0
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.rpc_calls = 0
+        self.rpc_time = 0.0
+        self.lag = None
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._start
+
+    def to_dict(self):
+        return {
+            'job': self.name,
+            'started_at': self.started_at.isoformat(),
+            'duration': self.duration,
+            'status': self.status,
+            'error': self.error,
+            'rows': self.rows,
+            'db_queries': self.db_queries,
+            'db_time': self.db_time,
+            'rpc_calls': self.rpc_calls,
+            'rpc_time': self.rpc_time,
+            'lag': self.lag
+        }
+
+
+def current_run():
+    return getattr(_local, 'run', None)
+
+
+def add_rows(count):
+    """记录本次任务处理的行数（不在任务内调用时忽略）"""
+    run = current_run()
+    if run is not None:
+        run.rows += count
+
+
+def mark_failed(error):
+    """任务自行捕获异常时调用，标记本次运行失败"""
+    run = current_run()
+    if run is not None:
+        run.status = 'failed'
+        run.error = str(error)
+
+
+def record_rpc(duration):
+    run = current_run()
+    if run is not None:
+        run.rpc_calls += 1
+        run.rpc_time += duration
+
+
+def set_scheduled_time(name, scheduled_run_time):
+    if name in _tracked_jobs:
+        _scheduled_times[name] = scheduled_run_time
+
+
+def track_job(name):
+    """
+    任务埋点装饰器：耗时、处理行数、DB 查询次数/耗时、链上 RPC 次数/耗时、调度延迟
+    """
+    _tracked_jobs.add(name)
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            run = JobRun(name)
+            _local.run = run
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                run.status = 'failed'
+                run.error = str(e)
+                raise
+            finally:
+                _local.run = None
+                run.finish()
+                # 调度提交事件在任务开始前后几乎同时触发，结束时读取
+                scheduled = _scheduled_times.pop(name, None)
+                if scheduled is not None:
+                    run.lag = max(0.0, (run.started_at - scheduled).total_seconds())
+                save_run(run)
+        return wrapper
+    return decorator
+
+
+def save_run(run):
+    try:
+        key = f"{METRICS_KEY_PREFIX}{run.name}"
+        pipe = redis_conn.pipeline()
+        pipe.sadd(METRICS_JOBS_KEY, run.name)
+        pipe.lpush(key, json.dumps(run.to_dict()))
+        pipe.ltrim(key, 0, METRICS_HISTORY_SIZE - 1)
+        if run.lag is not None:
+            lag_key = f"{METRICS_LAG_KEY_PREFIX}{run.name}"
+            for bucket in LAG_BUCKETS:
+                if run.lag <= bucket:
+                    pipe.hincrby(lag_key, _bucket_field(bucket), 1)
+            pipe.hincrby(lag_key, 'count', 1)
+            pipe.hincrbyfloat(lag_key, 'sum', run.lag)
+        pipe.execute()
+    except Exception:
+        print(f"[{datetime.now()}] Saving job metrics for {run.name} failed:")
+        traceback.print_exc()
+
+
+def load_runs(name, limit=METRICS_HISTORY_SIZE):
+    return [json.loads(raw) for raw in redis_conn.lrange(f"{METRICS_KEY_PREFIX}{name}", 0, limit - 1)]
+
+
+def _bucket_field(bucket):
+    return '+Inf' if bucket == float('inf') else str(bucket)
+
+
+def load_lag_totals(name):
+    """调度延迟直方图累计值：{'buckets': {le: 次数}, 'count': 次数, 'sum': 秒}"""
+    raw = {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+           for k, v in (redis_conn.hgetall(f"{METRICS_LAG_KEY_PREFIX}{name}") or {}).items()}
+    return {
+        'buckets': {_bucket_field(b): int(raw.get(_bucket_field(b), 0)) for b in LAG_BUCKETS},
+        'count': int(raw.get('count', 0)),
+        'sum': float(raw.get('sum', 0))
+    }
+
+
+def job_names():
+    return sorted(n.decode() if isinstance(n, bytes) else n for n in redis_conn.smembers(METRICS_JOBS_KEY))
+
+
+def summarize(runs, lag_totals=None):
+    """
+    按任务汇总最近若干次运行：最近一次详情 + 耗时/延迟统计 + 延迟直方图
+    lag_histogram 只统计最近若干次；lag_totals 为累计直方图（Prometheus 输出使用）
+    """
+    if not runs:
+        return None
+    durations = [r['duration'] for r in runs if r['duration'] is not None]
+    lags = [r['lag'] for r in runs if r['lag'] is not None]
+    histogram = {str(b): sum(1 for lag in lags if lag <= b) for b in LAG_BUCKETS}
+    return {
+        'last_run': runs[0],
+        'runs': len(runs),
+        'failures': sum(1 for r in runs if r['status'] == 'failed'),
+        'duration_avg': sum(durations) / len(durations) if durations else None,
+        'duration_max': max(durations) if durations else None,
+        'lag_avg': sum(lags) / len(lags) if lags else None,
+        'lag_max': max(lags) if lags else None,
+        'lag_histogram': histogram,
+        'lag_count': len(lags),
+        'lag_sum': sum(lags),
+        'lag_totals': lag_totals
+    }
+
+
+def render_prometheus(summaries):
+    lines = []
+
+    def metric(name, help_text, metric_type, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.extend(samples)
+
+    last = {job: s['last_run'] for job, s in summaries.items()}
+    metric('memao_job_last_duration_seconds', 'Wall time of the last run', 'gauge',
+           [f'memao_job_last_duration_seconds{{job="{j}"}} {r["duration"] or 0}' for j, r in last.items()])
+    metric('memao_job_last_rows', 'Rows processed by the last run', 'gauge',
+           [f'memao_job_last_rows{{job="{j}"}} {r["rows"]}' for j, r in last.items()])
+    metric('memao_job_last_db_queries', 'DB queries issued by the last run', 'gauge',
+           [f'memao_job_last_db_queries{{job="{j}"}} {r["db_queries"]}' for j, r in last.items()])
+    metric('memao_job_last_db_seconds', 'DB time of the last run', 'gauge',
+           [f'memao_job_last_db_seconds{{job="{j}"}} {r["db_time"]}' for j, r in last.items()])
+    metric('memao_job_last_rpc_calls', 'Chain RPC calls issued by the last run', 'gauge',
+           [f'memao_job_last_rpc_calls{{job="{j}"}} {r["rpc_calls"]}' for j, r in last.items()])
+    metric('memao_job_last_rpc_seconds', 'Chain RPC time of the last run', 'gauge',
+           [f'memao_job_last_rpc_seconds{{job="{j}"}} {r["rpc_time"]}' for j, r in last.items()])
+    metric('memao_job_last_success', '1 if the last run succeeded', 'gauge',
+           [f'memao_job_last_success{{job="{j}"}} {1 if r["status"] == "success" else 0}' for j, r in last.items()])
+
+    samples = []
+    for job, s in summaries.items():
+        totals = s.get('lag_totals')
+        if not totals:
+            continue
+        for le, count in totals['buckets'].items():
+            samples.append(f'memao_job_lag_seconds_bucket{{job="{job}",le="{le}"}} {count}')
+        samples.append(f'memao_job_lag_seconds_sum{{job="{job}"}} {totals["sum"]}')
+        samples.append(f'memao_job_lag_seconds_count{{job="{job}"}} {totals["count"]}')
+    metric('memao_job_lag_seconds', 'Delay between scheduled and actual start', 'histogram', samples)
+
+    return "\n".join(lines) + "\n"
+
+
+# ----------------- DB 查询埋点 -----------------
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_run() is not None:
+        conn.info.setdefault('job_query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    run = current_run()
+    starts = conn.info.get('job_query_start')
+    if run is not None and starts:
+        run.db_queries += 1
+        run.db_time += time.perf_counter() - starts.pop()
+
+
+# ----------------- 链上 RPC 埋点 -----------------
+class RpcMetricsMiddleware(Web3Middleware):
+    """web3 中间件：统计任务内的 RPC 次数与耗时（w3.middleware_onion.add(RpcMetricsMiddleware)）"""
+
+    def wrap_make_request(self, make_request):
+        def middleware(method, params):
+            start = time.perf_counter()
+            try:
+                return make_request(method, params)
+            finally:
+                record_rpc(time.perf_counter() - start)
+        return middleware
+
+    def wrap_make_batch_request(self, make_batch_request):
+        # 一次批量请求只有一次网络往返，按一次 RPC 计
+        def middleware(requests_info):
+            start = time.perf_counter()
+            try:
+                return make_batch_request(requests_info)
+            finally:
+                record_rpc(time.perf_counter() - start)
+        return middleware
@@ -0,0 +1,195 @@
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime
+
+# 仅当锁仍属于自己时续期 / 释放
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderElector:
+    """
+    基于 Redis 锁的选主：SET NX PX 抢锁，心跳线程定期续期
+    leader 续期失败（锁被抢占或 Redis 长时间不可用）即视为失去领导权，其余进程在锁过期后接管
+    """
+
+    def __init__(self, redis_conn, key='scheduler:leader', ttl=30, heartbeat=10,
+                 on_elected=None, on_revoked=None):
+        if heartbeat >= ttl:
+            raise ValueError("heartbeat must be shorter than ttl")
+        self.redis = redis_conn
+        self.key = key
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self.on_elected = on_elected
+        self.on_revoked = on_revoked
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._renew = redis_conn.register_script(_RENEW_SCRIPT)
+        self._release = redis_conn.register_script(_RELEASE_SCRIPT)
+        self._is_leader = False
+        self._last_renewed = 0.0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def is_leader(self):
+        return self._is_leader
+
+    def current_leader(self):
+        value = self.redis.get(self.key)
+        return value.decode() if isinstance(value, bytes) else value
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='leader-elector', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=self.heartbeat)
+        if self._is_leader:
+            try:
+                self._release(keys=[self.key], args=[self.token])
+            except Exception:
+                traceback.print_exc()
+            self._set_leader(False)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self._tick()
+            except Exception:
+                print(f"[{datetime.now()}] Leader election heartbeat failed:")
+                traceback.print_exc()
+                # 超过 ttl 未能续期，锁可能已被他人持有，主动让出
+                if self._is_leader and time.monotonic() - self._last_renewed >= self.ttl - self.heartbeat:
+                    self._set_leader(False)
+            self._stop_event.wait(self.heartbeat)
+
+    def _tick(self):
+        ttl_ms = self.ttl * 1000
+        if self._is_leader:
+            if self._renew(keys=[self.key], args=[self.token, ttl_ms]):
+                self._last_renewed = time.monotonic()
+            else:
+                self._set_leader(False)
+        elif self.redis.set(self.key, self.token, nx=True, px=ttl_ms):
+            self._last_renewed = time.monotonic()
+            self._set_leader(True)
+
+    def _set_leader(self, is_leader):
+        if is_leader == self._is_leader:
+            return
+        self._is_leader = is_leader
+        print(f"[{datetime.now()}] {self.token} {'elected as' if is_leader else 'lost'} scheduler leader")
+        callback = self.on_elected if is_leader else self.on_revoked
+        if callback:
+            try:
+                callback()
+            except Exception:
+                traceback.print_exc()
+
+
+_current_job = threading.local()
+
+
+def job_lock_held():
+    """
+    当前线程执行的任务是否仍持有任务锁（不在加锁任务内调用时恒为 True）
+    长任务在每个有副作用的步骤（领取 / 广播 / 结算一块）前检查，锁丢失即停止
+    """
+    lock = getattr(_current_job, 'lock', None)
+    return lock is None or lock.held
+
+
+def job_running(redis_conn, name):
+    """同名任务锁当前是否被持有（有实例正在执行该任务）"""
+    return bool(redis_conn.exists(f"scheduler:job:{name}"))
+
+
+class JobLock:
+    """
+    单个定时任务的 Redis 锁：执行期间由心跳线程续期，结束时释放
+    领导权切换时，旧 leader 上仍在运行的任务继续持有锁，新 leader 的同名任务获取失败即跳过，两边不会同时执行；
+    续期失败超过 ttl（锁可能已被他人获取）即视为丢失，任务经 job_lock_held() 在下一步前停止
+    """
+
+    def __init__(self, redis_conn, name, ttl=60, heartbeat=20):
+        if heartbeat >= ttl:
+            raise ValueError("heartbeat must be shorter than ttl")
+        self.redis = redis_conn
+        self.name = name
+        self.key = f"scheduler:job:{name}"
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._renew = redis_conn.register_script(_RENEW_SCRIPT)
+        self._release = redis_conn.register_script(_RELEASE_SCRIPT)
+        self._held = False
+        self._last_renewed = 0.0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def held(self):
+        return self._held
+
+    def acquire(self):
+        if not self.redis.set(self.key, self.token, nx=True, px=self.ttl * 1000):
+            return False
+        self._held = True
+        self._last_renewed = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name=f'job-lock-{self.name}', daemon=True)
+        self._thread.start()
+        return True
+
+    def release(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=self.heartbeat)
+        if self._held:
+            self._held = False
+            try:
+                self._release(keys=[self.key], args=[self.token])
+            except Exception:
+                traceback.print_exc()
+
+    def _run(self):
+        while not self._stop_event.wait(self.heartbeat):
+            try:
+                if self._renew(keys=[self.key], args=[self.token, self.ttl * 1000]):
+                    self._last_renewed = time.monotonic()
+                    continue
+                self._held = False
+            except Exception:
+                traceback.print_exc()
+                if time.monotonic() - self._last_renewed < self.ttl - self.heartbeat:
+                    continue
+                self._held = False
+            print(f"[{datetime.now()}] Job lock {self.key} lost by {self.token}")
+            return
+
+    def __enter__(self):
+        _current_job.lock = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_job.lock = None
+        self.release()
+        return False
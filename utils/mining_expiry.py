@@ -0,0 +1,84 @@
+from datetime import datetime, timezone
+from flask import current_app
+from sqlalchemy import select
+from extensions import db, redis_conn
+from models import ActiveMiningSession
+from utils.mining_settlement import MINING_DURATION, settle_session_rows, claim_sessions_by_ids
+from utils.weight_dirty import mark_weight_dirty
+
+# 挖矿到期索引：ZSET，member=mining_history_id，score=mined_at+24h（UTC 时间戳）
+EXPIRY_ZSET_KEY = 'mining:expiry'
+
+
+def _expires_at(mined_at):
+    return (mined_at + MINING_DURATION).replace(tzinfo=timezone.utc).timestamp()
+
+
+def schedule_expiry(mining_history_id, mined_at):
+    try:
+        redis_conn.zadd(EXPIRY_ZSET_KEY, {mining_history_id: _expires_at(mined_at)})
+    except Exception as e:
+        # 索引缺失由定时全量对账兜底
+        current_app.logger.warning(f"Mining expiry schedule failed for {mining_history_id}: {e}")
+
+
+def cancel_expiry(mining_history_id):
+    try:
+        redis_conn.zrem(EXPIRY_ZSET_KEY, mining_history_id)
+    except Exception as e:
+        current_app.logger.warning(f"Mining expiry cancel failed for {mining_history_id}: {e}")
+
+
+def due_session_ids(now, limit):
+    """返回已到期的 mining_history_id（不出队，结算成功后再 ZREM）"""
+    now_ts = now.replace(tzinfo=timezone.utc).timestamp()
+    return [int(m) for m in redis_conn.zrangebyscore(EXPIRY_ZSET_KEY, '-inf', now_ts, start=0, num=limit)]
+
+
+def settle_due_sessions(limit=500):
+    """
+    只处理 ZSET 中已到期的会话，开销 O(到期会话数)
+    被 /stop 锁住的会话留在索引中下次重试；已不在 active_mining_sessions 的会话直接出队
+    :return: 结算记录数
+    """
+    ids = due_session_ids(datetime.utcnow(), limit)
+    if not ids:
+        return 0
+
+    rows = claim_sessions_by_ids(ids, datetime.utcnow())
+    try:
+        user_ids = settle_session_rows(rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    mark_weight_dirty(*user_ids)
+
+    still_active = set(db.session.execute(
+        select(ActiveMiningSession.mining_history_id)
+        .where(ActiveMiningSession.mining_history_id.in_(ids))
+    ).scalars())
+    done = [i for i in ids if i not in still_active]
+    if done:
+        redis_conn.zrem(EXPIRY_ZSET_KEY, *done)
+
+    return len(rows)
+
+
+def rebuild_expiry_index(chunk_size=5000):
+    """按 active_mining_sessions 重建到期索引（启动时执行，Redis 被清空或淘汰后恢复）"""
+    last_id = 0
+    total = 0
+    while True:
+        rows = db.session.execute(
+            select(ActiveMiningSession.mining_history_id, ActiveMiningSession.mined_at)
+            .where(ActiveMiningSession.mining_history_id > last_id)
+            .order_by(ActiveMiningSession.mining_history_id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        redis_conn.zadd(EXPIRY_ZSET_KEY, {row.mining_history_id: _expires_at(row.mined_at) for row in rows})
+        total += len(rows)
+        last_id = rows[-1].mining_history_id
+    return total
@@ -1,8 +1,10 @@
 import math
-from sqlalchemy import func
-from datetime import datetime
+import random
+import numpy as np
+from sqlalchemy import func, text
+from datetime import datetime, timezone
 from extensions import db
-from models import InviteRecord
+from models import InviteRecord, WalletUser
 
 
 def calculate_user_weight(user, invite_counts=None):
@@ -12,6 +14,23 @@ def calculate_user_weight(user, invite_counts=None):
     :param invite_counts: 预查询的邀请字典 {address: count}
     :return: (总权重, 权重明细)
     """
+    account = user.points_account
+    invite_count = invite_counts.get(user.wallet_address, 0) if invite_counts else 0
+    return calculate_weight_from_values(
+        account.consecutive_days if account else None,
+        account.total_points if account else None,
+        invite_count
+    )
+
+
+def calculate_weight_from_values(consecutive_days, total_points, invite_count):
+    """
+    按原始字段计算权重，供不加载ORM对象的批量任务使用
+    :param consecutive_days: 连续签到天数（无积分账户时为None）
+    :param total_points: 总积分（无积分账户时为None）
+    :param invite_count: 邀请人数
+    :return: (总权重, 权重明细)
+    """
     weight = 0.0
     breakdown = {
         'consecutive_days': 0.0,
@@ -22,8 +41,8 @@ def calculate_user_weight(user, invite_counts=None):
     }
 
     # 1. 连续签到权重（4档位）
-    if user.points_account and user.points_account.consecutive_days is not None:
-        cd = user.points_account.consecutive_days
+    if consecutive_days is not None:
+        cd = consecutive_days
         if cd >= 30:
             breakdown['consecutive_days'] = 1.0
         elif cd >= 15:
@@ -35,8 +54,8 @@ def calculate_user_weight(user, invite_counts=None):
         weight += breakdown['consecutive_days']
 
     # 2. 总积分权重
-    if user.points_account and user.points_account.total_points is not None:
-        tp = float(user.points_account.total_points)
+    if total_points is not None:
+        tp = float(total_points)
         if tp >= 5000:
             breakdown['total_points'] = 1.0
         elif tp >= 3000:
@@ -46,7 +65,7 @@ def calculate_user_weight(user, invite_counts=None):
         weight += breakdown['total_points']
 
     # 3. 邀请好友权重
-    invite_count = invite_counts.get(user.wallet_address, 0) if invite_counts else 0
+    invite_count = invite_count or 0
     if invite_count >= 30:
         breakdown['invite_count'] = 1.0
     elif invite_count >= 10:
@@ -67,6 +86,12 @@ def calculate_user_weight(user, invite_counts=None):
 
     return min(weight, 5.0), breakdown
 
+# 挖矿奖励曲线参数：reward = base_reward * (1 - exp(-decay_rate * t)) * weight
+MINING_BASE_REWARD = 100
+MINING_DECAY_RATE = 0.0001
+MINING_MAX_DURATION = 86400  # 24小时
+
+
 def calculate_reward(start_time, weight, end_time):
     """
        计算用户挖矿积分持续24小时
@@ -76,12 +101,206 @@ def calculate_reward(start_time, weight, end_time):
     now = end_time or datetime.utcnow()
     elapsed = (now - start_time).total_seconds()
     elapsed = max(0, elapsed)
-    max_duration = 86400  # 24小时
+    max_duration = MINING_MAX_DURATION
     elapsed = min(elapsed, max_duration)
 
-    decay_rate = 0.0001
+    decay_rate = MINING_DECAY_RATE
     # 权重=5,单日最多100*5
-    base_reward = 100
+    base_reward = MINING_BASE_REWARD
 
     reward = base_reward * (1 - math.exp(-decay_rate * elapsed)) * weight
-    return str(round(reward, 18))
\ No newline at end of file
+    return str(round(reward, 18))
+
+
+# ========================
+# SQL 权重引擎：在 MySQL 内整批计算 daily_weight
+# 档位表与 calculate_weight_from_values 保持一致，后者为参考实现，
+# 由 check_weight_engine_parity 抽样校验两者结果
+# ========================
+
+# (下限, 权重)，按下限从高到低匹配
+CONSECUTIVE_DAYS_TIERS = [(30, 1.0), (15, 0.8), (7, 0.5)]
+CONSECUTIVE_DAYS_FLOOR = 0.1  # 有积分账户但未达任何档位
+TOTAL_POINTS_TIERS = [(5000, 1.0), (3000, 0.5), (1000, 0.3)]
+INVITE_COUNT_TIERS = [(30, 1.0), (10, 0.5), (5, 0.2)]
+MAX_WEIGHT = 5.0
+
+INVITE_COUNT_SQL = (
+    "(SELECT COUNT(*) FROM invite_records ir "
+    "WHERE ir.inviter_address = LOWER(wu.wallet_address))"
+)
+
+
+def _tier_case_sql(column, tiers, default):
+    whens = " ".join(f"WHEN {column} >= {floor} THEN {value}" for floor, value in tiers)
+    return f"CASE {whens} ELSE {default} END"
+
+
+def weight_expression_sql():
+    """生成与 calculate_weight_from_values 等价的 SQL 权重表达式（别名 wu / upa）"""
+    consecutive = (
+        "CASE WHEN upa.consecutive_days IS NULL THEN 0 ELSE "
+        f"{_tier_case_sql('upa.consecutive_days', CONSECUTIVE_DAYS_TIERS, CONSECUTIVE_DAYS_FLOOR)} END"
+    )
+    total_points = _tier_case_sql('upa.total_points', TOTAL_POINTS_TIERS, 0)
+    # 档位判断放进子查询内部，每行只执行一次 COUNT
+    invites = (
+        f"(SELECT {_tier_case_sql('COUNT(*)', INVITE_COUNT_TIERS, 0)} FROM invite_records ir "
+        "WHERE ir.inviter_address = LOWER(wu.wallet_address))"
+    )
+    return f"LEAST({MAX_WEIGHT}, ({consecutive}) + ({total_points}) + ({invites}))"
+
+
+def update_daily_weight_sql(chunk_size=50000):
+    """
+    按 id 区间分块执行 UPDATE wallet_users LEFT JOIN user_points_accounts，
+    权重完全在数据库内计算，无逐行 Python 往返
+    :return: 更新的行数
+    """
+    min_id, max_id = db.session.query(func.min(WalletUser.id), func.max(WalletUser.id)).one()
+    if min_id is None:
+        return 0
+
+    statement = text(
+        "UPDATE wallet_users wu "
+        "LEFT JOIN user_points_accounts upa ON upa.wallet_user_id = wu.id "
+        f"SET wu.daily_weight = {weight_expression_sql()}, "
+        "wu.last_weight_update = :now "
+        "WHERE wu.id >= :lo AND wu.id < :hi"
+    )
+
+    updated = 0
+    for lo in range(min_id, max_id + 1, chunk_size):
+        result = db.session.execute(statement, {
+            'now': datetime.now(timezone.utc),
+            'lo': lo,
+            'hi': lo + chunk_size
+        })
+        db.session.commit()
+        updated += result.rowcount
+        print(f"SQL weight engine: ids [{lo}, {lo + chunk_size}) done, {updated} rows updated")
+
+    return updated
+
+
+def check_weight_engine_parity(sample_size=200, tolerance=1e-6):
+    """
+    抽样比对 SQL 引擎与 Python 参考实现的权重结果
+    从随机 id 起按主键顺序取 sample_size 个用户，避免 ORDER BY RAND() 全表排序
+    :return: {'checked': 抽样数, 'mismatches': [{id, wallet_address, python, sql}, ...]}
+    """
+    min_id, max_id = db.session.query(func.min(WalletUser.id), func.max(WalletUser.id)).one()
+    if min_id is None:
+        return {'checked': 0, 'mismatches': []}
+
+    start_id = random.randint(min_id, max_id)
+    rows = db.session.execute(text(
+        "SELECT wu.id, wu.wallet_address, upa.consecutive_days, upa.total_points, "
+        f"{INVITE_COUNT_SQL} AS invite_count, "
+        f"{weight_expression_sql()} AS sql_weight "
+        "FROM wallet_users wu "
+        "LEFT JOIN user_points_accounts upa ON upa.wallet_user_id = wu.id "
+        "WHERE wu.id >= :start_id ORDER BY wu.id LIMIT :limit"
+    ), {'start_id': start_id, 'limit': sample_size}).all()
+
+    # Python 侧独立查询邀请数量，不复用 SQL 子查询结果
+    addresses = [row.wallet_address.lower() for row in rows]
+    invite_counts = dict(db.session.query(
+        InviteRecord.inviter_address,
+        func.count(InviteRecord.id)
+    ).filter(
+        InviteRecord.inviter_address.in_(addresses)
+    ).group_by(
+        InviteRecord.inviter_address
+    ).all()) if addresses else {}
+
+    mismatches = []
+    for row in rows:
+        python_weight, _ = calculate_weight_from_values(
+            row.consecutive_days,
+            row.total_points,
+            invite_counts.get(row.wallet_address.lower(), 0)
+        )
+        if abs(python_weight - float(row.sql_weight)) > tolerance:
+            mismatches.append({
+                'id': row.id,
+                'wallet_address': row.wallet_address,
+                'python': python_weight,
+                'sql': float(row.sql_weight)
+            })
+
+    return {'checked': len(rows), 'mismatches': mismatches}
+
+
+# ========================
+# 批量（NumPy 向量化）接口：与 calculate_reward / calculate_weight_from_values 逐元素结果一致
+# ========================
+
+def calculate_rewards_batch(start_times, weights, end_times=None):
+    """
+    批量计算挖矿积分
+    :param start_times: 开始时间序列（naive UTC datetime）
+    :param weights: 权重快照序列
+    :param end_times: 结束时间序列，None 或元素为 None 时取当前时间
+    :return: float64 数组，需要与 calculate_reward 相同的字符串格式时用 format_rewards
+    """
+    n = len(start_times)
+    if n == 0:
+        return np.zeros(0, dtype=np.float64)
+
+    now = datetime.utcnow()
+    if end_times is None:
+        end_times = [now] * n
+    else:
+        end_times = [t or now for t in end_times]
+
+    starts = np.array(start_times, dtype='datetime64[us]')
+    ends = np.array(end_times, dtype='datetime64[us]')
+
+    # 与 timedelta.total_seconds() 相同：微秒整数 / 10**6
+    elapsed = (ends - starts).astype(np.int64) / 10 ** 6
+    elapsed = np.clip(elapsed, 0, MINING_MAX_DURATION)  # 最多24小时
+
+    decay_rate = MINING_DECAY_RATE
+    base_reward = MINING_BASE_REWARD
+
+    # exp 逐元素走 math.exp（C 层循环），保证与标量版本按位一致
+    exponent = -decay_rate * elapsed
+    decay = np.fromiter(map(math.exp, exponent.tolist()), dtype=np.float64, count=n)
+
+    return base_reward * (1 - decay) * np.asarray(weights, dtype=np.float64)
+
+
+def format_rewards(rewards):
+    """批量结果转为 calculate_reward 的字符串格式"""
+    return [str(round(float(r), 18)) for r in rewards]
+
+
+def _tier_select(values, tiers, default):
+    conditions = [values >= floor for floor, _ in tiers]
+    choices = [value for _, value in tiers]
+    return np.select(conditions, choices, default=default)
+
+
+def calculate_user_weights_batch(consecutive_days, total_points, invite_counts):
+    """
+    批量计算用户权重
+    :param consecutive_days: 连续签到天数序列（无积分账户为 None）
+    :param total_points: 总积分序列（无积分账户为 None，Decimal 可直接传入）
+    :param invite_counts: 邀请人数序列
+    :return: float64 权重数组（上限 5.0）
+    """
+    cd = np.asarray(consecutive_days, dtype=np.float64)  # None -> nan
+    tp = np.asarray(total_points, dtype=np.float64)
+    ic = np.nan_to_num(np.asarray(invite_counts, dtype=np.float64))
+
+    # nan 的比较结果为 False，需单独处理"无积分账户"
+    cd_weight = np.where(
+        np.isnan(cd), 0.0,
+        _tier_select(cd, CONSECUTIVE_DAYS_TIERS, CONSECUTIVE_DAYS_FLOOR)
+    )
+    tp_weight = _tier_select(tp, TOTAL_POINTS_TIERS, 0.0)
+    ic_weight = _tier_select(ic, INVITE_COUNT_TIERS, 0.0)
+
+    # 累加顺序与标量版本一致，保证浮点结果相同
+    return np.minimum(cd_weight + tp_weight + ic_weight, MAX_WEIGHT)
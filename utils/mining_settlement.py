@@ -0,0 +1,161 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import case, delete, func, insert, select, text, update
+from extensions import db
+from models import ActiveMiningSession, MiningHistory, PointsHistory, UserPointsAccount
+from utils.mining_service import calculate_rewards_batch, format_rewards
+from utils.leader_election import job_lock_held
+from utils.weight_dirty import mark_weight_dirty
+
+MINING_DURATION = timedelta(seconds=86400)
+
+
+def claim_expired_sessions(now, limit):
+    """
+    从 active_mining_sessions 锁定一批已满24小时的会话（SKIP LOCKED 跳过正在被 /stop 处理的行）
+    :return: [(id=mining_history_id, wallet_user_id, mined_at, weight_snapshot), ...]
+    """
+    return db.session.execute(
+        select(
+            ActiveMiningSession.mining_history_id.label('id'),
+            ActiveMiningSession.wallet_user_id,
+            ActiveMiningSession.mined_at,
+            ActiveMiningSession.weight_snapshot
+        ).where(
+            ActiveMiningSession.mined_at <= now - MINING_DURATION
+        ).order_by(
+            ActiveMiningSession.mined_at
+        ).limit(limit).with_for_update(skip_locked=True)
+    ).all()
+
+
+def claim_sessions_by_ids(mining_history_ids, now):
+    """按到期索引给出的 mining_history_id 锁定会话（仍校验已满24小时）"""
+    if not mining_history_ids:
+        return []
+    return db.session.execute(
+        select(
+            ActiveMiningSession.mining_history_id.label('id'),
+            ActiveMiningSession.wallet_user_id,
+            ActiveMiningSession.mined_at,
+            ActiveMiningSession.weight_snapshot
+        ).where(
+            ActiveMiningSession.mining_history_id.in_(mining_history_ids),
+            ActiveMiningSession.mined_at <= now - MINING_DURATION
+        ).order_by(
+            ActiveMiningSession.mined_at
+        ).with_for_update(skip_locked=True)
+    ).all()
+
+
+def settle_session_rows(rows):
+    """
+    批量结算已锁定的挖矿记录（不提交，由调用方控制事务）
+    1. 向量化计算奖励
+    2. 按 wallet_user_id 升序一次性锁定积分账户，缺失账户批量补建
+    3. 积分账户、挖矿记录各一条 UPDATE，积分流水一条多行 INSERT，并移出 active_mining_sessions
+    :return: 结算涉及的 wallet_user_id 列表
+    """
+    if not rows:
+        return []
+
+    rewards = format_rewards(calculate_rewards_batch(
+        [row.mined_at for row in rows],
+        [row.weight_snapshot for row in rows],
+        [row.mined_at + MINING_DURATION for row in rows]
+    ))
+
+    reward_by_session = {row.id: reward for row, reward in zip(rows, rewards)}
+    total_by_user = defaultdict(Decimal)
+    for row, reward in zip(rows, rewards):
+        total_by_user[row.wallet_user_id] += Decimal(reward)
+    user_ids = sorted(total_by_user)
+
+    # 固定顺序加锁，避免与签到/提现等路径死锁
+    locked_ids = set(db.session.execute(
+        select(UserPointsAccount.wallet_user_id)
+        .where(UserPointsAccount.wallet_user_id.in_(user_ids))
+        .order_by(UserPointsAccount.wallet_user_id)
+        .with_for_update()
+    ).scalars())
+
+    missing_ids = [uid for uid in user_ids if uid not in locked_ids]
+    if missing_ids:
+        db.session.execute(insert(UserPointsAccount), [
+            {
+                'wallet_user_id': uid,
+                'total_points': 0,
+                'consecutive_days': 0,
+                'milestone_reached': 0,
+                'withdraw_nonce': 0
+            }
+            for uid in missing_ids
+        ])
+
+    db.session.execute(
+        update(UserPointsAccount)
+        .where(UserPointsAccount.wallet_user_id.in_(user_ids))
+        .values(total_points=UserPointsAccount.total_points + case(
+            total_by_user, value=UserPointsAccount.wallet_user_id
+        ))
+        .execution_options(synchronize_session=False)
+    )
+
+    db.session.execute(
+        update(MiningHistory)
+        .where(MiningHistory.id.in_(list(reward_by_session)))
+        .values(
+            points_earned=case(reward_by_session, value=MiningHistory.id),
+            end_time=func.date_add(MiningHistory.mined_at, text('INTERVAL 86400 SECOND')),
+            is_settled=True,
+            is_mining=False
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+    db.session.execute(
+        delete(ActiveMiningSession)
+        .where(ActiveMiningSession.mining_history_id.in_(list(reward_by_session)))
+        .execution_options(synchronize_session=False)
+    )
+
+    now = datetime.utcnow()
+    db.session.execute(insert(PointsHistory), [
+        {
+            'wallet_user_id': row.wallet_user_id,
+            'change_type': 'mining_reward',
+            'change_amount': Decimal(reward),
+            'description': 'Mining session reward settled',
+            'created_at': now
+        }
+        for row, reward in zip(rows, rewards)
+    ])
+
+    return user_ids
+
+
+def settle_expired_in_chunks(chunk_size=500):
+    """
+    分块结算全部到期挖矿记录，每块独立事务，锁持有时间与活跃矿工总数无关
+    :return: (结算记录数, 涉及用户数)
+    """
+    settled = 0
+    users = 0
+    # 任务锁丢失（领导权切换）时停止，剩余记录由新 leader 结算
+    while job_lock_held():
+        rows = claim_expired_sessions(datetime.utcnow(), chunk_size)
+        if not rows:
+            break
+        try:
+            user_ids = settle_session_rows(rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        mark_weight_dirty(*user_ids)
+        settled += len(rows)
+        users += len(user_ids)
+        if len(rows) < chunk_size:
+            break
+    return settled, users
@@ -0,0 +1,132 @@
+import json
+import os
+from datetime import datetime
+from flask import current_app
+from extensions import redis_conn
+from utils.mining_service import (
+    calculate_reward, MINING_BASE_REWARD, MINING_DECAY_RATE, MINING_MAX_DURATION
+)
+
+# 无进行中挖矿时的状态文档缓存时间（秒）；进行中的文档缓存到24小时到期为止
+STATUS_CACHE_TTL = int(os.getenv('MINING_STATUS_CACHE_TTL', 300))
+STATUS_CACHE_PREFIX = 'mining:status:'
+# 每个地址的失效代数：开始 / 停止挖矿时递增，回源期间发生过失效则放弃写缓存
+STATUS_GENERATION_PREFIX = 'mining:status:gen:'
+STATUS_GENERATION_TTL = MINING_MAX_DURATION + 3600
+
+# 仅当代数与回源前读到的一致时写入（代数 key 不存在视为 0）
+_CAS_SET_SCRIPT = """
+if (redis.call('get', KEYS[1]) or '0') == ARGV[1] then
+    return redis.call('set', KEYS[2], ARGV[2], 'EX', ARGV[3])
+end
+return 0
+"""
+_cas_set = redis_conn.register_script(_CAS_SET_SCRIPT)
+
+
+def _cache_key(wallet_address):
+    return f"{STATUS_CACHE_PREFIX}{wallet_address.lower()}"
+
+
+def _generation_key(wallet_address):
+    return f"{STATUS_GENERATION_PREFIX}{wallet_address.lower()}"
+
+
+def build_status_document(last_active, last_settled):
+    """
+    由数据库记录生成状态文档：只保存奖励曲线参数，当前奖励在读取时按闭式公式计算
+    """
+    if last_active:
+        return {
+            'active': True,
+            'mined_at': last_active.mined_at.isoformat(),
+            'weight_snapshot': last_active.weight_snapshot
+        }
+    return {
+        'active': False,
+        'last_earned_points': last_settled.points_earned if last_settled else None,
+        'last_earned_time': last_settled.end_time.isoformat() if last_settled and last_settled.end_time else None
+    }
+
+
+def render_status(doc, now=None):
+    """状态文档 -> /api/mining/status 响应体（附带曲线参数和服务器时间，前端可本地外推）"""
+    now = now or datetime.utcnow()
+
+    if not doc['active']:
+        return {
+            'isMining': False,
+            'last_earned_points': doc['last_earned_points'],
+            'last_earned_time': doc['last_earned_time'],
+            'server_time': now.isoformat()
+        }
+
+    mined_at = datetime.fromisoformat(doc['mined_at'])
+    elapsed = (now - mined_at).total_seconds()
+    is_mining = elapsed < MINING_MAX_DURATION
+    elapsed = min(elapsed, MINING_MAX_DURATION)
+
+    return {
+        'isMining': is_mining,
+        'start_time': doc['mined_at'],
+        'current_reward': str(calculate_reward(mined_at, doc['weight_snapshot'], end_time=now)),
+        'elapsed_seconds': int(elapsed),
+        'weight_snapshot': doc['weight_snapshot'],
+        'last_earned_points': None,
+        'last_earned_time': None,
+        'reward_curve': {
+            'base_reward': MINING_BASE_REWARD,
+            'decay_rate': MINING_DECAY_RATE,
+            'max_duration': MINING_MAX_DURATION,
+            'weight': doc['weight_snapshot']
+        },
+        'server_time': now.isoformat()
+    }
+
+
+def get_cached_status(wallet_address):
+    """
+    一次往返读取状态文档和失效代数
+    :return: (doc, generation)；未命中时 doc 为 None（调用方回源数据库后带 generation 调用 cache_status），
+             Redis 不可用时 generation 也为 None（不写缓存）
+    """
+    try:
+        pipe = redis_conn.pipeline(transaction=False)
+        pipe.get(_cache_key(wallet_address))
+        pipe.get(_generation_key(wallet_address))
+        raw, generation = pipe.execute()
+    except Exception as e:
+        current_app.logger.warning(f"Mining status cache read failed: {e}")
+        return None, None
+    generation = generation.decode() if isinstance(generation, bytes) else (generation or '0')
+    return (json.loads(raw) if raw else None), generation
+
+
+def cache_status(wallet_address, doc, generation, now=None):
+    """回源结果写入缓存；generation 为回源前读到的代数，期间有并发的开始 / 停止则不写（避免旧文档覆盖）"""
+    if generation is None:
+        return
+    if doc['active']:
+        # 到期后状态变化（isMining=False / 结算），缓存随之失效
+        now = now or datetime.utcnow()
+        remaining = MINING_MAX_DURATION - (now - datetime.fromisoformat(doc['mined_at'])).total_seconds()
+        ttl = max(1, int(remaining))
+    else:
+        ttl = STATUS_CACHE_TTL
+    try:
+        _cas_set(keys=[_generation_key(wallet_address), _cache_key(wallet_address)],
+                 args=[generation, json.dumps(doc), ttl])
+    except Exception as e:
+        current_app.logger.warning(f"Mining status cache write failed: {e}")
+
+
+def invalidate_status(wallet_address):
+    """数据库提交后调用：递增代数并删除文档，正在回源的旧结果不会再写入"""
+    try:
+        pipe = redis_conn.pipeline()
+        pipe.incr(_generation_key(wallet_address))
+        pipe.expire(_generation_key(wallet_address), STATUS_GENERATION_TTL)
+        pipe.delete(_cache_key(wallet_address))
+        pipe.execute()
+    except Exception as e:
+        current_app.logger.warning(f"Mining status cache invalidate failed: {e}")
@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from extensions import redis_conn
+from utils.chain_client import get_contract, get_w3
+
+# 提现合约 nonces() 缓存：进程内 LRU（短 TTL）+ Redis（由 read_chain_nonce 回源读取与事件监听写入）
+NONCE_KEY_PREFIX = 'withdraw:nonce:'
+NONCE_WATCHER_KEY = 'withdraw:nonce:watcher'
+NONCE_CACHE_TTL = int(os.getenv('NONCE_CACHE_TTL', '300'))
+NONCE_LRU_TTL = float(os.getenv('NONCE_LRU_TTL', '5'))
+NONCE_LRU_SIZE = int(os.getenv('NONCE_LRU_SIZE', '10000'))
+# 事件监听超过该时间未追上最新区块时，缓存一律视为不可信
+NONCE_WATCHER_MAX_LAG = float(os.getenv('NONCE_WATCHER_MAX_LAG', '30'))
+NONCE_WATCHER_MAX_BLOCKS = int(os.getenv('NONCE_WATCHER_MAX_BLOCKS', '2000'))
+
+WITHDRAW_CONTRACT_ADDRESS = os.getenv('WITHDRAW_CONTRACT_ADDRESS')
+
+_lru = OrderedDict()
+_lru_lock = threading.Lock()
+
+
+def _key(address):
+    return f"{NONCE_KEY_PREFIX}{address.lower()}"
+
+
+def _remember(address, nonce):
+    with _lru_lock:
+        _lru[address.lower()] = (nonce, time.monotonic())
+        _lru.move_to_end(address.lower())
+        while len(_lru) > NONCE_LRU_SIZE:
+            _lru.popitem(last=False)
+
+
+def _forget(address):
+    with _lru_lock:
+        _lru.pop(address.lower(), None)
+
+
+def get_cached_nonce(address):
+    """
+    返回缓存的链上 nonce，不可信（缺失 / 事件监听落后 / Redis 不可用）时返回 None，由调用方回源链上
+    """
+    with _lru_lock:
+        entry = _lru.get(address.lower())
+        if entry is not None and time.monotonic() - entry[1] <= NONCE_LRU_TTL:
+            _lru.move_to_end(address.lower())
+            return entry[0]
+
+    try:
+        raw_nonce, raw_watcher = redis_conn.mget(_key(address), NONCE_WATCHER_KEY)
+    except Exception as e:
+        current_app.logger.warning(f"Nonce cache read failed for {address}: {e}")
+        return None
+    if raw_nonce is None or raw_watcher is None:
+        return None
+    if time.time() - json.loads(raw_watcher)['ts'] > NONCE_WATCHER_MAX_LAG:
+        return None
+
+    nonce = int(raw_nonce)
+    _remember(address, nonce)
+    return nonce
+
+
+def store_nonce(address, nonce):
+    _remember(address, nonce)
+    try:
+        redis_conn.set(_key(address), nonce, ex=NONCE_CACHE_TTL)
+    except Exception as e:
+        current_app.logger.warning(f"Nonce cache write failed for {address}: {e}")
+
+
+def invalidate_nonce(address):
+    _forget(address)
+    try:
+        redis_conn.delete(_key(address))
+    except Exception as e:
+        current_app.logger.warning(f"Nonce cache invalidate failed for {address}: {e}")
+
+
+def poll_withdraw_events(max_blocks=NONCE_WATCHER_MAX_BLOCKS):
+    """
+    拉取提现合约 Withdraw(user, amount, nonce) 事件，把 user 的缓存 nonce 推进到 nonce + 1
+    只有追上最新区块时才刷新心跳时间，落后期间缓存自动失效
+    :return: 处理的事件数
+    """
+    w3 = get_w3()
+    contract = get_contract(WITHDRAW_CONTRACT_ADDRESS, 'WithdrawWithSignature.json')
+    latest = w3.eth.block_number
+
+    raw_state = redis_conn.get(NONCE_WATCHER_KEY)
+    state = json.loads(raw_state) if raw_state else None
+    # 首次运行不回溯历史区块，缓存只由此后的事件与回源读取填充
+    from_block = state['block'] + 1 if state else latest
+    to_block = min(latest, from_block + max_blocks - 1)
+
+    events = []
+    if from_block <= to_block:
+        events = contract.events.Withdraw.get_logs(from_block=from_block, to_block=to_block)
+
+    pipe = redis_conn.pipeline()
+    for event in events:
+        user = event['args']['user']
+        next_nonce = event['args']['nonce'] + 1
+        pipe.set(_key(user), next_nonce, ex=NONCE_CACHE_TTL)
+        _remember(user, next_nonce)
+    caught_up = to_block >= latest
+    pipe.set(NONCE_WATCHER_KEY, json.dumps({
+        'block': max(to_block, from_block - 1),
+        'ts': time.time() if caught_up else (state or {}).get('ts', 0)
+    }))
+    pipe.execute()
+    return len(events)
@@ -0,0 +1,94 @@
+from datetime import datetime, timezone
+from sqlalchemy import insert, select, update
+from extensions import db
+from models import AirdropAddress, PointsHistory, UserPointsAccount, WalletUser
+
+
+def credit_points_by_address(addresses, amount, change_type, description):
+    """
+    按钱包地址批量加积分（不提交，由调用方控制事务）
+    1. 一次查询把地址解析为 wallet_user_id（未注册的地址跳过）
+    2. 按 wallet_user_id 升序一次性锁定积分账户，缺失账户批量补建
+    3. 积分账户一条 UPDATE，积分流水一条多行 INSERT
+    :return: 入账的 wallet_user_id 列表（升序）
+    """
+    if not addresses:
+        return []
+
+    user_ids = sorted(set(db.session.execute(
+        select(WalletUser.id).where(WalletUser.wallet_address.in_(addresses))
+    ).scalars()))
+    if not user_ids:
+        return []
+
+    # 固定顺序加锁，避免与签到/提现/挖矿结算等路径死锁
+    locked_ids = set(db.session.execute(
+        select(UserPointsAccount.wallet_user_id)
+        .where(UserPointsAccount.wallet_user_id.in_(user_ids))
+        .order_by(UserPointsAccount.wallet_user_id)
+        .with_for_update()
+    ).scalars())
+
+    missing_ids = [uid for uid in user_ids if uid not in locked_ids]
+    if missing_ids:
+        db.session.execute(insert(UserPointsAccount), [
+            {
+                'wallet_user_id': uid,
+                'total_points': 0,
+                'consecutive_days': 0,
+                'milestone_reached': 0,
+                'withdraw_nonce': 0
+            }
+            for uid in missing_ids
+        ])
+
+    db.session.execute(
+        update(UserPointsAccount)
+        .where(UserPointsAccount.wallet_user_id.in_(user_ids))
+        .values(total_points=UserPointsAccount.total_points + amount)
+        .execution_options(synchronize_session=False)
+    )
+
+    now = datetime.now(timezone.utc)
+    db.session.execute(insert(PointsHistory), [
+        {
+            'wallet_user_id': uid,
+            'change_type': change_type,
+            'change_amount': amount,
+            'created_at': now,
+            'description': description
+        }
+        for uid in user_ids
+    ])
+
+    return user_ids
+
+
+def grant_airdrop_points(addresses, base_reward):
+    """
+    积分空投一块地址（不提交）：
+    1. 按 id 升序锁定其中仍未发放的地址行（加锁读取最新提交版本，领取锁已随先前的提交释放时，
+       并发的发放任务已处理的地址在这里被排除）
+    2. 只对这些地址入账并标记已发放，与入账在同一事务内
+    :return: (入账的 wallet_user_id 列表, 本次实际发放的地址列表)
+    """
+    rows = db.session.execute(
+        select(AirdropAddress.id, AirdropAddress.address)
+        .where(AirdropAddress.address.in_(addresses), AirdropAddress.is_distributed == False)
+        .order_by(AirdropAddress.id)
+        .with_for_update()
+    ).all()
+    if not rows:
+        return [], []
+
+    granted = [row.address for row in rows]
+    credited_ids = credit_points_by_address(
+        granted, base_reward, "airdrop_points", f"Airdrop points granted: {base_reward}"
+    )
+    db.session.execute(
+        update(AirdropAddress)
+        .where(AirdropAddress.id.in_([row.id for row in rows]))
+        .values(is_distributed=True, distributed_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    return credited_ids, granted
@@ -0,0 +1,338 @@
+import asyncio
+import os
+import traceback
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from sqlalchemy import update
+from extensions import db
+from models import TrackedTransaction
+from utils.chain_batch import get_receipts, get_transaction_counts
+from utils.chain_client import get_account, get_w3
+from utils.tx_executor import replacement_fees
+
+load_dotenv()
+
+# 新区块探测间隔（秒）
+RECEIPT_POLL_INTERVAL = float(os.getenv('RECEIPT_POLL_INTERVAL', '2'))
+# 每个区块最多检查的待确认交易数（回执按 RPC_BATCH_LIMIT 分包批量查询）
+RECEIPT_TRACK_LIMIT = int(os.getenv('RECEIPT_TRACK_LIMIT', '2000'))
+# 签名地址下一个待上链的交易超过该秒数未确认时，同 nonce 加价替换
+TX_BUMP_AFTER = int(os.getenv('TX_BUMP_AFTER', '120'))
+TX_BUMP_RATIO = float(os.getenv('TX_BUMP_RATIO', '1.125'))
+TX_MAX_BUMPS = int(os.getenv('TX_MAX_BUMPS', '5'))
+# 登记后超过该秒数仍未确认的交易输出告警（加价次数用尽 / 无法替换 / 前序 nonce 卡住）
+TX_STUCK_ALERT_AFTER = int(os.getenv('TX_STUCK_ALERT_AFTER', '1800'))
+# 可由追踪服务重新签名的私钥（环境变量名，逗号分隔）
+TX_SIGNER_KEY_VARS = os.getenv('TX_SIGNER_KEY_VARS', 'DEV_PRIVATE_KEY,COMMUNITY_PRIVATE_KEY')
+
+_handlers = {}
+_verifiers = {}
+
+
+def receipt_handler(kind, verify_dropped=None):
+    """
+    注册回执处理函数 handler(entity_ids, receipt)
+    - receipt 为 None 表示交易已被同 nonce 的其他交易替换，不会再上链
+    - 处理函数只修改会话、不提交，由追踪服务与交易状态一并提交
+    - 可返回一个无参回调，在提交成功后执行（如外部通知）
+    :param verify_dropped: 判定 dropped 前的链上回查 verify(tracked)，
+        找到占用该 nonce 的未登记交易（如其他进程的加价替换）时返回其回执，按该回执处理；
+        返回 None 才按 dropped 处理，抛出异常则本轮保持 pending
+    """
+    def decorator(func):
+        _handlers[kind] = func
+        if verify_dropped is not None:
+            _verifiers[kind] = verify_dropped
+        return func
+    return decorator
+
+
+def track_pending(pending, kind, entity_ids):
+    """
+    登记执行器发出的交易（PendingTx），此后加价替换只由追踪服务执行并登记新哈希，
+    同一执行器的 wait_all() 不再替换它
+    """
+    track_transaction(pending.tx_hashes[0], kind, entity_ids, pending.account.address, pending.tx)
+    pending.tracked = True
+
+
+def track_transaction(tx_hash, kind, entity_ids, sender, tx):
+    """
+    登记已广播的交易（加入当前会话，由调用方与业务状态一起提交）
+    :param tx: 签名前的交易参数（含 nonce 与费用），超时未确认时据此加价替换
+    """
+    tx_hash = get_w3().to_hex(tx_hash)
+    db.session.add(TrackedTransaction(
+        tx_hash=tx_hash,
+        tx_hashes=[tx_hash],
+        tx={k: get_w3().to_hex(v) if isinstance(v, (bytes, bytearray)) else v for k, v in tx.items()},
+        kind=kind,
+        entity_ids=list(entity_ids),
+        sender=sender,
+        nonce=tx['nonce'],
+        last_sent_at=datetime.utcnow()
+    ))
+
+
+def load_signers(key_vars=TX_SIGNER_KEY_VARS):
+    """签名地址 -> 账户，用于替换交易的重新签名"""
+    signers = {}
+    for var in key_vars.split(','):
+        private_key = os.getenv(var.strip())
+        if private_key:
+            account = get_account(private_key)
+            signers[account.address] = account
+    return signers
+
+
+class ReceiptTracker:
+    """
+    回执追踪服务：单个 asyncio 事件循环，每出一个新区块
+    1. 批量读取待确认交易各签名地址已上链的 nonce
+    2. 一次 JSON-RPC 批量请求查询全部待确认哈希的回执
+    3. 有回执的按 kind 回调处理函数；没有回执且签名地址 nonce 已越过的，连续两个区块确认后按 dropped 处理
+       （回执查询出错不算没有回执；dropped 前先经 verify_dropped 回查链上）
+    4. 签名地址下一个待上链的交易超过 bump_after 秒未确认的，同 nonce 加价重新签名广播，
+       新哈希先登记到同一条记录再广播，任一哈希的回执都按该记录处理
+    链上读取与数据库操作复用共享的连接池客户端 / 会话，放到线程中执行，不阻塞事件循环
+    """
+
+    def __init__(self, app, poll_interval=RECEIPT_POLL_INTERVAL, limit=RECEIPT_TRACK_LIMIT,
+                 bump_after=TX_BUMP_AFTER, bump_ratio=TX_BUMP_RATIO, max_bumps=TX_MAX_BUMPS,
+                 stuck_alert_after=TX_STUCK_ALERT_AFTER, kinds=None, min_age=0):
+        self.app = app
+        self.poll_interval = poll_interval
+        self.limit = limit
+        self.bump_after = bump_after
+        self.bump_ratio = bump_ratio
+        self.max_bumps = max_bumps
+        self.stuck_alert_after = stuck_alert_after
+        # 只检查指定业务类型、登记超过 min_age 秒的交易（对账任务在追踪服务停机时兜底）
+        self.kinds = kinds
+        self.min_age = min_age
+        self.signers = load_signers()
+        self.last_block = None
+        # 上一轮已判定为被替换的交易 id，下一轮仍无回执才处理（避免故障切换到落后节点时误判）
+        self._suspects = set()
+        # 已告警的交易 id，每条只告警一次
+        self._alerted = set()
+
+    async def run(self, stop_event):
+        print(f"Receipt tracker started, polling every {self.poll_interval}s")
+        while not stop_event.is_set():
+            try:
+                block = await asyncio.to_thread(lambda: get_w3().eth.block_number)
+                if block != self.last_block:
+                    await self.check()
+                    self.last_block = block
+            except Exception:
+                print(f"[{datetime.now()}] Receipt tracker poll failed:")
+                traceback.print_exc()
+            try:
+                await asyncio.wait_for(stop_event.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+        print("Receipt tracker stopped.")
+
+    async def check(self):
+        """检查一轮全部待确认交易，返回本轮处理完成的交易数"""
+        outstanding = await asyncio.to_thread(self._load_outstanding)
+        if not outstanding:
+            self._suspects.clear()
+            return 0
+
+        # 先读 nonce 再读回执：读 nonce 时已上链的交易，随后一定能查到回执
+        senders = sorted({t.sender for t in outstanding})
+        mined_nonces = await asyncio.to_thread(get_transaction_counts, senders, 'latest')
+        # 每条记录的全部候选哈希（含加价替换）合并为一次批量查询
+        candidates = [(t, tx_hash) for t in outstanding for tx_hash in (t.tx_hashes or [t.tx_hash])]
+        errors = set()
+        results = await asyncio.to_thread(get_receipts, [tx_hash for _, tx_hash in candidates], errors)
+        receipts = {}
+        # 有哈希查询出错的记录本轮不能判定为 dropped（出错与未上链同为 None）
+        unknown = set()
+        for index, ((t, _), receipt) in enumerate(zip(candidates, results)):
+            if receipt is not None:
+                receipts.setdefault(t.id, receipt)
+            elif index in errors:
+                unknown.add(t.id)
+
+        now = datetime.utcnow()
+        resolved = []
+        stale = []
+        suspects = set()
+        for t in outstanding:
+            receipt = receipts.get(t.id)
+            mined_nonce = mined_nonces.get(t.sender, -1)
+            if receipt is not None:
+                resolved.append((t, receipt))
+            elif t.id in unknown:
+                continue
+            elif mined_nonce > t.nonce:
+                if t.id in self._suspects:
+                    resolved.append((t, None))
+                else:
+                    suspects.add(t.id)
+            elif mined_nonce == t.nonce and \
+                    (now - (t.last_sent_at or t.created_at)).total_seconds() >= self.bump_after:
+                # 只替换队首：后续 nonce 是被它阻塞，而不是费用不足
+                stale.append(t)
+        self._suspects = suspects
+
+        if resolved:
+            await asyncio.to_thread(self._resolve_all, resolved)
+        if stale:
+            await asyncio.to_thread(self._replace_all, stale)
+        self._alert_stuck(outstanding, {t.id for t, _ in resolved}, now)
+        return len(resolved)
+
+    def _load_outstanding(self):
+        with self.app.app_context():
+            query = db.session.query(
+                TrackedTransaction.id,
+                TrackedTransaction.tx_hash,
+                TrackedTransaction.kind,
+                TrackedTransaction.entity_ids,
+                TrackedTransaction.sender,
+                TrackedTransaction.nonce,
+                TrackedTransaction.tx_hashes,
+                TrackedTransaction.tx,
+                TrackedTransaction.bumps,
+                TrackedTransaction.last_sent_at,
+                TrackedTransaction.created_at
+            ).filter(
+                TrackedTransaction.status == 'pending'
+            )
+            if self.kinds:
+                query = query.filter(TrackedTransaction.kind.in_(self.kinds))
+            if self.min_age:
+                created_before = datetime.utcnow() - timedelta(seconds=self.min_age)
+                query = query.filter(TrackedTransaction.created_at <= created_before)
+            return query.order_by(TrackedTransaction.id).limit(self.limit).all()
+
+    def _resolve_all(self, resolved):
+        with self.app.app_context():
+            for tracked, receipt in resolved:
+                self._resolve(tracked, receipt)
+
+    def _resolve(self, tracked, receipt):
+        handler = _handlers.get(tracked.kind)
+        if handler is None:
+            print(f"No receipt handler registered for {tracked.kind}, leaving {tracked.tx_hash} pending")
+            return
+
+        verify = _verifiers.get(tracked.kind)
+        if receipt is None and verify is not None:
+            try:
+                receipt = verify(tracked)
+            except Exception:
+                db.session.rollback()
+                print(f"[{datetime.now()}] Verifying dropped {tracked.tx_hash} failed, leaving it pending:")
+                traceback.print_exc()
+                return
+            if receipt is not None:
+                print(f"[{tracked.kind}] {tracked.tx_hash} nonce={tracked.nonce} was replaced by untracked "
+                      f"{get_w3().to_hex(receipt['transactionHash'])}")
+
+        if receipt is None:
+            status = 'dropped'
+        else:
+            status = 'confirmed' if receipt['status'] == 1 else 'reverted'
+
+        try:
+            # 条件更新抢占，多实例 / 重复轮询时只处理一次
+            claimed = db.session.execute(
+                update(TrackedTransaction)
+                .where(TrackedTransaction.id == tracked.id, TrackedTransaction.status == 'pending')
+                .values(
+                    status=status,
+                    block_number=receipt['blockNumber'] if receipt is not None else None,
+                    resolved_at=datetime.utcnow()
+                )
+            ).rowcount
+            if not claimed:
+                db.session.rollback()
+                return
+            after_commit = handler(tracked.entity_ids, receipt)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            print(f"[{datetime.now()}] Receipt handler {tracked.kind} failed for {tracked.tx_hash}:")
+            traceback.print_exc()
+            return
+
+        print(f"[{tracked.kind}] {tracked.tx_hash} {status}, {len(tracked.entity_ids)} records updated")
+        if after_commit is not None:
+            try:
+                after_commit()
+            except Exception:
+                traceback.print_exc()
+
+    def _replace_all(self, stale):
+        with self.app.app_context():
+            for tracked in stale:
+                try:
+                    self._replace(tracked)
+                except Exception:
+                    db.session.rollback()
+                    print(f"[{datetime.now()}] Replacing {tracked.tx_hash} (nonce {tracked.nonce}) failed:")
+                    traceback.print_exc()
+
+    def _replace(self, tracked):
+        """同 nonce 加价替换：先登记新哈希并提交，再广播（避免替换交易上链却未登记而被判定为 dropped）"""
+        account = self.signers.get(tracked.sender)
+        if tracked.tx is None or account is None or tracked.bumps >= self.max_bumps:
+            return
+
+        w3 = get_w3()
+        tx = dict(tracked.tx)
+        tx['maxFeePerGas'], tx['maxPriorityFeePerGas'] = replacement_fees(w3, tx, self.bump_ratio)
+        signed = account.sign_transaction(tx)
+        tx_hash = w3.to_hex(signed.hash)
+
+        # 条件更新：多实例时同一次加价只执行一次
+        claimed = db.session.execute(
+            update(TrackedTransaction)
+            .where(
+                TrackedTransaction.id == tracked.id,
+                TrackedTransaction.status == 'pending',
+                TrackedTransaction.bumps == tracked.bumps
+            )
+            .values(
+                tx=tx,
+                tx_hashes=list(tracked.tx_hashes or [tracked.tx_hash]) + [tx_hash],
+                bumps=tracked.bumps + 1,
+                last_sent_at=datetime.utcnow()
+            )
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            return
+
+        try:
+            w3.eth.send_raw_transaction(signed.raw_transaction)
+        except Exception as e:
+            message = str(e)
+            if 'nonce too low' in message:
+                # 原交易已上链，下一轮查询会拿到回执
+                return
+            if 'already known' not in message:
+                print(f"[{tracked.kind}] replacement nonce={tracked.nonce} failed: {message}")
+                return
+        print(f"[{tracked.kind}] bumped {tracked.tx_hash} nonce={tracked.nonce} "
+              f"({tracked.bumps + 1}/{self.max_bumps}) hash={tx_hash}")
+
+    def _alert_stuck(self, outstanding, resolved_ids, now):
+        """长时间未确认的交易告警一次（需人工处理：提高费用上限 / 补齐 nonce 空洞等）"""
+        pending_ids = set()
+        for t in outstanding:
+            if t.id in resolved_ids:
+                continue
+            pending_ids.add(t.id)
+            if t.id in self._alerted or (now - t.created_at).total_seconds() < self.stuck_alert_after:
+                continue
+            self._alerted.add(t.id)
+            print(f"[ALERT] [{t.kind}] {t.tx_hash} nonce={t.nonce} from {t.sender} unconfirmed for "
+                  f"{int((now - t.created_at).total_seconds())}s after {t.bumps} bumps, "
+                  f"records {t.entity_ids} still waiting")
+        self._alerted &= pending_ids
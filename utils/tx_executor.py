@@ -0,0 +1,254 @@
+import os
+import threading
+from contextlib import contextmanager
+import time
+import traceback
+from dotenv import load_dotenv
+from utils.chain_batch import get_receipts, get_transaction_counts
+
+load_dotenv()
+
+# eth_feeHistory 采样的区块数与小费分位数
+FEE_HISTORY_BLOCKS = int(os.getenv('FEE_HISTORY_BLOCKS', '10'))
+FEE_PRIORITY_PERCENTILE = float(os.getenv('FEE_PRIORITY_PERCENTILE', '50'))
+# 小费下限 / maxFeePerGas 上限（gwei），上限防止 baseFee 异常飙升时无限加价
+MIN_PRIORITY_FEE_GWEI = os.getenv('MIN_PRIORITY_FEE_GWEI', '1')
+MAX_FEE_CAP_GWEI = os.getenv('MAX_FEE_CAP_GWEI', '200')
+# 执行器缓存建议费用的时间（秒）
+FEE_REFRESH_SECONDS = float(os.getenv('FEE_REFRESH_SECONDS', '12'))
+
+
+def suggest_fees(w3):
+    """
+    按 eth_feeHistory 估算 EIP-1559 费用：
+    - 小费取最近 FEE_HISTORY_BLOCKS 个区块分位数小费的中位数，不低于下限
+    - maxFeePerGas = 2 × 下一区块 baseFee + 小费（可承受连续多个满块的 baseFee 上涨），不超过上限
+    :return: (max_fee, priority_fee)，单位 wei
+    """
+    history = w3.eth.fee_history(FEE_HISTORY_BLOCKS, 'latest', [FEE_PRIORITY_PERCENTILE])
+    # baseFeePerGas 比 reward 多一项，最后一项为下一区块的 baseFee
+    next_base_fee = history['baseFeePerGas'][-1]
+    rewards = sorted(reward[0] for reward in (history.get('reward') or []) if reward)
+    priority_fee = max(rewards[len(rewards) // 2] if rewards else 0, w3.to_wei(MIN_PRIORITY_FEE_GWEI, 'gwei'))
+    max_fee = min(2 * next_base_fee + priority_fee, w3.to_wei(MAX_FEE_CAP_GWEI, 'gwei'))
+    return max_fee, min(priority_fee, max_fee)
+
+
+def replacement_fees(w3, tx, bump_ratio):
+    """
+    同 nonce 替换交易的费用：两项都至少按 bump_ratio 提高（EIP-1559 替换要求 >= 10%），
+    当前建议费用更高时直接跟上（一次追上 baseFee 上涨，不必多轮加价）
+    """
+    max_fee, priority_fee = suggest_fees(w3)
+    return (
+        max(int(tx['maxFeePerGas'] * bump_ratio) + 1, max_fee),
+        max(int(tx['maxPriorityFeePerGas'] * bump_ratio) + 1, priority_fee)
+    )
+
+
+class NonceManager:
+    """
+    本地 nonce 计数器（按签名地址），进程内共享一个实例（见 shared_nonce_manager）
+    首次使用时按链上 pending 数初始化，之后本地递增，连续签名广播无需每笔查询链上
+    同一签名地址的 nonce 分配与广播串行执行：广播成功才递增，失败时丢弃本地值，下次从链上重新同步，
+    不会与本进程其他线程（提现 / 空投任务）的发送交错，也不会留下 nonce 空洞
+    """
+
+    def __init__(self, w3):
+        self.w3 = w3
+        self._nonces = {}
+        self._lock = threading.Lock()
+        self._address_locks = {}
+
+    def _address_lock(self, address):
+        with self._lock:
+            return self._address_locks.setdefault(address, threading.Lock())
+
+    @contextmanager
+    def reserve(self, address):
+        """with 块内使用返回的 nonce 签名并广播；块内抛出异常视为未广播"""
+        with self._address_lock(address):
+            nonce = self._nonces.get(address)
+            if nonce is None:
+                nonce = self.w3.eth.get_transaction_count(address, 'pending')
+            try:
+                yield nonce
+            except Exception:
+                # 可能已被节点接受（超时）或被其他进程占用，下次从链上重新同步
+                self._nonces.pop(address, None)
+                raise
+            self._nonces[address] = nonce + 1
+
+    def prime(self, addresses):
+        """一次批量请求初始化多个签名地址的 nonce"""
+        with self._lock:
+            missing = [a for a in addresses if a not in self._nonces]
+        if missing:
+            counts = get_transaction_counts(missing, 'pending')
+            with self._lock:
+                for address, count in counts.items():
+                    self._nonces.setdefault(address, count)
+
+
+_shared_nonces = None
+_shared_nonces_lock = threading.Lock()
+
+
+def shared_nonce_manager(w3):
+    """进程内共享的 nonce 计数器：各定时任务 / 执行器使用同一签名私钥时不会分配到相同 nonce"""
+    global _shared_nonces
+    if _shared_nonces is None:
+        with _shared_nonces_lock:
+            if _shared_nonces is None:
+                _shared_nonces = NonceManager(w3)
+    return _shared_nonces
+
+
+class PendingTx:
+    def __init__(self, account, tx, tx_hash, label=None):
+        self.account = account
+        self.tx = tx
+        self.tx_hashes = [tx_hash]  # 含加价替换后的所有哈希，任一上链即视为完成
+        self.label = label
+        self.sent_at = time.monotonic()
+        self.bumps = 0
+        self.receipt = None
+        # 已登记到回执追踪服务：替换只能由追踪服务执行，否则新哈希不会记入 TrackedTransaction
+        self.tracked = False
+
+    @property
+    def nonce(self):
+        return self.tx['nonce']
+
+    @property
+    def succeeded(self):
+        return self.receipt is not None and self.receipt['status'] == 1
+
+
+class PipelinedTxExecutor:
+    """
+    流水线交易执行器：
+    1. send() 估算 gas、分配本地 nonce、签名并立即广播，不等待回执
+    2. wait_all() 每轮用一次批量请求查询所有未确认交易的回执；超过 bump_after 秒未上链的同 nonce 加价替换
+       （已登记到回执追踪服务的交易只查询不替换）
+    未指定费用时按 eth_feeHistory 建议费用发送（缓存 FEE_REFRESH_SECONDS 秒）
+    只广播不等待的交易由回执追踪服务按同样的策略加价替换（见 utils.receipt_tracker）
+    """
+
+    def __init__(self, w3, max_fee_gwei=None, priority_fee_gwei=None, gas_buffer=10000,
+                 bump_after=60, bump_ratio=1.125, max_bumps=3, nonces=None):
+        self.w3 = w3
+        self.nonces = nonces or shared_nonce_manager(w3)
+        self.fixed_fees = None
+        if max_fee_gwei is not None and priority_fee_gwei is not None:
+            self.fixed_fees = (w3.to_wei(max_fee_gwei, 'gwei'), w3.to_wei(priority_fee_gwei, 'gwei'))
+        self.gas_buffer = gas_buffer
+        self.bump_after = bump_after
+        self.bump_ratio = bump_ratio
+        self.max_bumps = max_bumps
+        self._fees = None
+        self._fees_at = 0.0
+        self._fees_lock = threading.Lock()
+
+    def fees(self):
+        """(max_fee, priority_fee)：固定费用或缓存的建议费用"""
+        if self.fixed_fees is not None:
+            return self.fixed_fees
+        with self._fees_lock:
+            if self._fees is None or time.monotonic() - self._fees_at >= FEE_REFRESH_SECONDS:
+                self._fees = suggest_fees(self.w3)
+                self._fees_at = time.monotonic()
+            return self._fees
+
+    def send(self, account, contract_fn, label=None, gas_estimate=None):
+        if gas_estimate is None:
+            gas_estimate = contract_fn.estimate_gas({'from': account.address})
+        max_fee, priority_fee = self.fees()
+        with self.nonces.reserve(account.address) as nonce:
+            tx = contract_fn.build_transaction({
+                'from': account.address,
+                'nonce': nonce,
+                'gas': gas_estimate + self.gas_buffer,
+                'maxFeePerGas': max_fee,
+                'maxPriorityFeePerGas': priority_fee,
+            })
+            tx_hash = self._broadcast(account, tx)
+        print(f"[{label or 'tx'}] sent nonce={nonce} hash={self.w3.to_hex(tx_hash)}")
+        return PendingTx(account, tx, tx_hash, label)
+
+    def wait_all(self, pending, timeout=600, poll_interval=2):
+        """
+        等待全部交易确认（或超时），返回与 pending 顺序一致的回执列表（未确认为 None）
+        """
+        outstanding = [p for p in pending if p.receipt is None]
+        deadline = time.monotonic() + timeout
+
+        while outstanding and time.monotonic() < deadline:
+            receipts = self._poll(outstanding)
+            still_pending = []
+            for p in outstanding:
+                receipt = receipts.get(id(p))
+                if receipt is not None:
+                    p.receipt = receipt
+                    status = 'confirmed' if receipt['status'] == 1 else 'reverted'
+                    print(f"[{p.label or 'tx'}] nonce={p.nonce} {status} in block {receipt['blockNumber']}")
+                else:
+                    still_pending.append(p)
+            outstanding = still_pending
+
+            now = time.monotonic()
+            for p in outstanding:
+                if not p.tracked and now - p.sent_at >= self.bump_after and p.bumps < self.max_bumps:
+                    self._bump(p)
+
+            if outstanding:
+                time.sleep(poll_interval)
+
+        for p in outstanding:
+            print(f"[{p.label or 'tx'}] nonce={p.nonce} not confirmed within {timeout}s")
+        return [p.receipt for p in pending]
+
+    def _broadcast(self, account, tx):
+        signed = account.sign_transaction(tx)
+        try:
+            return self.w3.eth.send_raw_transaction(signed.raw_transaction)
+        except Exception as e:
+            if 'already known' in str(e):
+                # 已在交易池中，按已广播处理
+                return signed.hash
+            raise
+
+    def _poll(self, outstanding):
+        """一次批量请求查询全部候选哈希（含加价替换），任一上链即为该交易的回执"""
+        candidates = [(p, tx_hash) for p in outstanding for tx_hash in p.tx_hashes]
+        receipts = {}
+        try:
+            results = get_receipts([tx_hash for _, tx_hash in candidates])
+        except Exception as e:
+            print(f"Receipt polling failed: {e}")
+            return receipts
+        for (p, _), receipt in zip(candidates, results):
+            if receipt is not None:
+                receipts.setdefault(id(p), receipt)
+        return receipts
+
+    def _bump(self, p):
+        """同 nonce 加价替换（EIP-1559 要求两项费用都至少提高 10%）"""
+        tx = dict(p.tx)
+        try:
+            tx['maxFeePerGas'], tx['maxPriorityFeePerGas'] = replacement_fees(self.w3, tx, self.bump_ratio)
+            tx_hash = self._broadcast(p.account, tx)
+        except Exception as e:
+            message = str(e)
+            if 'nonce too low' in message:
+                # 原交易已上链，下一轮轮询会拿到回执
+                return
+            print(f"[{p.label or 'tx'}] bump nonce={p.nonce} failed: {message}")
+            traceback.print_exc()
+            p.sent_at = time.monotonic()
+            return
+        p.tx = tx
+        p.tx_hashes.append(tx_hash)
+        p.bumps += 1
+        p.sent_at = time.monotonic()
+        print(f"[{p.label or 'tx'}] bumped nonce={p.nonce} ({p.bumps}/{self.max_bumps}) hash={self.w3.to_hex(tx_hash)}")
@@ -1,9 +1,11 @@
 # utils/tx_jobs.py
 import os
-import json
 import requests
 import logging
 from web3 import Web3
+from utils.chain_client import get_w3, get_contract, get_account
+from utils.receipt_tracker import receipt_handler, track_transaction
+from utils.tx_executor import suggest_fees
 from extensions import db
 from models import PayPalOrder, DeployStatusEnum, TransactionJob, JobStatusEnum
 
@@ -24,19 +26,13 @@ file_handler.setFormatter(console_formatter)
 logger.addHandler(file_handler)
 
 # ----------------- Web3 初始化 -----------------
-WEB3_PROVIDER = os.getenv('WEB3_PROVIDER')
 FACTORY_CONTRACT_ADDRESS = Web3.to_checksum_address(os.getenv('FACTORY_ADDRESS'))
 PLATFORM_WALLET = Web3.to_checksum_address(os.getenv("DEV_WALLET_ADDRESS"))
 PLATFORM_PRIVATE_KEY = os.getenv("DEV_PRIVATE_KEY")
 
-w3 = Web3(Web3.HTTPProvider(WEB3_PROVIDER))
-
-# 读取 TokenFactory ABI
-with open(os.path.join(os.path.dirname(__file__), '..', 'abis', 'TokenFactory.json'), 'r') as f:
-    full_json = json.load(f)
-FACTORY_ABI = full_json['abi']
-
-factory_contract = w3.eth.contract(address=FACTORY_CONTRACT_ADDRESS, abi=FACTORY_ABI)
+# 共享连接池的 Web3 实例与缓存的合约对象
+w3 = get_w3()
+factory_contract = get_contract(FACTORY_CONTRACT_ADDRESS, 'TokenFactory.json')
 
 # ----------------- 主服务接口 -----------------
 MAIN_SERVER_URL = os.getenv("MAIN_SERVER_URL")
@@ -60,6 +56,7 @@ def notify_deploy_complete(order_id, data):
 def deploy_contract(order_id, wallet_address, job_id=None):
     """
     异步部署合约任务，支持独立容器和 HTTP 通知前端
+    只负责签名广播，确认结果由回执追踪服务回调 on_deploy_receipt
     """
     from app import create_app
     app = create_app()
@@ -94,15 +91,14 @@ def deploy_contract(order_id, wallet_address, job_id=None):
             db.session.commit()
             logger.info(f"[deploy_contract] 订单 {order_id} 开始部署")
 
-            nonce = w3.eth.get_transaction_count(PLATFORM_WALLET)
+            # pending：排在本账户尚未上链的交易之后，而不是与其争用同一 nonce
+            nonce = w3.eth.get_transaction_count(PLATFORM_WALLET, "pending")
             gas_estimate = factory_contract.functions.platformDeploy(
                 order.token_name, order.symbol, order.supply, wallet_address
             ).estimate_gas({"from": PLATFORM_WALLET})
 
-            latest_block = w3.eth.get_block("latest")
-            base_fee = latest_block.get("baseFeePerGas", 0)
-            priority_fee = w3.to_wei("2", "gwei")
-            max_fee_per_gas = base_fee + priority_fee
+            # 按 eth_feeHistory 定价（maxFee 预留 baseFee 上涨空间），长时间未确认由回执追踪服务加价替换
+            max_fee_per_gas, priority_fee = suggest_fees(w3)
 
             tx = factory_contract.functions.platformDeploy(
                 order.token_name, order.symbol, order.supply, wallet_address
@@ -114,46 +110,16 @@ def deploy_contract(order_id, wallet_address, job_id=None):
                 "maxPriorityFeePerGas": priority_fee,
             })
 
-            signed_tx = w3.eth.account.sign_transaction(tx, private_key=PLATFORM_PRIVATE_KEY)
+            signed_tx = get_account(PLATFORM_PRIVATE_KEY).sign_transaction(tx)
             tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
             logger.info(f"[deploy_contract] 订单 {order_id} 交易已发送: {tx_hash.hex()}")
 
+            # 登记到回执追踪服务后立即返回，不占用 worker 等待确认
             job.status = JobStatusEnum.sent
             job.tx_hash = tx_hash.hex()
+            track_transaction(tx_hash, 'token_deploy', [job.id], PLATFORM_WALLET, tx)
             db.session.commit()
-
-            receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-            logger.info(f"[deploy_contract] 订单 {order_id} 交易已确认，区块: {receipt.blockNumber}")
-
-            token_address = None
-            for log in factory_contract.events.TokenCreated().process_receipt(receipt):
-                token_address = log["args"]["tokenAddress"]
-                break
-
-            if token_address:
-                order.contract_address = token_address
-                order.deploy_status = DeployStatusEnum.success
-                order.minted = True
-                job.status = JobStatusEnum.success
-                db.session.commit()
-                notify_deploy_complete(order_id, {
-                    "deploy_status": "success",
-                    "token_address": token_address,
-                    "wallet_address": wallet_address,
-                    "tx_hash": tx_hash.hex()
-                })
-                logger.info(f"[deploy_contract] 订单 {order_id} 部署成功，Token 地址: {token_address}")
-            else:
-                order.deploy_status = DeployStatusEnum.failed
-                job.status = JobStatusEnum.failed
-                job.error_message = "未找到 Token 地址，请检查合约事件"
-                db.session.commit()
-                notify_deploy_complete(order_id, {
-                    "deploy_status": "failed",
-                    "error": "未找到 Token 地址，请检查合约事件",
-                    "wallet_address": wallet_address
-                })
-                logger.error(f"[deploy_contract] 订单 {order_id} 部署失败：未找到 Token 地址")
+            logger.info(f"[deploy_contract] 订单 {order_id} 已登记回执追踪，Job {job.id}")
 
         except Exception as e:
             error_msg = str(e)
@@ -168,3 +134,53 @@ def deploy_contract(order_id, wallet_address, job_id=None):
                 "error": error_msg,
                 "wallet_address": wallet_address
             })
+
+
+@receipt_handler('token_deploy')
+def on_deploy_receipt(job_ids, receipt):
+    """
+    部署交易回执：解析 TokenCreated 事件更新订单与 Job，提交后通知主服务
+    """
+    job = db.session.get(TransactionJob, job_ids[0])
+    order = job.order
+    order_id, wallet_address, tx_hash = order.order_id, job.wallet_address, job.tx_hash
+
+    if receipt is not None:
+        # 可能是加价替换后的哈希上链
+        tx_hash = job.tx_hash = Web3.to_hex(receipt["transactionHash"])
+
+    token_address = None
+    if receipt is not None and receipt["status"] == 1:
+        logger.info(f"[deploy_contract] 订单 {order_id} 交易已确认，区块: {receipt['blockNumber']}")
+        for log in factory_contract.events.TokenCreated().process_receipt(receipt):
+            token_address = log["args"]["tokenAddress"]
+            break
+
+    if token_address:
+        order.contract_address = token_address
+        order.deploy_status = DeployStatusEnum.success
+        order.minted = True
+        job.status = JobStatusEnum.success
+        logger.info(f"[deploy_contract] 订单 {order_id} 部署成功，Token 地址: {token_address}")
+        return lambda: notify_deploy_complete(order_id, {
+            "deploy_status": "success",
+            "token_address": token_address,
+            "wallet_address": wallet_address,
+            "tx_hash": tx_hash
+        })
+
+    if receipt is None:
+        error_msg = "交易已被同 nonce 交易替换，未上链"
+    elif receipt["status"] != 1:
+        error_msg = "部署交易执行失败（reverted）"
+    else:
+        error_msg = "未找到 Token 地址，请检查合约事件"
+    order.deploy_status = DeployStatusEnum.failed
+    job.status = JobStatusEnum.failed
+    job.error_message = error_msg
+    logger.error(f"[deploy_contract] 订单 {order_id} 部署失败：{error_msg}")
+    return lambda: notify_deploy_complete(order_id, {
+        "deploy_status": "failed",
+        "error": error_msg,
+        "wallet_address": wallet_address
+    })
@@ -1,25 +1,19 @@
 # utils/tx_jobs.py
 import os
-import json
 import requests
 from web3 import Web3
+from utils.chain_client import get_w3, get_contract, get_account
 from extensions import db
 from models import PayPalOrder, DeployStatusEnum
 
 # ----------------- Web3 初始化 -----------------
-WEB3_PROVIDER = os.getenv('WEB3_PROVIDER')
 FACTORY_CONTRACT_ADDRESS = Web3.to_checksum_address(os.getenv('FACTORY_ADDRESS'))
 PLATFORM_WALLET = Web3.to_checksum_address(os.getenv("DEV_WALLET_ADDRESS"))
 PLATFORM_PRIVATE_KEY = os.getenv("DEV_PRIVATE_KEY")
 
-w3 = Web3(Web3.HTTPProvider(WEB3_PROVIDER))
-
-# 读取 TokenFactory ABI
-with open(os.path.join(os.path.dirname(__file__), '..', 'abis', 'TokenFactory.json'), 'r') as f:
-    full_json = json.load(f)
-FACTORY_ABI = full_json['abi']
-
-factory_contract = w3.eth.contract(address=FACTORY_CONTRACT_ADDRESS, abi=FACTORY_ABI)
+# 共享连接池的 Web3 实例与缓存的合约对象
+w3 = get_w3()
+factory_contract = get_contract(FACTORY_CONTRACT_ADDRESS, 'TokenFactory.json')
 
 # ----------------- 主服务接口 -----------------
 MAIN_SERVER_URL = os.getenv("MAIN_SERVER_URL")  # e.g., http://localhost:5000
@@ -92,7 +86,7 @@ def deploy_contract(order_id, wallet_address, job_id=None):
             })
 
             # 签名并发送
-            signed_tx = w3.eth.account.sign_transaction(tx, private_key=PLATFORM_PRIVATE_KEY)
+            signed_tx = get_account(PLATFORM_PRIVATE_KEY).sign_transaction(tx)
             tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
             print(f"[deploy_contract] 订单 {order_id} 交易已发送: {tx_hash.hex()}")
 
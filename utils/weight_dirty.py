@@ -0,0 +1,29 @@
+from flask import current_app
+from extensions import redis_conn
+
+# 权重可能发生变化的用户（wallet_user_id 集合），由增量任务消费
+WEIGHT_DIRTY_KEY = 'weight:dirty'
+
+
+def mark_weight_dirty(*wallet_user_ids):
+    """
+    积分 / 连续签到 / 邀请数变化后调用（事务提交之后）
+    写入失败只记录日志，由定期全量对账兜底
+    """
+    ids = [uid for uid in wallet_user_ids if uid is not None]
+    if not ids:
+        return
+    try:
+        redis_conn.sadd(WEIGHT_DIRTY_KEY, *ids)
+    except Exception as e:
+        current_app.logger.warning(f"Failed to mark weight dirty for {len(ids)} users: {e}")
+
+
+def pop_dirty_users(count):
+    """取出一批脏用户 id（处理失败时需调用 restore_dirty_users 放回）"""
+    return [int(uid) for uid in (redis_conn.spop(WEIGHT_DIRTY_KEY, count) or [])]
+
+
+def restore_dirty_users(wallet_user_ids):
+    if wallet_user_ids:
+        redis_conn.sadd(WEIGHT_DIRTY_KEY, *wallet_user_ids)
@@ -1,5 +1,17 @@
+import os
+import threading
 from app import create_app
 from extensions import socketio
+from utils.airdrop_membership import ensure_membership
 
 app = create_app()
 socketio.init_app(app, cors_allowed_origins="*", async_mode="gevent")
+
+# 空投地址成员缓存缺失时后台预热（多 worker 经 Redis 锁只预热一次，预热完成前查询回退数据库）
+threading.Thread(target=ensure_membership, args=(app,), daemon=True).start()
+
+# 可选：在 Web 进程内运行调度器（多 worker / 多副本经 Redis 选主，只有 leader 执行任务）
+# 默认由独立的 scheduler 容器运行：python -m scheduler
+if os.getenv('SCHEDULER_IN_WEB', 'False') == 'True':
+    from scheduler import start_scheduler
+    start_scheduler(app)